@@ -0,0 +1,188 @@
+import asyncio
+import time
+
+TRUST_NETWORK_VERSION_KEY = "trust_network_version"
+POLICY_CHANNEL = "policy_updates"
+
+
+class TrustSet:
+    """
+    In-memory copy of the trust_network table used for WoT admission.
+
+    Pubkeys are stored as 32 byte keys in a frozenset, so a membership test is
+    an O(1) lookup with no database connection. wot_builder.py bumps a version
+    counter in Redis after every rebuild; the refresh loop polls that counter
+    and swaps in a freshly loaded set whenever it changes, or when the copy is
+    older than max_age in case a notification was missed.
+
+    Until a load succeeds the set is not ready: admission fails closed with
+    an explicit error, and loading is retried every retry_interval seconds.
+
+    Attributes:
+        redis_client: Async Redis client holding the version counter.
+        refresh_interval (float): Seconds between version checks.
+        max_age (float): Seconds after which the set is reloaded regardless of the version.
+        retry_interval (float): Seconds between load attempts until one succeeds.
+        pubkeys (frozenset): Trusted pubkeys as raw bytes.
+        version: Version counter value of the loaded set.
+
+    Methods:
+        ready: Whether the trust network has been loaded.
+        load: Loads trust_network into memory.
+        refresh_loop: Reloads the set whenever the version counter changes.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        logger,
+        refresh_interval: float = 30,
+        max_age: float = 900,
+        retry_interval: float = 5,
+    ) -> None:
+        self.redis_client = redis_client
+        self.logger = logger
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        self.pubkeys = frozenset()
+        self.version = None
+        self.loaded_at = 0.0
+
+    def __contains__(self, pubkey: str) -> bool:
+        try:
+            return bytes.fromhex(pubkey) in self.pubkeys
+        except (ValueError, TypeError):
+            return False
+
+    def __len__(self) -> int:
+        return len(self.pubkeys)
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at > 0
+
+    async def load(self, pool) -> None:
+        version = await self.redis_client.get(TRUST_NETWORK_VERSION_KEY)
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT pubkey FROM trust_network;")
+                rows = await cur.fetchall()
+
+        pubkeys = set()
+        for (pubkey,) in rows:
+            try:
+                pubkeys.add(bytes.fromhex(pubkey))
+            except (ValueError, TypeError):
+                self.logger.warning(f"Skipping malformed trust network pubkey {pubkey}")
+        self.pubkeys = frozenset(pubkeys)
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.logger.info(
+            f"Loaded {len(self.pubkeys)} trusted pubkeys (version {version})"
+        )
+
+    async def refresh_loop(self, pool) -> None:
+        while True:
+            await asyncio.sleep(
+                self.refresh_interval if self.ready else self.retry_interval
+            )
+            try:
+                if not self.ready:
+                    await self.load(pool)
+                    continue
+                version = await self.redis_client.get(TRUST_NETWORK_VERSION_KEY)
+                stale = time.monotonic() - self.loaded_at > self.max_age
+                if version != self.version or stale:
+                    await self.load(pool)
+            except Exception as exc:
+                if self.ready:
+                    self.logger.error(f"Failed to refresh trust network: {exc}")
+                else:
+                    self.logger.error(
+                        f"Trust network still not loaded, rejecting every event "
+                        f"until it is: {exc}"
+                    )
+
+
+class PolicyCache:
+    """
+    In-memory copy of the allowlist table used for ban and kind admission checks.
+
+    Ban/allow events signed by ADMIN_PUBKEY are applied by
+    Event.parse_mgmt_event, which publishes on POLICY_CHANNEL, and each event
+    handler replica reloads its copy as soon as the message arrives. The copy is also reloaded after (re)subscribing and
+    whenever it is older than max_age, so a dropped Redis connection cannot
+    leave a replica with a stale policy for long.
+
+    Attributes:
+        redis_client: Async Redis client used for the pub/sub subscription.
+        max_age (float): Seconds after which the policy is reloaded without a notification.
+        banned_pubkeys (frozenset): Pubkeys with allowed = false.
+        kind_policy (dict): Kind to allowed flag for every kind in the allowlist.
+
+    Methods:
+        load: Loads the allowlist into memory.
+        listen: Reloads the policy whenever a POLICY_CHANNEL message arrives.
+        check: Returns a rejection message for an event, or None if it is admitted.
+    """
+
+    def __init__(
+        self, redis_client, logger, max_age: float = 300, retry_interval: float = 1
+    ) -> None:
+        self.redis_client = redis_client
+        self.logger = logger
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        self.banned_pubkeys = frozenset()
+        self.kind_policy = {}
+        self.loaded_at = 0.0
+
+    async def load(self, pool) -> None:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT client_pub, kind, allowed FROM allowlist;")
+                rows = await cur.fetchall()
+
+        banned_pubkeys = set()
+        kind_policy = {}
+        for client_pub, kind, allowed in rows:
+            if client_pub is not None and not allowed:
+                banned_pubkeys.add(client_pub)
+            if kind is not None:
+                kind_policy[kind] = bool(allowed)
+        self.banned_pubkeys = frozenset(banned_pubkeys)
+        self.kind_policy = kind_policy
+        self.loaded_at = time.monotonic()
+        self.logger.info(
+            f"Loaded relay policy: {len(self.banned_pubkeys)} banned pubkeys, "
+            f"{len(self.kind_policy)} kind rules"
+        )
+
+    async def listen(self, pool) -> None:
+        while True:
+            try:
+                async with self.redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(POLICY_CHANNEL)
+                    await self.load(pool)
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=1.0
+                        )
+                        if message and message["type"] == "message":
+                            self.logger.debug(f"Policy update received: {message}")
+                            await self.load(pool)
+                        elif time.monotonic() - self.loaded_at > self.max_age:
+                            await self.load(pool)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.logger.error(f"Policy listener error: {exc}")
+                await asyncio.sleep(self.retry_interval)
+
+    def check(self, pubkey: str, kind: int):
+        if pubkey in self.banned_pubkeys:
+            return "blocked: pubkey is banned from this relay"
+        if self.kind_policy.get(kind) is False:
+            return f"blocked: kind {kind} is not allowed on this relay"
+        return None
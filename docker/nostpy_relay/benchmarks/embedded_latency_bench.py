@@ -0,0 +1,114 @@
+"""
+Compares EVENT and REQ round trip latency of a split and an embedded relay.
+
+Usage:
+    python embedded_latency_bench.py --split ws://127.0.0.1:8008 --embedded ws://127.0.0.1:8009
+
+Point each URL at a relay with the same data set, one started normally and one
+with NOSTPY_MODE=embedded. EVENT latency is measured up to the OK reply and REQ
+latency up to EOSE, one message at a time so queueing does not hide the hop.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import statistics
+import time
+import uuid
+
+import orjson
+import secp256k1
+import websockets
+
+
+def make_event(private_key: secp256k1.PrivateKey, pubkey: str, i: int) -> dict:
+    created_at = int(time.time())
+    content = f"embedded bench {uuid.uuid4()} {i}"
+    serialized = orjson.dumps([0, pubkey, created_at, 1, [], content])
+    event_id = hashlib.sha256(serialized).digest()
+    return {
+        "id": event_id.hex(),
+        "pubkey": pubkey,
+        "kind": 1,
+        "created_at": created_at,
+        "tags": [],
+        "content": content,
+        "sig": private_key.schnorr_sign(event_id, None, raw=True).hex(),
+    }
+
+
+async def time_events(websocket, events) -> list:
+    latencies = []
+    for event in events:
+        start = time.perf_counter()
+        await websocket.send(orjson.dumps(["EVENT", event]))
+        while True:
+            reply = orjson.loads(await websocket.recv())
+            if reply[0] == "OK" and reply[1] == event["id"]:
+                break
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def time_reqs(websocket, pubkey: str, count: int, limit: int) -> list:
+    latencies = []
+    for i in range(count):
+        subscription_id = f"bench-{i}"
+        start = time.perf_counter()
+        await websocket.send(
+            orjson.dumps(
+                ["REQ", subscription_id, {"authors": [pubkey], "limit": limit}]
+            )
+        )
+        while True:
+            reply = orjson.loads(await websocket.recv())
+            if reply[0] == "EOSE" and reply[1] == subscription_id:
+                break
+        latencies.append(time.perf_counter() - start)
+        await websocket.send(orjson.dumps(["CLOSE", subscription_id]))
+    return latencies
+
+
+def summarize(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "mean": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def bench(url: str, args) -> dict:
+    private_key = secp256k1.PrivateKey()
+    pubkey = private_key.pubkey.serialize()[1:].hex()
+    events = [make_event(private_key, pubkey, i) for i in range(args.events)]
+    async with websockets.connect(url, max_size=None) as websocket:
+        event_latencies = await time_events(websocket, events)
+        req_latencies = await time_reqs(websocket, pubkey, args.reqs, args.limit)
+    return {"EVENT": summarize(event_latencies), "REQ": summarize(req_latencies)}
+
+
+async def main(args) -> None:
+    results = {
+        "split": await bench(args.split, args),
+        "embedded": await bench(args.embedded, args),
+    }
+    print(f"{'':>8} {'':>9} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for verb in ("EVENT", "REQ"):
+        for mode, result in results.items():
+            stats = result[verb]
+            print(
+                f"{verb:>8} {mode:>9} {stats['p50']:9.2f} {stats['p99']:9.2f} {stats['mean']:9.2f}"
+            )
+        saved = results["split"][verb]["p50"] - results["embedded"][verb]["p50"]
+        print(f"{verb:>8} {'saved':>9} {saved:9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--split", required=True, help="URL of the split relay")
+    parser.add_argument("--embedded", required=True, help="URL of the embedded relay")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--reqs", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
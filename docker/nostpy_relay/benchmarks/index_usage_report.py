@@ -0,0 +1,137 @@
+"""
+Replays captured REQ filters and reports the access path each one used.
+
+Usage:
+    PGHOST_READ=... PGUSER_READ=... python index_usage_report.py corpus.jsonl [--analyze]
+
+The corpus is read line by line and can be either:
+  * JSON lines holding a filter object, a list of filters, or a full
+    ["REQ", <subscription_id>, <filter>, ...] message, or
+  * websocket handler logs, using the filters from the
+    "Stored subscription: <id> with event <filters>" lines.
+
+Every filter is compiled with Subscription.compile_filter and explained. The
+report lists the indexes and scan types of each plan, then a summary of how
+many filters used each index and how many fell back to a sequential scan.
+"""
+
+import argparse
+import ast
+import os
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterator, List
+
+import orjson
+import psycopg
+
+sys.path.insert(0, "../")
+from event_classes import Subscription  # noqa: E402
+
+LOG_MARKER = " with event "
+
+
+def get_conn_str() -> str:
+    return (
+        f"dbname={os.getenv('PGDATABASE_READ')} "
+        f"user={os.getenv('PGUSER_READ')} "
+        f"password={os.getenv('PGPASSWORD_READ')} "
+        f"host={os.getenv('PGHOST_READ')} "
+        f"port={os.getenv('PGPORT_READ')} "
+    )
+
+
+def read_filters(path: str) -> Iterator[Dict]:
+    with open(path) as corpus:
+        for line in corpus:
+            line = line.strip()
+            if not line:
+                continue
+            if "Stored subscription:" in line and LOG_MARKER in line:
+                parsed = ast.literal_eval(line.split(LOG_MARKER, 1)[1])
+            else:
+                parsed = orjson.loads(line)
+            if isinstance(parsed, dict):
+                yield parsed
+                continue
+            if parsed and parsed[0] == "REQ":
+                parsed = parsed[2:]
+            for filter_ in parsed:
+                if isinstance(filter_, dict):
+                    yield filter_
+
+
+def plan_nodes(plan: Dict) -> Iterator[Dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def access_paths(plan: Dict) -> List[str]:
+    paths = []
+    for node in plan_nodes(plan):
+        node_type = node["Node Type"]
+        if "Index Name" in node:
+            paths.append(f"{node_type} using {node['Index Name']}")
+        elif node_type == "Seq Scan":
+            paths.append(f"Seq Scan on {node['Relation Name']}")
+        elif node_type == "Sort":
+            paths.append("Sort")
+    return paths
+
+
+def main(args) -> None:
+    subscription = Subscription({"event_dict": [], "subscription_id": "report"})
+    index_usage = Counter()
+    seq_scans = 0
+    sorts = 0
+    total = 0
+    explain = (
+        "EXPLAIN (ANALYZE, FORMAT JSON)" if args.analyze else "EXPLAIN (FORMAT JSON)"
+    )
+
+    with psycopg.connect(get_conn_str(), autocommit=True) as conn:
+        with conn.cursor() as cur:
+            for filter_ in read_filters(args.corpus):
+                try:
+                    sql_query, params = subscription.compile_filter(filter_)
+                except (ValueError, AttributeError) as exc:
+                    print(f"skipped {orjson.dumps(filter_).decode()}: {exc}")
+                    continue
+                start = time.perf_counter()
+                cur.execute(f"{explain} {sql_query}", params)
+                elapsed = (time.perf_counter() - start) * 1000
+                plan = cur.fetchone()[0][0]["Plan"]
+                paths = access_paths(plan)
+
+                total += 1
+                for path in paths:
+                    if " using " in path:
+                        index_usage[path.split(" using ", 1)[1]] += 1
+                if any(path == "Seq Scan on events" for path in paths):
+                    seq_scans += 1
+                if "Sort" in paths:
+                    sorts += 1
+                timing = f" {elapsed:8.2f} ms" if args.analyze else ""
+                print(
+                    f"{orjson.dumps(filter_).decode()[:100]:<100}{timing}  "
+                    f"{', '.join(paths) or plan['Node Type']}"
+                )
+
+    print(f"\n{total} filters replayed")
+    for index_name, count in index_usage.most_common():
+        print(f"{count:8} {index_name}")
+    print(f"{seq_scans:8} sequential scans on events")
+    print(f"{sorts:8} explicit sorts")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("corpus", help="File with captured REQ filters")
+    parser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="Run EXPLAIN ANALYZE to also report execution time",
+    )
+    main(parser.parse_args())
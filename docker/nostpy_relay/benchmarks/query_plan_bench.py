@@ -0,0 +1,125 @@
+"""
+Compares REQ queries with inlined values against compiled, prepared queries.
+
+Usage:
+    PGHOST_READ=... PGUSER_READ=... python query_plan_bench.py --queries 2000
+
+Inlined queries have a unique text per REQ, like the old string-built
+queries, so Postgres parses and plans every one of them. Compiled queries
+share one text per filter structure and run as prepared statements. The
+script prints the average planning time reported by EXPLAIN and the wall
+time per query for both.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg
+
+sys.path.insert(0, "../")
+from event_classes import Subscription  # noqa: E402
+
+
+def get_conn_str() -> str:
+    return (
+        f"dbname={os.getenv('PGDATABASE_READ')} "
+        f"user={os.getenv('PGUSER_READ')} "
+        f"password={os.getenv('PGPASSWORD_READ')} "
+        f"host={os.getenv('PGHOST_READ')} "
+        f"port={os.getenv('PGPORT_READ')} "
+    )
+
+
+def sample_filters(conn, count: int):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pubkey FROM events GROUP BY pubkey LIMIT 1000")
+        pubkeys = [row[0] for row in cur.fetchall()] or ["00" * 32]
+    return [
+        {
+            "authors": random.sample(pubkeys, min(len(pubkeys), random.randint(1, 5))),
+            "kinds": random.sample([0, 1, 3, 6, 7, 30023], random.randint(1, 3)),
+            "#p": random.sample(pubkeys, 1),
+            "since": int(time.time()) - random.randint(3600, 86400 * 30),
+            "limit": random.randint(10, 100),
+        }
+        for _ in range(count)
+    ]
+
+
+def planning_ms(cur, sql_query: str) -> float:
+    cur.execute(f"EXPLAIN (SUMMARY ON, FORMAT JSON) {sql_query}")
+    return cur.fetchone()[0][0]["Planning Time"]
+
+
+def run(conn, compiled, inline: bool) -> dict:
+    cur = psycopg.ClientCursor(conn) if inline else conn.cursor()
+    start = time.perf_counter()
+    for sql_query, params in compiled:
+        if inline:
+            cur.execute(cur.mogrify(sql_query, params), prepare=False)
+        else:
+            cur.execute(sql_query, params, prepare=True)
+        cur.fetchall()
+    elapsed = time.perf_counter() - start
+    cur.close()
+
+    # EXPLAIN reports the planning time of each statement; for the prepared
+    # statement Postgres switches to its cached generic plan after a few runs.
+    plans = []
+    with psycopg.ClientCursor(conn) as plan_cur:
+        if not inline:
+            plan_cur.execute(f"PREPARE bench_stmt AS {_numbered(compiled[0][0])}")
+        for sql_query, params in compiled[:200]:
+            if inline:
+                plans.append(planning_ms(plan_cur, plan_cur.mogrify(sql_query, params)))
+            else:
+                placeholders = ", ".join(["%s"] * len(params))
+                plans.append(
+                    planning_ms(
+                        plan_cur,
+                        plan_cur.mogrify(
+                            f"EXECUTE bench_stmt ({placeholders})", params
+                        ),
+                    )
+                )
+        if not inline:
+            plan_cur.execute("DEALLOCATE bench_stmt")
+    return {
+        "per_query_ms": elapsed / len(compiled) * 1000,
+        "planning_ms": statistics.fmean(plans),
+    }
+
+
+def _numbered(sql_query: str) -> str:
+    parts = sql_query.split("%s")
+    return "".join(
+        part + (f"${i + 1}" if i < len(parts) - 1 else "")
+        for i, part in enumerate(parts)
+    )
+
+
+def main(args) -> None:
+    with psycopg.connect(get_conn_str(), autocommit=True) as conn:
+        subscription = Subscription({"event_dict": [], "subscription_id": "bench"})
+        compiled = [
+            subscription.compile_filter(f) for f in sample_filters(conn, args.queries)
+        ]
+        inline = run(conn, compiled, inline=True)
+        prepared = run(conn, compiled, inline=False)
+
+    print(f"{args.queries} queries")
+    print(f"{'':>10} {'plan ms':>10} {'query ms':>10}")
+    for name, result in (("inlined", inline), ("prepared", prepared)):
+        print(
+            f"{name:>10} {result['planning_ms']:10.3f} {result['per_query_ms']:10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=2000)
+    main(parser.parse_args())
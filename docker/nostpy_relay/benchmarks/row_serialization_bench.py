@@ -0,0 +1,141 @@
+"""
+Compares the CPU spent per row turning REQ results into client frames.
+
+Usage:
+    PGHOST_READ=... PGUSER_READ=... python row_serialization_bench.py --rounds 50
+
+Reads the newest 100 and 1000 events of the relay database and times, per
+row, every step from fetching the rows to building the EVENT frames:
+
+  * gathered dicts: columns zipped into dicts by one coroutine per row, the
+    response serialized with orjson, then decoded and re-encoded per frame
+    by the websocket handler, as before results were built as NDJSON,
+  * dict lines: columns zipped into dicts and dumped as NDJSON lines, which
+    process_subscription decoded again for its JSON response,
+  * postgres json: rows serialized by Postgres (RESULT_COLUMNS) and forwarded
+    as bytes, the response and frames assembled around them.
+
+CPU time is the process time of this script, so it excludes the time spent
+by Postgres, which is reported separately as wall time per row.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import orjson
+import psycopg
+
+sys.path.insert(0, "../")
+from event_classes import RESULT_COLUMNS, Subscription  # noqa: E402
+
+ROW_COUNTS = (100, 1000)
+
+
+def get_conn_str() -> str:
+    return (
+        f"dbname={os.getenv('PGDATABASE_READ')} "
+        f"user={os.getenv('PGUSER_READ')} "
+        f"password={os.getenv('PGPASSWORD_READ')} "
+        f"host={os.getenv('PGHOST_READ')} "
+        f"port={os.getenv('PGPORT_READ')} "
+    )
+
+
+def column_query(subscription: Subscription) -> str:
+    columns = ", ".join(subscription.column_names)
+    return f"SELECT {columns} FROM events ORDER BY created_at DESC, id LIMIT %s"
+
+
+def json_query() -> str:
+    return (
+        f"SELECT {RESULT_COLUMNS} FROM (SELECT * FROM events "
+        f"ORDER BY created_at DESC, id LIMIT %s) AS page"
+    )
+
+
+def frames_from_dicts(subscription_id: str, body: bytes) -> list:
+    response = orjson.loads(body)
+    return [
+        orjson.dumps(("EVENT", subscription_id, event)).decode("utf-8")
+        for event in response["results_json"]
+    ]
+
+
+def gathered_dicts(subscription: Subscription, rows) -> list:
+    async def parse(record, parsed):
+        parsed.append(dict(zip(subscription.column_names, record)))
+
+    async def parse_all():
+        parsed = []
+        await asyncio.gather(*(parse(record, parsed) for record in rows))
+        return parsed
+
+    events = asyncio.run(parse_all())
+    response = subscription.sub_response_builder("EVENT", "bench", events, 200)
+    return frames_from_dicts("bench", response.body)
+
+
+def dict_lines(subscription: Subscription, rows) -> list:
+    results = b"".join(
+        orjson.dumps(dict(zip(subscription.column_names, row))) + b"\n" for row in rows
+    )
+    events = [orjson.loads(line) for line in results.splitlines()]
+    response = subscription.sub_response_builder("EVENT", "bench", events, 200)
+    return frames_from_dicts("bench", response.body)
+
+
+def postgres_json(subscription: Subscription, rows) -> list:
+    results = b"".join(row[3].encode() + b"\n" for row in rows)
+    subscription.sub_ndjson_response_builder("EVENT", "bench", results, 200)
+    prefix = b'["EVENT",' + orjson.dumps("bench") + b","
+    return [(prefix + line + b"]").decode("utf-8") for line in results.splitlines()]
+
+
+def run(cur, subscription, sql_query: str, row_count: int, build, rounds: int) -> dict:
+    cpu = wall = 0.0
+    rows = []
+    for _ in range(rounds):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        cur.execute(sql_query, [row_count], prepare=True)
+        rows = cur.fetchall()
+        build(subscription, rows)
+        cpu += time.process_time() - cpu_start
+        wall += time.perf_counter() - wall_start
+    served = max(len(rows), 1) * rounds
+    return {
+        "rows": len(rows),
+        "cpu_us": cpu / served * 1e6,
+        "wall_us": wall / served * 1e6,
+    }
+
+
+def main(args) -> None:
+    subscription = Subscription({"event_dict": [], "subscription_id": "bench"})
+    strategies = (
+        ("gathered dicts", column_query(subscription), gathered_dicts),
+        ("dict lines", column_query(subscription), dict_lines),
+        ("postgres json", json_query(), postgres_json),
+    )
+    with psycopg.connect(get_conn_str(), autocommit=True) as conn:
+        with conn.cursor() as cur:
+            print(f"{'':>16} {'rows':>6} {'cpu us/row':>11} {'wall us/row':>12}")
+            for row_count in ROW_COUNTS:
+                for name, sql_query, build in strategies:
+                    # One untimed round warms the plan cache and the buffers.
+                    run(cur, subscription, sql_query, row_count, build, 1)
+                    result = run(
+                        cur, subscription, sql_query, row_count, build, args.rounds
+                    )
+                    print(
+                        f"{name:>16} {result['rows']:6} "
+                        f"{result['cpu_us']:11.2f} {result['wall_us']:12.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,180 @@
+"""
+Compares NIP-50 search strategies on synthetic notes.
+
+Usage:
+    PGHOST_WRITE=... PGUSER_WRITE=... python search_bench.py --notes 3000000
+
+Creates a scratch table (search_bench_events) with the same generated
+content_tsv column and indexes as events, fills it with random notes drawn
+from a small vocabulary, and times searches with the old LIKE scan, the
+tsvector GIN index, and the tsvector index with the pg_trgm substring
+fallback. The table is dropped afterwards unless --keep is given.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg
+
+sys.path.insert(0, "../")
+from event_classes import Subscription  # noqa: E402
+
+VOCABULARY = (
+    "nostr relay bitcoin lightning zap note client key event filter subscription "
+    "node wallet channel privacy freedom protocol signature schnorr pubkey follow "
+    "mute report repost reaction thread reply community market podcast music art "
+    "photo video meme coffee sunrise mountain ocean city garden book code rust "
+    "python postgres redis index query search cache shard replica latency"
+).split()
+
+
+def get_conn_str() -> str:
+    return (
+        f"dbname={os.getenv('PGDATABASE_WRITE')} "
+        f"user={os.getenv('PGUSER_WRITE')} "
+        f"password={os.getenv('PGPASSWORD_WRITE')} "
+        f"host={os.getenv('PGHOST_WRITE')} "
+        f"port={os.getenv('PGPORT_WRITE')} "
+    )
+
+
+def create_table(conn, notes: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS search_bench_events")
+        cur.execute("""
+            CREATE TABLE search_bench_events (
+                id VARCHAR(255) PRIMARY KEY,
+                pubkey VARCHAR(255),
+                kind INTEGER,
+                created_at INTEGER,
+                tags JSONB,
+                content TEXT,
+                sig VARCHAR(255),
+                content_tsv tsvector GENERATED ALWAYS AS (
+                    to_tsvector('simple', coalesce(content, ''))
+                    || jsonb_to_tsvector(
+                        'simple',
+                        jsonb_path_query_array(
+                            coalesce(tags, '[]'::jsonb), '$[*] ? (@[0] == "t")[1]'
+                        ),
+                        '["string"]'
+                    )
+                ) STORED
+            )
+            """)
+        start = time.perf_counter()
+        cur.execute(
+            """
+            INSERT INTO search_bench_events (id, pubkey, kind, created_at, tags, content, sig)
+            SELECT md5(g::text) || md5((g + 1)::text),
+                   md5((g %% 5000)::text) || md5((g %% 5000 + 1)::text),
+                   1,
+                   1700000000 + g,
+                   jsonb_build_array(
+                       jsonb_build_array('t', %(vocab)s[1 + g %% array_length(%(vocab)s, 1)])
+                   ),
+                   array_to_string(ARRAY(
+                       SELECT %(vocab)s[1 + floor(random() * array_length(%(vocab)s, 1))::int]
+                       FROM generate_series(1, 8 + g %% 24)
+                   ), ' '),
+                   ''
+            FROM generate_series(1, %(notes)s) AS g
+            """,
+            {"vocab": VOCABULARY, "notes": notes},
+        )
+        print(f"Inserted {notes} notes in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        cur.execute("CREATE INDEX ON search_bench_events USING GIN (content_tsv)")
+        cur.execute("CREATE INDEX ON search_bench_events (created_at DESC)")
+        cur.execute("ANALYZE search_bench_events")
+        print(f"Built indexes in {time.perf_counter() - start:.1f}s")
+
+
+def create_trigram_index(conn) -> None:
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cur.execute(
+            "CREATE INDEX search_bench_trgm ON search_bench_events "
+            "USING GIN (content gin_trgm_ops)"
+        )
+    print(f"Built trigram index in {time.perf_counter() - start:.1f}s")
+
+
+def time_queries(conn, queries) -> float:
+    timings = []
+    with conn.cursor() as cur:
+        for sql_query, params in queries:
+            start = time.perf_counter()
+            cur.execute(sql_query, params)
+            cur.fetchall()
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main(args) -> None:
+    subscription = Subscription({"event_dict": [], "subscription_id": "bench"})
+    terms = [
+        " ".join(random.sample(VOCABULARY, random.randint(1, 2)))
+        for _ in range(args.searches)
+    ]
+    like_query = (
+        "SELECT id, pubkey, kind, created_at, tags, content, sig "
+        "FROM search_bench_events WHERE content LIKE %s "
+        "ORDER BY created_at DESC LIMIT %s"
+    )
+
+    with psycopg.connect(get_conn_str(), autocommit=True) as conn:
+        if not args.reuse:
+            create_table(conn, args.notes)
+        # The LIKE baseline is timed without the trigram index, as on a relay
+        # that has not enabled SEARCH_TRIGRAM.
+        conn.execute("DROP INDEX IF EXISTS search_bench_trgm")
+
+        strategies = {
+            "LIKE scan": [(like_query, [f"%{term}%", args.limit]) for term in terms],
+        }
+        for name, trigram in (("tsvector", False), ("tsvector+trgm", True)):
+            compiled = []
+            for term in terms:
+                sql_query, params = subscription.compile_filter(
+                    {"search": term, "limit": args.limit}, search_trigram=trigram
+                )
+                compiled.append(
+                    (
+                        sql_query.replace("FROM events", "FROM search_bench_events"),
+                        params,
+                    )
+                )
+            strategies[name] = compiled
+
+        results = {}
+        for name, queries in strategies.items():
+            if name == "tsvector+trgm":
+                create_trigram_index(conn)
+            results[name] = time_queries(conn, queries)
+
+        print(f"{args.searches} searches, limit {args.limit}")
+        for name, median_ms in results.items():
+            print(f"{name:>14}: {median_ms:9.2f} ms median")
+
+        if not args.keep:
+            conn.execute("DROP TABLE search_bench_events")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=3000000)
+    parser.add_argument("--searches", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch table for reruns"
+    )
+    parser.add_argument(
+        "--reuse", action="store_true", help="Reuse a table kept by --keep"
+    )
+    main(parser.parse_args())
@@ -0,0 +1,100 @@
+"""
+Compares inline schnorr verification with the pooled SignatureVerifier.
+
+Usage:
+    python sig_verify_bench.py --events 5000 --concurrency 500
+
+Run it on the box the event handler is deployed to, the pooled modes only pay
+off when there are spare cores.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import time
+
+import secp256k1
+
+sys.path.insert(0, "../")
+from event_classes import Event  # noqa: E402
+from signature_verifier import SignatureVerifier  # noqa: E402
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.CRITICAL)
+
+
+def make_events(count: int):
+    events = []
+    private_key = secp256k1.PrivateKey()
+    pubkey = private_key.pubkey.serialize()[1:].hex()
+    for i in range(count):
+        event_id = hashlib.sha256(os.urandom(16) + str(i).encode()).digest()
+        sig = private_key.schnorr_sign(event_id, None, raw=True)
+        events.append(
+            Event(
+                event_id=event_id.hex(),
+                pubkey=pubkey,
+                kind=1,
+                created_at=int(time.time()),
+                tags=[],
+                content=f"bench {i}",
+                sig=sig.hex(),
+            )
+        )
+    return events
+
+
+async def run_verifier(verifier, events, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def verify(event_obj):
+        async with semaphore:
+            assert await verifier.verify(event_obj)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(verify(event_obj) for event_obj in events))
+    return time.perf_counter() - start
+
+
+async def main(args) -> None:
+    events = make_events(args.events)
+    print(
+        f"{args.events} events, {os.cpu_count()} cores, concurrency {args.concurrency}"
+    )
+
+    for mode in ("inline", "thread", "process"):
+        verifier = SignatureVerifier(
+            logger,
+            mode=mode,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            window_ms=args.window_ms,
+            cache_size=0 if not args.cached else args.events,
+        )
+        verifier.start()
+        elapsed = await run_verifier(verifier, events, args.concurrency)
+        print(f"{mode:>8}: {args.events / elapsed:10.0f} events/s ({elapsed:.3f}s)")
+        if args.cached:
+            elapsed = await run_verifier(verifier, events, args.concurrency)
+            print(
+                f"{mode + ' dup':>8}: {args.events / elapsed:10.0f} events/s ({elapsed:.3f}s)"
+            )
+        await verifier.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=2)
+    parser.add_argument(
+        "--cached",
+        action="store_true",
+        help="Replay the same events a second time to measure duplicate cache hits",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+
+import psycopg
+
+from event_classes import Event
+
+BATCH_ADDED = "added"
+BATCH_DUPLICATE = "duplicate"
+
+
+class EventBatcher:
+    """
+    Group-commit ingest queue for the events table.
+
+    Concurrent callers submit events and await their individual result, while a
+    single background task gathers whatever arrives within a short window (or
+    until the batch is full) and writes the whole batch with one multi-row
+    INSERT in one transaction.
+
+    Attributes:
+        pool: Async connection pool used for the writes.
+        window (float): Seconds to keep gathering after the first event of a batch arrives.
+        max_batch (int): Maximum number of events written per transaction.
+        on_flush (Callable): Optional callback receiving (batch_size, flush_seconds) after each flush.
+
+    Methods:
+        start: Starts the background flush task.
+        stop: Flushes everything still queued and stops the background task.
+        submit: Queues an event and waits for its result (BATCH_ADDED or BATCH_DUPLICATE).
+    """
+
+    def __init__(
+        self,
+        pool,
+        logger,
+        window_ms: float = 5,
+        max_batch: int = 100,
+        on_flush: Optional[Callable[[int, float], None]] = None,
+    ) -> None:
+        self.pool = pool
+        self.logger = logger
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.on_flush = on_flush
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, event_obj: Event) -> str:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((event_obj, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._flush(batch)
+            except Exception as exc:
+                # The task serves every later submit, so it must outlive a
+                # failed flush; its callers get the error instead of hanging.
+                self.logger.error(f"Flush of {len(batch)} events failed: {exc}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    async def _flush(self, batch: List[Tuple[Event, asyncio.Future]]) -> None:
+        start = time.perf_counter()
+        unique = {}
+        repeated = []
+        for event_obj, future in batch:
+            if event_obj.event_id in unique:
+                repeated.append(future)
+            else:
+                unique[event_obj.event_id] = (event_obj, future)
+
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    try:
+                        inserted = await Event.add_events(
+                            conn, cur, [event_obj for event_obj, _ in unique.values()]
+                        )
+                    except Exception:
+                        await conn.rollback()
+                        raise
+            for event_id, (_, future) in unique.items():
+                self._resolve(
+                    future, BATCH_ADDED if event_id in inserted else BATCH_DUPLICATE
+                )
+        except Exception as exc:
+            self.logger.error(
+                f"Batch insert of {len(unique)} events failed, retrying individually: {exc}"
+            )
+            await self._flush_individually(unique.values())
+
+        for future in repeated:
+            self._resolve(future, BATCH_DUPLICATE)
+
+        elapsed = time.perf_counter() - start
+        self.logger.debug(
+            f"Flushed batch of {len(batch)} events in {elapsed * 1000:.2f} ms"
+        )
+        if self.on_flush:
+            try:
+                self.on_flush(len(batch), elapsed)
+            except Exception as exc:
+                self.logger.error(f"Batch flush callback failed: {exc}")
+
+    async def _flush_individually(self, items) -> None:
+        for event_obj, future in items:
+            try:
+                async with self.pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        try:
+                            await event_obj.add_event(conn, cur)
+                            self._resolve(future, BATCH_ADDED)
+                        except psycopg.IntegrityError:
+                            await conn.rollback()
+                            self._resolve(future, BATCH_DUPLICATE)
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: str) -> None:
+        if not future.done():
+            future.set_result(result)
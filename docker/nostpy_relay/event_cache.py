@@ -0,0 +1,136 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from utils import EVENT_DELETIONS_CHANNEL, LimitedDict
+
+
+def cacheable_kind(kind: int) -> bool:
+    """Regular events never change; replaceable versions are deleted on update."""
+    return not (kind in (0, 3) or 10000 <= kind < 40000)
+
+
+class EventCache:
+    """
+    In-process cache of stored events by ID, used to answer {"ids": [...]} REQs.
+
+    Events are kept as their NDJSON line with their created_at, evicting the
+    least recently used ones once the lines take more than max_bytes. Only
+    regular events are cached, so an entry can only become stale through a
+    deletion. Every deletion is published on EVENT_DELETIONS_CHANNEL and
+    each event handler replica drops the deleted IDs; they are remembered
+    for a while so a read from a lagging replica cannot cache them again.
+
+    Attributes:
+        redis_client: Async Redis client used to publish and receive deletions.
+        max_bytes (int): Memory cap of the cached lines, 0 disables the cache.
+        entries (OrderedDict): Event ID to (created_at, line), least recently used first.
+        size (int): Bytes taken by the cached lines.
+        deleted (LimitedDict): Recently deleted event IDs.
+
+    Methods:
+        get: Returns the cached (created_at, line) of an event.
+        add: Caches an event line read from the database.
+        event_stored: Caches a newly stored event.
+        discard: Drops events and remembers them as deleted.
+        events_deleted: Drops deleted events here and announces them to the other replicas.
+        listen: Drops the events deleted by other replicas.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        logger,
+        max_bytes: int = 67108864,
+        retry_interval: float = 1,
+    ) -> None:
+        self.redis_client = redis_client
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.retry_interval = retry_interval
+        self.entries: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self.size = 0
+        self.deleted = LimitedDict(max_size=100000)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, event_id: str) -> Optional[Tuple[int, bytes]]:
+        entry = self.entries.get(event_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(event_id)
+        self.hits += 1
+        return entry
+
+    def add(self, event_id: str, kind: int, created_at: int, line: bytes) -> None:
+        if (
+            not self.max_bytes
+            or not cacheable_kind(kind)
+            or event_id in self.deleted
+            or len(line) > self.max_bytes
+        ):
+            return
+        previous = self.entries.pop(event_id, None)
+        if previous is not None:
+            self.size -= len(previous[1])
+        self.entries[event_id] = (created_at, line)
+        self.size += len(line)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def event_stored(self, event_dict: Dict) -> None:
+        self.deleted.pop(event_dict["id"], None)
+        event = {
+            key: event_dict[key]
+            for key in ("id", "pubkey", "kind", "created_at", "tags", "content", "sig")
+        }
+        self.add(
+            event["id"],
+            event["kind"],
+            event["created_at"],
+            orjson.dumps(event) + b"\n",
+        )
+
+    def discard(self, event_ids: Iterable[str]) -> None:
+        for event_id in event_ids:
+            self.deleted[event_id] = True
+            entry = self.entries.pop(event_id, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+
+    async def events_deleted(self, event_ids: List[str]) -> None:
+        if not event_ids:
+            return
+        self.discard(event_ids)
+        try:
+            await self.redis_client.publish(
+                EVENT_DELETIONS_CHANNEL, orjson.dumps(event_ids)
+            )
+        except Exception as exc:
+            self.logger.error(f"Failed to announce deleted events: {exc}")
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async with self.redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(EVENT_DELETIONS_CHANNEL)
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=1.0
+                        )
+                        if message and message["type"] == "message":
+                            self.discard(orjson.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.logger.error(f"Event cache deletion listener error: {exc}")
+                # Deletions may have been missed while disconnected.
+                self.entries.clear()
+                self.size = 0
+                await asyncio.sleep(self.retry_interval)
@@ -1,10 +1,44 @@
 import asyncio
 import json
 import orjson
-from typing import List, Tuple, Dict
-from fastapi.responses import ORJSONResponse
+import os
+from typing import List, Optional, Tuple, Dict
+from fastapi.responses import ORJSONResponse, Response
 import secp256k1
 
+from admission_cache import POLICY_CHANNEL
+from init_db import COUNTED_TAGS, PARAM_REPLACEABLE_PREDICATE, REPLACEABLE_PREDICATE
+
+
+def verify_schnorr(pubkey: str, event_id: str, sig: str) -> bool:
+    """
+    Verifies a BIP-340 schnorr signature over an event ID.
+
+    Kept at module level so it can be shipped to process pool workers.
+
+    Raises:
+        ValueError, TypeError: If any of the hex inputs are malformed.
+    """
+    pub_key: secp256k1.PublicKey = secp256k1.PublicKey(
+        bytes.fromhex("02" + pubkey), True
+    )
+    return pub_key.schnorr_verify(
+        bytes.fromhex(event_id), bytes.fromhex(sig), None, raw=True
+    )
+
+
+def verify_schnorr_batch(items: List[Tuple[str, str, str]]) -> List[bool]:
+    """
+    Verifies a batch of (pubkey, event_id, sig) tuples, malformed input counts as a failed verification.
+    """
+    results = []
+    for pubkey, event_id, sig in items:
+        try:
+            results.append(verify_schnorr(pubkey, event_id, sig))
+        except (ValueError, TypeError):
+            results.append(False)
+    return results
+
 
 class Event:
     """
@@ -18,10 +52,13 @@ class Event:
         tags (List): A list of tags associated with the event.
         content (str): The content of the event.
         sig (str): The signature of the event.
+        replaced (Dict): The stored version an upsert replaced, if any.
 
     Methods:
-        delete_check: Checks and deletes the event from the database.
         add_event: Adds the event to the database.
+        upsert_replaceable: Stores a replaceable event unless a newer one is already stored.
+        add_events: Adds a batch of events to the database in a single transaction.
+        add_event_tags: Adds the indexed tags of events to the event_tags table.
         evt_response: Builds and returns the JSON response for the event.
     """
 
@@ -42,18 +79,14 @@ class Event:
         self.tags = tags
         self.content = content
         self.sig = sig
+        self.replaced = None
 
     def __str__(self) -> str:
         return f"{self.event_id}, {self.pubkey}, {self.kind}, {self.created_at}, {self.tags}, {self.content}, {self.sig} "
 
     def verify_signature(self, logger) -> bool:
         try:
-            pub_key: secp256k1.PublicKey = secp256k1.PublicKey(
-                bytes.fromhex("02" + self.pubkey), True
-            )
-            result: bool = pub_key.schnorr_verify(
-                bytes.fromhex(self.event_id), bytes.fromhex(self.sig), None, raw=True
-            )
+            result: bool = verify_schnorr(self.pubkey, self.event_id, self.sig)
             if result:
                 logger.info(f"Verification successful for event: {self.event_id}")
             else:
@@ -63,26 +96,45 @@ class Event:
             logger.error(f"Error verifying signature for event {self.event_id}: {e}")
             return False
 
-    async def delete_check(self, conn, cur) -> None:
-        delete_query = """
-        DELETE FROM events
-        WHERE pubkey = %s AND kind = %s;
-        """
-        await cur.execute(delete_query, (self.pubkey, self.kind))
-        await conn.commit()
+    @property
+    def is_replaceable(self) -> bool:
+        return self.kind in (0, 3) or 10000 <= self.kind < 20000
+
+    @property
+    def is_parameterized_replaceable(self) -> bool:
+        return 30000 <= self.kind < 40000
+
+    @property
+    def is_ephemeral(self) -> bool:
+        return 20000 <= self.kind < 30000
+
+    @property
+    def d_tag(self):
+        if not self.is_parameterized_replaceable:
+            return None
+        for tag in self.tags:
+            if tag and tag[0] == "d":
+                return tag[1] if len(tag) > 1 else ""
+        return ""
 
     def parse_kind5(self) -> List:
         event_values = [array[1] for array in self.tags]
         return event_values
 
-    async def delete_event(self, conn, cur, delete_events) -> bool:
+    async def delete_event(self, conn, cur, delete_events) -> List[Dict]:
         delete_statement = """
         DELETE FROM events
-        WHERE id = ANY(%s) AND pubkey = %s;
+        WHERE id = ANY(%s) AND pubkey = %s
+        RETURNING id, pubkey, kind, created_at, tags;
         """
         event_ids = [event_id for event_id in delete_events]
         await cur.execute(delete_statement, (event_ids, self.pubkey))
+        deleted = [
+            dict(zip(("id", "pubkey", "kind", "created_at", "tags"), row))
+            for row in await cur.fetchall()
+        ]
         await conn.commit()
+        return deleted
 
     async def admin_delete(self, conn, cur, delete_pub):
         delete_statement = """
@@ -107,8 +159,150 @@ class Event:
                 self.sig,
             ),
         )
+        await Event.add_event_tags(cur, [self])
         await conn.commit()
 
+    async def upsert_replaceable(self, conn, cur) -> bool:
+        """
+        Inserts or replaces a (parameterized) replaceable event in one statement.
+
+        The stored row is only replaced by a newer event, ties on created_at are
+        broken by the lowest ID as NIP-01 specifies. The version that was
+        replaced, if any, is kept in self.replaced.
+
+        Returns:
+            bool: True if the event was written, False if a newer one is stored.
+        """
+        if self.is_parameterized_replaceable:
+            conflict_target = (
+                f"(pubkey, kind, d_tag) WHERE {PARAM_REPLACEABLE_PREDICATE}"
+            )
+        else:
+            conflict_target = f"(pubkey, kind) WHERE {REPLACEABLE_PREDICATE}"
+
+        await cur.execute(
+            f"""
+            WITH previous AS (
+                SELECT id, pubkey, kind, created_at, tags FROM events
+                WHERE pubkey = %s AND kind = %s AND d_tag IS NOT DISTINCT FROM %s
+            )
+            INSERT INTO events (id,pubkey,kind,created_at,tags,content,sig,d_tag)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT {conflict_target}
+            DO UPDATE SET
+                id = EXCLUDED.id,
+                created_at = EXCLUDED.created_at,
+                tags = EXCLUDED.tags,
+                content = EXCLUDED.content,
+                sig = EXCLUDED.sig
+            WHERE EXCLUDED.created_at > events.created_at
+                OR (EXCLUDED.created_at = events.created_at AND EXCLUDED.id < events.id)
+            RETURNING (SELECT row_to_json(previous) FROM previous)
+            """,
+            (
+                self.pubkey,
+                self.kind,
+                self.d_tag,
+                self.event_id,
+                self.pubkey,
+                self.kind,
+                self.created_at,
+                json.dumps(self.tags),
+                self.content,
+                self.sig,
+                self.d_tag,
+            ),
+        )
+        row = await cur.fetchone()
+        written = row is not None
+        self.replaced = row[0] if written else None
+        if written:
+            # The replaced row keeps its place and takes the new ID, so its old
+            # tag rows cascade to the new ID and are swapped out here.
+            await cur.execute(
+                "DELETE FROM event_tags WHERE event_id = %s;", (self.event_id,)
+            )
+            await Event.add_event_tags(cur, [self])
+        await conn.commit()
+        return written
+
+    @property
+    def indexed_tags(self) -> List[Tuple[str, str]]:
+        """Single-letter (name, value) tag pairs stored in event_tags."""
+        pairs = set()
+        for tag in self.tags or []:
+            if (
+                isinstance(tag, list)
+                and len(tag) >= 2
+                and isinstance(tag[0], str)
+                and len(tag[0]) == 1
+                and isinstance(tag[1], str)
+            ):
+                pairs.add((tag[0], tag[1]))
+        return sorted(pairs)
+
+    @staticmethod
+    async def add_event_tags(cur, events: List["Event"]) -> None:
+        """
+        Writes the indexed tags of events to event_tags.
+
+        Runs on the caller's cursor without committing so the tag rows land in
+        the same transaction as the events themselves.
+        """
+        rows = [
+            (event.event_id, name, value, event.created_at, event.kind)
+            for event in events
+            for name, value in event.indexed_tags
+        ]
+        if not rows:
+            return
+        await cur.execute(
+            """
+            INSERT INTO event_tags (event_id, name, value, created_at, kind)
+            SELECT * FROM unnest(
+                %s::varchar[], %s::text[], %s::text[], %s::int[], %s::int[]
+            )
+            ON CONFLICT DO NOTHING
+            """,
+            [list(column) for column in zip(*rows)],
+        )
+
+    @staticmethod
+    async def add_events(conn, cur, events: List["Event"]) -> set:
+        """
+        Inserts a batch of events with one multi-row statement and one commit.
+
+        Returns:
+            set: IDs of the events that were actually inserted; IDs that already
+            existed are skipped instead of aborting the whole batch.
+        """
+        await cur.execute(
+            """
+            INSERT INTO events (id,pubkey,kind,created_at,tags,content,sig)
+            SELECT * FROM unnest(
+                %s::varchar[], %s::varchar[], %s::int[], %s::int[],
+                %s::jsonb[], %s::text[], %s::varchar[]
+            )
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id
+            """,
+            (
+                [event.event_id for event in events],
+                [event.pubkey for event in events],
+                [event.kind for event in events],
+                [event.created_at for event in events],
+                [json.dumps(event.tags) for event in events],
+                [event.content for event in events],
+                [event.sig for event in events],
+            ),
+        )
+        inserted = {row[0] for row in await cur.fetchall()}
+        await Event.add_event_tags(
+            cur, [event for event in events if event.event_id in inserted]
+        )
+        await conn.commit()
+        return inserted
+
     async def add_mgmt_event(self, conn, cur) -> None:
         await cur.execute(
             """
@@ -126,24 +320,39 @@ class Event:
         )
         await conn.commit()
 
-    async def parse_mgmt_event(self, conn, cur):
+    def is_mgmt_event(self, admin_pubkey: Optional[str]) -> bool:
+        """
+        Returns True for an event of the relay admin carrying a
+        ["ban" | "allow", "client_pub" | "kind", value] tag.
+        """
+        return (
+            bool(admin_pubkey)
+            and self.pubkey == admin_pubkey
+            and any(
+                isinstance(tag, list)
+                and len(tag) >= 3
+                and tag[0] in ("ban", "allow")
+                and tag[1] in ("client_pub", "kind")
+                for tag in self.tags
+            )
+        )
+
+    async def parse_mgmt_event(self, conn, cur, redis_client):
+        """
+        Applies a ban/allow management event to the allowlist and announces
+        the change on POLICY_CHANNEL, so every event handler replica reloads
+        its PolicyCache.
+        """
         for list in self.tags:
             if list[0] == "ban":
                 await self.mod_pubkey_perm(conn, cur, list[1], "false", list[2])
+                await redis_client.publish(POLICY_CHANNEL, self.event_id)
                 return f"banned: {list[2]} has been banned"
             if list[0] == "allow":
                 await self.mod_pubkey_perm(conn, cur, list[1], "true", list[2])
+                await redis_client.publish(POLICY_CHANNEL, self.event_id)
                 return f"allowed: {list[2]} has been allowed"
 
-    async def check_mgmt_allow(self, cur) -> bool:
-        await cur.execute(
-            f"""
-            SELECT client_pub FROM allowlist WHERE client_pub = '{self.pubkey}' AND allowed = false;
-
-        """
-        )
-        return await cur.fetchall()
-
     async def mod_pubkey_perm(self, conn, cur, conflict_target, bool, conflict_value):
         if conflict_target not in ["client_pub", "kind"]:
             raise ValueError("Invalid conflict target. Must be 'client_pub' or 'kind'.")
@@ -157,19 +366,15 @@ class Event:
                 note_id = EXCLUDED.note_id,
                 allowed = EXCLUDED.allowed
         """,
-            (self.event_id, conflict_value, bool),
+            (
+                self.event_id,
+                int(conflict_value) if conflict_target == "kind" else conflict_value,
+                bool,
+            ),
         )
 
         await conn.commit()
 
-    async def check_wot(self, cur):
-        await cur.execute(
-            f"""
-            SELECT pubkey FROM trust_network WHERE pubkey = '{self.pubkey}';
-            """
-        )
-        return await cur.fetchone()
-
     def evt_response(self, results_status, http_status_code, message=""):
         response = {
             "event": "OK",
@@ -180,6 +385,39 @@ class Event:
         return ORJSONResponse(content=response, status_code=http_status_code)
 
 
+# REQ filter keys that map directly to a column, with the column's array type.
+FILTER_COLUMNS = {
+    "ids": ("id", "varchar"),
+    "authors": ("pubkey", "varchar"),
+    "kinds": ("kind", "int"),
+}
+# Filters without a limit get one page, larger limits are read page by page.
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+MAX_QUERY_LIMIT = int(os.getenv("MAX_QUERY_LIMIT", "5000"))
+# Query results are (id, created_at, kind, event JSON) rows. Postgres
+# serializes the event so its JSON is forwarded as is; id and created_at are
+# kept for deduplication and keyset paging, kind for the event cache.
+RESULT_COLUMNS = (
+    "id, created_at, kind, json_build_object('id', id, 'pubkey', pubkey, "
+    "'kind', kind, 'created_at', created_at, 'tags', tags, "
+    "'content', content, 'sig', sig)::text AS event"
+)
+
+
+def effective_limit(filter_: Dict) -> int:
+    """
+    Returns the number of events a filter is answered with.
+
+    A missing or invalid limit means one page and requested limits are capped
+    at MAX_QUERY_LIMIT. Searches are ordered by rank, which cannot be paged
+    with a keyset, so they are capped at one page.
+    """
+    limit = filter_.get("limit")
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0:
+        limit = QUERY_PAGE_SIZE
+    return min(limit, QUERY_PAGE_SIZE if filter_.get("search") else MAX_QUERY_LIMIT)
+
+
 class Subscription:
     """
     Represents a subscription object with attributes and methods for handling subscription-related operations.
@@ -187,26 +425,25 @@ class Subscription:
     Attributes:
         filters (dict): Dictionary containing filters for the subscription.
         subscription_id (str): The ID of the subscription.
-        where_clause (str): The WHERE clause of the base SQL query.
-        base_query (str): The base SQL query for fetching events.
+        written_at (float): Time of the client's last write when it must read its own events.
         column_names (List): List of column names for event attributes.
 
     Methods:
-        generate_tag_clause: Generates the tag clause for SQL query based on given tags.
-        sanitize_event_keys: Sanitizes the event keys by mapping and filtering the filters.
-        parse_sanitized_keys: Parses and sanitizes the updated keys to generate tag values and query parts.
-        generate_query: Generates the SQL query based on provided tags.
-        _parser_worker: Worker function to parse and add records to the column.
-        query_result_parser: Parses the query result and adds columns accordingly.
+        compile_filter: Compiles a filter into a parameterized SQL query and its parameters.
+        compile_req: Compiles all filters of a REQ into one deduplicated query.
+        compile_count: Compiles the filters of a COUNT into a counter lookup or a bounded count.
+        id_lookup: Returns the event IDs of a REQ that only looks events up by ID.
+        needs_paging: Tells whether a REQ asks for more than one page of events.
+        query_result_parser_hard: Parses management query results into dictionaries.
         fetch_data_from_cache: Fetches data from cache based on the provided Redis key.
-        parse_filters: Parses and sanitizes filters to generate tag values and query parts.
         sub_response_builder: Builds and returns the JSON response for the subscription.
+        sub_ndjson_response_builder: Builds the JSON response around events already serialized as NDJSON.
     """
 
     def __init__(self, request_payload: dict) -> None:
         self.filters = request_payload.get("event_dict", {})
         self.subscription_id = request_payload.get("subscription_id")
-        self.where_clause = ""
+        self.written_at = request_payload.get("written_at")
         self.column_names = [
             "id",
             "pubkey",
@@ -217,112 +454,258 @@ class Subscription:
             "sig",
         ]
 
-    def _generate_tag_clause(self, tags) -> str:
-        tag_clause = (
-            " EXISTS ( SELECT 1 FROM jsonb_array_elements(tags) as elem WHERE {})"
-        )
-        conditions = [f"elem @> '{tag_pair}'" for tag_pair in tags]
+    def _check_values(self, key: str, values, value_type) -> List:
+        if not isinstance(values, list) or not all(
+            isinstance(value, value_type) and not isinstance(value, bool)
+            for value in values
+        ):
+            raise ValueError(
+                f"Filter key {key} must be a list of {value_type.__name__}"
+            )
+        return values
 
-        complete_cluase = tag_clause.format(" OR ".join(conditions))
-        return complete_cluase
+    def compile_filter(
+        self,
+        filter_: Dict,
+        search_trigram: bool = False,
+        after: Optional[Tuple[int, str]] = None,
+        page_size: Optional[int] = None,
+    ) -> Tuple[str, List]:
+        """
+        Compiles one REQ filter into a parameterized query returning
+        (id, created_at, kind, event JSON) rows.
 
-    def _search_clause(self, search_item):
-        search_clause = f" EXISTS ( SELECT 1 FROM jsonb_array_elements(tags) as elem WHERE elem::text LIKE '%{search_item}%' OR content LIKE '%{search_item}%')"
-        return search_clause
+        The query text only depends on which keys the filter uses and which tag
+        names it matches; every value is bound as a parameter. REQs with the
+        same structure therefore share one prepared statement and plan.
 
-    async def _sanitize_event_keys(self, filters, logger) -> Dict:
-        updated_keys = {}
-        limit = ""
-        global_search = {}
-        try:
-            logger.debug(f"filters in san is {filters}")
-            try:
-                limit = filters.get("limit", 100)
-                filters.pop("limit")
-            except Exception as exc:
-                logger.debug(f"Exception is: {exc}")
-
-            try:
-                global_search = filters.get("search", {})
-                filters.pop("search")
-            except Exception as exc:
-                logger.debug(f"Exception is: {exc}")
-
-            key_mappings = {
-                "authors": "pubkey",
-                "kinds": "kind",
-                "ids": "id",
-            }
-
-            if filters or global_search:
-                for key in filters:
-                    new_key = key_mappings.get(key, key)
-                    if new_key != key:
-                        stored_val = filters[key]
-                        updated_keys[new_key] = stored_val
-                    else:
-                        updated_keys[key] = filters[key]
-
-            logger.debug(
-                f"updated keys are {updated_keys}, global search is {global_search}"
-            )
+        Events are ordered newest first with ties broken by the lowest ID, as
+        NIP-01 specifies. Given the (created_at, id) of the last event of the
+        previous page as after, the query returns the next page of at most
+        page_size events as an index range scan.
 
-            return updated_keys, limit, global_search
-        except Exception as e:
-            logger.error(f"An unexpected error occurred: {e}", exc_info=True)
-            return updated_keys, limit, global_search
+        NIP-50 searches match the content_tsv full-text index and are ordered
+        by rank. With search_trigram, a case-insensitive substring match on
+        the content (backed by a pg_trgm index) is accepted as well.
 
-    async def _parse_sanitized_keys(self, updated_keys, logger) -> Tuple[List, List]:
-        query_parts = []
-        tag_values = []
+        Returns:
+            Tuple[str, List]: The query and its parameters.
 
-        try:
-            for item in updated_keys:
-                outer_break = False
-
-                if item.startswith("#"):
-                    try:
-                        for tags in updated_keys[item]:
-                            tag_values.append(json.dumps([item[1:], tags]))
-
-                        outer_break = True
-                        continue
-                    except TypeError as e:
-                        logger.error(f"Error processing tags for key {item}: {e}")
-
-                elif item in ["since", "until"]:
-                    if item == "since":
-                        since = f'created_at > {updated_keys["since"]}'
-                        query_parts.append(since)
-                        outer_break = True
-                        continue
-                    elif item == "until":
-                        until = f'created_at < {updated_keys["until"]}'
-                        query_parts.append(until)
-                        outer_break = True
-                        continue
-
-                if outer_break:
-                    continue
-
-                array_search = f"{item} = ANY(ARRAY {updated_keys[item]})"
-                query_parts.append(array_search)
-
-            return tag_values, query_parts
-        except Exception as exc:
-            logger.warning(
-                f"query not sanitized (maybe empty value) tv is {tag_values}, qp is {query_parts}, error is: {exc}",
-                exc_info=True,
+        Raises:
+            ValueError: If a filter value has the wrong type.
+        """
+        sql_query, params = self._compile_page(
+            filter_, search_trigram, after, page_size
+        )
+        # The JSON is built above the LIMIT so only returned rows are
+        # serialized; a plain projection keeps the subquery's order.
+        return f"SELECT {RESULT_COLUMNS} FROM ({sql_query}) AS page", params
+
+    def _compile_page(
+        self,
+        filter_: Dict,
+        search_trigram: bool = False,
+        after: Optional[Tuple[int, str]] = None,
+        page_size: Optional[int] = None,
+    ) -> Tuple[str, List]:
+        where_clause, params = self._compile_where(filter_, search_trigram, after)
+        order_by = "created_at DESC, id"
+        search = filter_.get("search")
+        if search:
+            order_by = (
+                "ts_rank(content_tsv, websearch_to_tsquery('simple', %s)) DESC, "
+                "created_at DESC, id"
             )
-            return tag_values, query_parts
+            params.append(search)
 
-    async def _parser_worker(self, record, column_added) -> None:
-        row_result = {}
-        i = 0
-        for item in record:
-            row_result[self.column_names[i]] = item
-            i += 1
-        column_added.append(row_result)
+        limit = effective_limit(filter_)
+        params.append(min(limit, page_size) if page_size else limit)
+
+        columns = ", ".join(self.column_names)
+        sql_query = (
+            f"SELECT {columns} FROM events{where_clause} "
+            f"ORDER BY {order_by} LIMIT %s"
+        )
+        return sql_query, params
+
+    def _compile_where(
+        self,
+        filter_: Dict,
+        search_trigram: bool = False,
+        after: Optional[Tuple[int, str]] = None,
+    ) -> Tuple[str, List]:
+        clauses = []
+        params = []
+        for key, (column, pg_type) in FILTER_COLUMNS.items():
+            if key in filter_:
+                value_type = int if pg_type == "int" else str
+                clauses.append(f"{column} = ANY(%s::{pg_type}[])")
+                params.append(self._check_values(key, filter_[key], value_type))
+
+        # Kind and time bounds are repeated inside the event_tags subqueries so
+        # the (name, value, created_at) index can bound its scan.
+        tag_bounds = []
+        tag_bound_params = []
+        if "kinds" in filter_:
+            tag_bounds.append("kind = ANY(%s::int[])")
+            tag_bound_params.append(filter_["kinds"])
+        for key, operator in (("since", ">"), ("until", "<")):
+            if key in filter_:
+                value = filter_[key]
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValueError(f"Filter key {key} must be an integer")
+                clauses.append(f"created_at {operator} %s")
+                params.append(value)
+                tag_bounds.append(f"created_at {operator} %s")
+                tag_bound_params.append(value)
+        if after is not None:
+            created_at, event_id = after
+            clauses.append("created_at <= %s AND (created_at < %s OR id > %s)")
+            params.extend([created_at, created_at, event_id])
+            tag_bounds.append("created_at <= %s")
+            tag_bound_params.append(created_at)
+
+        for key in sorted(k for k in filter_ if k.startswith("#")):
+            values = self._check_values(key, filter_[key], str)
+            if len(key) == 2:
+                clauses.append(
+                    "id IN (SELECT event_id FROM event_tags WHERE name = %s "
+                    "AND value = ANY(%s::text[])"
+                    + "".join(f" AND {bound}" for bound in tag_bounds)
+                    + ")"
+                )
+                params.extend([key[1:], values, *tag_bound_params])
+            else:
+                # Only single-letter tags are indexed in event_tags.
+                clauses.append(
+                    "EXISTS (SELECT 1 FROM jsonb_array_elements(tags) AS elem "
+                    "WHERE elem->>0 = %s AND elem->>1 = ANY(%s::text[]))"
+                )
+                params.extend([key[1:], values])
+
+        search = filter_.get("search")
+        if search:
+            if not isinstance(search, str):
+                raise ValueError("Filter key search must be a string")
+            search_clause = "content_tsv @@ websearch_to_tsquery('simple', %s)"
+            params.append(search)
+            if search_trigram:
+                escaped = (
+                    search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                )
+                search_clause = f"({search_clause} OR content ILIKE %s)"
+                params.append(f"%{escaped}%")
+            clauses.append(search_clause)
+
+        where_clause = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where_clause, params
+
+    def compile_count(
+        self,
+        filters: List[Dict],
+        search_trigram: bool = False,
+        count_limit: int = 10000,
+    ) -> Tuple[str, List, bool]:
+        """
+        Compiles the filters of a NIP-45 COUNT into a query returning one count.
+
+        A single filter of a shape kept in tag_counts, such as
+        {"kinds": [3], "#p": [pubkey]} for followers, reads the maintained
+        counter. Anything else counts the distinct matching events. Every
+        filter stops after count_limit + 1 events before the branches are
+        deduplicated, so a broad COUNT stays a bounded scan.
+
+        Returns:
+            Tuple[str, List, bool]: The query, its parameters and whether the
+            count is bounded, in which case a result above count_limit is
+            only a lower bound.
+
+        Raises:
+            ValueError: If a filter value has the wrong type.
+        """
+        if len(filters) == 1:
+            filter_ = filters[0]
+            keys = [key for key in filter_ if key != "limit"]
+            tag_keys = [key for key in keys if key.startswith("#")]
+            if len(keys) == 2 and "kinds" in keys and len(tag_keys) == 1:
+                kinds = self._check_values("kinds", filter_["kinds"], int)
+                values = self._check_values(tag_keys[0], filter_[tag_keys[0]], str)
+                if (
+                    len(kinds) == 1
+                    and len(values) == 1
+                    and (kinds[0], tag_keys[0][1:]) in COUNTED_TAGS
+                ):
+                    return (
+                        "SELECT COALESCE((SELECT count FROM tag_counts "
+                        "WHERE kind = %s AND name = %s AND value = %s), 0)",
+                        [kinds[0], tag_keys[0][1:], values[0]],
+                        False,
+                    )
+
+        branches = []
+        params = []
+        for filter_ in filters:
+            where_clause, filter_params = self._compile_where(filter_, search_trigram)
+            branches.append(f"(SELECT id FROM events{where_clause} LIMIT %s)")
+            params.extend(filter_params)
+            params.append(count_limit + 1)
+        params.append(count_limit + 1)
+        sql_query = (
+            f"SELECT count(*) FROM ({' UNION '.join(branches)} LIMIT %s) AS matched"
+        )
+        return sql_query, params, True
+
+    def id_lookup(self, filters: List[Dict]) -> Optional[List[str]]:
+        """
+        Returns the event IDs of a REQ whose filters only list IDs, in the
+        order they were asked for, or None for any other REQ.
+
+        A lookup of more IDs than one page is left to the query path, which
+        applies the filter's limit.
+        """
+        event_ids = []
+        for filter_ in filters:
+            if list(filter_) != ["ids"]:
+                return None
+            event_ids.extend(self._check_values("ids", filter_["ids"], str))
+        event_ids = list(dict.fromkeys(event_ids))
+        if not event_ids or len(event_ids) > QUERY_PAGE_SIZE:
+            return None
+        return event_ids
+
+    def needs_paging(self, filters: List[Dict]) -> bool:
+        return any(effective_limit(f) > QUERY_PAGE_SIZE for f in filters)
+
+    def compile_req(
+        self, filters: List[Dict], search_trigram: bool = False
+    ) -> Tuple[str, List]:
+        """
+        Compiles every filter of a REQ into one parameterized query returning
+        (id, created_at, kind, event JSON) rows.
+
+        Each filter keeps its own ordering and LIMIT inside a UNION ALL branch.
+        Events matched by more than one filter are returned once, newest first,
+        so a REQ needs a single connection and round trip.
+
+        Returns:
+            Tuple[str, List]: The query and its parameters.
+
+        Raises:
+            ValueError: If a filter value has the wrong type.
+        """
+        if len(filters) == 1:
+            return self.compile_filter(filters[0], search_trigram)
+
+        compiled = [self._compile_page(f, search_trigram) for f in filters]
+        columns = ", ".join(self.column_names)
+        branches = " UNION ALL ".join(f"({sql_query})" for sql_query, _ in compiled)
+        sql_query = (
+            f"SELECT {RESULT_COLUMNS} FROM ("
+            f"SELECT DISTINCT ON (id) {columns} FROM ({branches}) AS matched "
+            f"ORDER BY id) AS deduped ORDER BY created_at DESC, id"
+        )
+        params = [param for _, filter_params in compiled for param in filter_params]
+        return sql_query, params
 
     async def _parser_worker_hard(self, record, column_added) -> None:
         self.hard_col = ["client_pub", "kind", "allowed", "note_id"]
@@ -338,17 +721,6 @@ class Subscription:
             i += 1
         column_added.append(row_result)
 
-    async def query_result_parser(self, query_result) -> List:
-        column_added = []
-        try:
-            tasks = [
-                self._parser_worker(record, column_added) for record in query_result
-            ]
-            await asyncio.gather(*tasks)
-            return column_added
-        except:
-            return None
-
     async def query_result_parser_hard(self, query_result) -> List:
         column_added = []
         try:
@@ -368,48 +740,6 @@ class Subscription:
         else:
             return None
 
-    async def parse_filters(self, filters: dict, logger) -> tuple:
-        updated_keys, limit, global_search = await self._sanitize_event_keys(
-            filters, logger
-        )
-        logger.debug(f"Updated keys is: {updated_keys}")
-        if updated_keys or global_search:
-            tag_values, query_parts = await self._parse_sanitized_keys(
-                updated_keys, logger
-            )
-            return tag_values, query_parts, limit, global_search
-        else:
-            return {}, {}, None, {}
-
-    def base_query_builder(self, tag_values, query_parts, limit, global_search, logger):
-        try:
-            if query_parts:
-                self.where_clause = " AND ".join(query_parts)
-
-            if tag_values:
-                tag_clause = self._generate_tag_clause(tag_values)
-                if self.where_clause:
-                    self.where_clause += f" AND {tag_clause}"
-                else:
-                    self.where_clause += f"{tag_clause}"
-
-            if global_search:
-                search_clause = self._search_clause(global_search)
-                if self.where_clause:
-                    self.where_clause += f" AND {search_clause}"
-                else:
-                    self.where_clause += f"{search_clause}"
-
-            if not limit or limit > 100:
-                limit = 100
-
-            self.base_query = f"SELECT * FROM events WHERE {self.where_clause} ORDER BY created_at DESC LIMIT {limit} ;"
-            logger.debug(f"SQL query constructed: {self.base_query}")
-            return self.base_query
-        except Exception as exc:
-            logger.error(f"Error building query: {exc}", exc_info=True)
-            return None
-
     def sub_response_builder(
         self, event_type, subscription_id, results_json, http_status_code
     ):
@@ -421,3 +751,28 @@ class Subscription:
             },
             status_code=http_status_code,
         )
+
+    def sub_ndjson_response_builder(
+        self, event_type, subscription_id, ndjson: bytes, http_status_code
+    ):
+        """
+        Builds the same response as sub_response_builder from NDJSON results.
+
+        JSON strings cannot contain a raw newline, so the lines are joined into
+        the results array without decoding the events.
+        """
+        events = ndjson.rstrip(b"\n").replace(b"\n", b",")
+        content = (
+            b'{"event":'
+            + orjson.dumps(event_type)
+            + b',"subscription_id":'
+            + orjson.dumps(subscription_id)
+            + b',"results_json":['
+            + events
+            + b"]}"
+        )
+        return Response(
+            content=content,
+            status_code=http_status_code,
+            media_type="application/json",
+        )
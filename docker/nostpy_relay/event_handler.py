@@ -1,14 +1,15 @@
 import asyncio
+import heapq
 import logging
 import os
 from contextlib import asynccontextmanager
-from typing import Any, Callable, Dict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 import psycopg
 import redis.asyncio as redis
 import uvicorn
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from opentelemetry import trace
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
@@ -21,11 +22,18 @@ from opentelemetry.semconv.trace import SpanAttributes
 import orjson
 from psycopg_pool import AsyncConnectionPool
 
-from event_classes import Event, Subscription
-from init_db import initialize_db
+from admission_cache import PolicyCache, TrustSet
+from event_batcher import BATCH_DUPLICATE, EventBatcher
+from event_cache import EventCache
+from event_classes import QUERY_PAGE_SIZE, Event, Subscription, effective_limit
+from init_db import initialize_db, migrate_indexes
+from query_cache import QueryCache, SingleFlight
+from replica_router import Replica, ReplicaRouter, parse_replicas
+from rpc_protocol import OP_COUNT, OP_EVENT, OP_REQ, OP_REQ_STREAM, RPCServer
+from seen_filter import SeenEventFilter
+from signature_verifier import SignatureVerifier
 from otel_metric_base.otel_metrics import OtelMetricBase
-from utils import LimitedDict
-
+from utils import NDJSON_MEDIA_TYPE, LimitedDict, event_channels
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -35,7 +43,30 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 WOT_ENABLED = os.getenv("WOT_ENABLED")
-REDIS_CHANNEL = "new_events_channel"
+ADMIN_PUBKEY = os.getenv("ADMIN_PUBKEY")
+EVENT_BATCH_WINDOW_MS = float(os.getenv("EVENT_BATCH_WINDOW_MS", "5"))
+EVENT_BATCH_MAX_SIZE = int(os.getenv("EVENT_BATCH_MAX_SIZE", "100"))
+SIG_VERIFY_MODE = os.getenv("SIG_VERIFY_MODE", "process")
+SIG_VERIFY_WORKERS = int(os.getenv("SIG_VERIFY_WORKERS", "0")) or None
+SIG_VERIFY_BATCH_SIZE = int(os.getenv("SIG_VERIFY_BATCH_SIZE", "64"))
+SIG_VERIFY_WINDOW_MS = float(os.getenv("SIG_VERIFY_WINDOW_MS", "2"))
+SIG_VERIFY_CACHE_SIZE = int(os.getenv("SIG_VERIFY_CACHE_SIZE", "100000"))
+SEEN_FILTER_CAPACITY = int(os.getenv("SEEN_FILTER_CAPACITY", "5000000"))
+SEEN_FILTER_ERROR_RATE = float(os.getenv("SEEN_FILTER_ERROR_RATE", "0.001"))
+SEEN_IDS_WINDOW_HOURS = int(os.getenv("SEEN_IDS_WINDOW_HOURS", "24"))
+WOT_REFRESH_INTERVAL = float(os.getenv("WOT_REFRESH_INTERVAL", "30"))
+EVENT_HANDLER_RPC_PORT = os.getenv("EVENT_HANDLER_RPC_PORT")
+EVENT_HANDLER_RPC_SOCKET = os.getenv("EVENT_HANDLER_RPC_SOCKET")
+SEARCH_TRIGRAM = os.getenv("SEARCH_TRIGRAM", "False") in ["True", "true"]
+STREAM_FETCH_SIZE = int(os.getenv("STREAM_FETCH_SIZE", "100"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "240"))
+QUERY_LOCK_MS = int(os.getenv("QUERY_LOCK_MS", "0"))
+COUNT_LIMIT = int(os.getenv("COUNT_LIMIT", "10000"))
+PG_READ_REPLICAS = os.getenv("PG_READ_REPLICAS", "")
+REPLICA_MAX_LAG_BYTES = int(os.getenv("REPLICA_MAX_LAG_BYTES", "16777216"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_CLOCK_SKEW_MS = float(os.getenv("REPLICA_CLOCK_SKEW_MS", "1000"))
+EVENT_CACHE_BYTES = int(os.getenv("EVENT_CACHE_BYTES", "67108864"))
 
 app = FastAPI()
 
@@ -62,6 +93,9 @@ metric_counters = {
     "wot_event_reject": LimitedDict(max_size=500),
     "event_added": LimitedDict(max_size=500),
     "event_query": LimitedDict(max_size=500),
+    "duplicate_skipped": LimitedDict(max_size=500),
+    "policy_event_reject": LimitedDict(max_size=500),
+    "ephemeral_published": LimitedDict(max_size=500),
 }
 
 
@@ -91,41 +125,262 @@ def register_metric(name: str, description: str):
 register_metric("wot_event_reject", "Rejected note from WoT filter")
 register_metric("event_added", "Event added")
 register_metric("event_query", "Event query")
+register_metric("duplicate_skipped", "Duplicate event answered by the seen-ID filter")
+register_metric("policy_event_reject", "Rejected note from ban or kind policy")
+register_metric("ephemeral_published", "Ephemeral event relayed without storage")
+
+event_batch_size = otel_metrics.meter.create_histogram(
+    name="event_batch_size",
+    description="Number of events written per group-commit transaction",
+    unit="events",
+)
+event_batch_flush_latency = otel_metrics.meter.create_histogram(
+    name="event_batch_flush_latency",
+    description="Time spent writing one group-commit batch",
+    unit="ms",
+)
+
+
+def record_batch_flush(batch_size: int, flush_seconds: float) -> None:
+    event_batch_size.record(batch_size)
+    event_batch_flush_latency.record(flush_seconds * 1000)
 
 
-def get_conn_str(db_suffix: str) -> str:
+def get_conn_str(
+    db_suffix: str, host: Optional[str] = None, port: Optional[str] = None
+) -> str:
     return (
         f"dbname={os.getenv(f'PGDATABASE_{db_suffix}')} "
         f"user={os.getenv(f'PGUSER_{db_suffix}')} "
         f"password={os.getenv(f'PGPASSWORD_{db_suffix}')} "
-        f"host={os.getenv(f'PGHOST_{db_suffix}')} "
-        f"port={os.getenv(f'PGPORT_{db_suffix}')} "
+        f"host={host or os.getenv(f'PGHOST_{db_suffix}')} "
+        f"port={port or os.getenv(f'PGPORT_{db_suffix}')} "
     )
 
 
+def read_replicas() -> List[Replica]:
+    """
+    Creates a pool per replica listed in PG_READ_REPLICAS, or for the
+    PGHOST_READ server when no replicas are listed.
+    """
+    replicas = parse_replicas(PG_READ_REPLICAS, os.getenv("PGPORT_READ")) or [
+        (os.getenv("PGHOST_READ"), os.getenv("PGPORT_READ"), 1.0)
+    ]
+    return [
+        Replica(
+            f"{host}:{port}",
+            AsyncConnectionPool(conninfo=get_conn_str("READ", host, port), timeout=30),
+            weight,
+        )
+        for host, port, weight in replicas
+    ]
+
+
+async def warm_seen_filter(app: FastAPI) -> None:
+    try:
+        await app.seen_filter.warm(app.replica_router.pool())
+    except Exception as exc:
+        logger.error(f"Failed to warm seen-ID filter: {exc}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     conn_str_write = get_conn_str("WRITE")
-    conn_str_read = get_conn_str("READ")
     logger.info(f"Write conn string is: {conn_str_write}")
-    logger.info(f"Read conn string is: {conn_str_read}")
 
     # Define limits for the connection pools
     app.write_pool = AsyncConnectionPool(
         conninfo=conn_str_write,
         timeout=30,  # Timeout in seconds for acquiring a connection
     )
-    app.read_pool = AsyncConnectionPool(conninfo=conn_str_read, timeout=30)
+    app.replica_router = ReplicaRouter(
+        app.write_pool,
+        read_replicas(),
+        logger,
+        max_lag_bytes=REPLICA_MAX_LAG_BYTES,
+        check_interval=REPLICA_CHECK_INTERVAL,
+        clock_skew=REPLICA_CLOCK_SKEW_MS / 1000,
+    )
+    logger.info(
+        f"Read replicas: {', '.join(r.name for r in app.replica_router.replicas)}"
+    )
+    await app.replica_router.check()
+    app.event_batcher = EventBatcher(
+        app.write_pool,
+        logger,
+        window_ms=EVENT_BATCH_WINDOW_MS,
+        max_batch=EVENT_BATCH_MAX_SIZE,
+        on_flush=record_batch_flush,
+    )
+    app.event_batcher.start()
+    app.sig_verifier = SignatureVerifier(
+        logger,
+        mode=SIG_VERIFY_MODE,
+        workers=SIG_VERIFY_WORKERS,
+        batch_size=SIG_VERIFY_BATCH_SIZE,
+        window_ms=SIG_VERIFY_WINDOW_MS,
+        cache_size=SIG_VERIFY_CACHE_SIZE,
+    )
+    app.sig_verifier.start()
+    app.redis_client = await get_redis_client()
+    app.seen_filter = SeenEventFilter(
+        app.redis_client,
+        logger,
+        capacity=SEEN_FILTER_CAPACITY,
+        error_rate=SEEN_FILTER_ERROR_RATE,
+        window_hours=SEEN_IDS_WINDOW_HOURS,
+    )
+    seen_filter_warm = asyncio.create_task(warm_seen_filter(app))
+    app.trust_set = TrustSet(
+        app.redis_client, logger, refresh_interval=WOT_REFRESH_INTERVAL
+    )
+    app.policy_cache = PolicyCache(app.redis_client, logger)
+    app.query_cache = QueryCache(app.redis_client, logger, ttl=QUERY_CACHE_TTL)
+    app.single_flight = SingleFlight(
+        app.redis_client, logger, app.query_cache, lock_ms=QUERY_LOCK_MS
+    )
+    app.event_cache = EventCache(app.redis_client, logger, max_bytes=EVENT_CACHE_BYTES)
+    background_tasks = [
+        seen_filter_warm,
+        asyncio.create_task(app.replica_router.check_loop()),
+        asyncio.create_task(app.event_cache.listen()),
+        asyncio.create_task(app.policy_cache.listen(app.write_pool)),
+        # Concurrent index builds can take a while on a large table, the
+        # relay keeps serving on the existing indexes in the meantime.
+        asyncio.create_task(
+            asyncio.to_thread(migrate_indexes, logger, conn_str_write, SEARCH_TRIGRAM)
+        ),
+    ]
+    if WOT_ENABLED in ["True", "true"]:
+        try:
+            await app.trust_set.load(app.write_pool)
+        except Exception as exc:
+            logger.error(
+                f"Failed to load trust network, rejecting every event until it "
+                f"loads: {exc}"
+            )
+        background_tasks.append(
+            asyncio.create_task(app.trust_set.refresh_loop(app.write_pool))
+        )
+
+    app.rpc_server = None
+    if EVENT_HANDLER_RPC_PORT or EVENT_HANDLER_RPC_SOCKET:
+        app.rpc_server = RPCServer(
+            {OP_EVENT: rpc_new_event, OP_REQ: rpc_subscription, OP_COUNT: rpc_count},
+            logger,
+            stream_handlers={OP_REQ_STREAM: rpc_subscription_stream},
+        )
+        await app.rpc_server.start(
+            port=int(EVENT_HANDLER_RPC_PORT or 0), path=EVENT_HANDLER_RPC_SOCKET
+        )
 
     try:
         yield
     finally:
+        if app.rpc_server is not None:
+            await app.rpc_server.close()
+        for task in background_tasks:
+            task.cancel()
+        await app.sig_verifier.stop()
+        await app.event_batcher.stop()
         await app.write_pool.close()
-        await app.read_pool.close()
+        await app.replica_router.close()
+        await app.query_cache.close()
+        await app.redis_client.close()
 
 
 app = FastAPI(lifespan=lifespan)
 FastAPIInstrumentor.instrument_app(app)
+
+
+def sig_verify_cache_callback(_):
+    verifier = getattr(app, "sig_verifier", None)
+    if verifier is None:
+        return []
+    return [
+        Observation(verifier.cache_hits, {"result": "hit"}),
+        Observation(verifier.cache_misses, {"result": "miss"}),
+    ]
+
+
+otel_metrics.meter.create_observable_counter(
+    name="sig_verify_cache",
+    description="Signature verifications answered from the verified-signature cache",
+    callbacks=[sig_verify_cache_callback],
+)
+
+
+def query_cache_callback(_):
+    query_cache = getattr(app, "query_cache", None)
+    if query_cache is None:
+        return []
+    return [
+        Observation(query_cache.hits, {"result": "hit"}),
+        Observation(query_cache.misses, {"result": "miss"}),
+        Observation(query_cache.appends, {"result": "append"}),
+        Observation(query_cache.invalidations, {"result": "invalidate"}),
+        Observation(query_cache.pruned, {"result": "prune"}),
+        Observation(app.single_flight.coalesced, {"result": "coalesced"}),
+    ]
+
+
+otel_metrics.meter.create_observable_counter(
+    name="query_cache",
+    description="REQ result cache lookups and entries updated by new or deleted events",
+    callbacks=[query_cache_callback],
+)
+
+
+def event_cache_callback(_):
+    event_cache = getattr(app, "event_cache", None)
+    if event_cache is None:
+        return []
+    return [
+        Observation(event_cache.hits, {"result": "hit"}),
+        Observation(event_cache.misses, {"result": "miss"}),
+        Observation(event_cache.evictions, {"result": "evict"}),
+    ]
+
+
+otel_metrics.meter.create_observable_counter(
+    name="event_cache",
+    description="Event ID lookups answered from the in-process event cache",
+    callbacks=[event_cache_callback],
+)
+
+
+def replica_lag_callback(_):
+    router = getattr(app, "replica_router", None)
+    if router is None:
+        return []
+    in_rotation = router.in_rotation()
+    return [
+        Observation(
+            replica.lag_bytes,
+            {"replica": replica.name, "in_rotation": replica in in_rotation},
+        )
+        for replica in router.replicas
+    ]
+
+
+def primary_reads_callback(_):
+    router = getattr(app, "replica_router", None)
+    if router is None:
+        return []
+    return [Observation(router.primary_reads, {})]
+
+
+otel_metrics.meter.create_observable_gauge(
+    name="replica_lag",
+    description="WAL bytes each read replica had not replayed at its last probe",
+    unit="bytes",
+    callbacks=[replica_lag_callback],
+)
+otel_metrics.meter.create_observable_counter(
+    name="primary_reads",
+    description="Reads sent to the primary for read-your-writes or with no replica in rotation",
+    callbacks=[primary_reads_callback],
+)
 init_conn_str = get_conn_str("WRITE")
 
 
@@ -138,18 +393,126 @@ async def set_span_attributes(
     span.set_attribute("operation.name", operation_name)
 
 
-async def execute_sql_with_tracing(app, sql_query: str, span_name: str):
+async def execute_sql_with_tracing(
+    app,
+    sql_query: str,
+    span_name: str,
+    params: Optional[List] = None,
+    written_at: Optional[float] = None,
+):
     with tracer.start_as_current_span(span_name) as span:
         current_span = trace.get_current_span()
         await set_span_attributes(
             current_span, "postgresql", sql_query, "postgres", "postgres.query"
         )
-        async with app.read_pool.connection() as conn:
+        async with app.replica_router.pool(written_at).connection() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(query=sql_query)
+                # Compiled filters have a stable text per filter structure, so
+                # preparing them lets Postgres reuse the plan on each connection.
+                await cur.execute(sql_query, params, prepare=params is not None)
                 return await cur.fetchall()
 
 
+def event_line(row: Tuple) -> bytes:
+    """Returns the NDJSON line of an (id, created_at, kind, event JSON) result row."""
+    return row[3].encode() + b"\n"
+
+
+async def stream_sql_with_tracing(
+    app, sql_query: str, params: List, written_at: Optional[float] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yields the rows of a query as NDJSON lines, one event object per line.
+
+    Rows are read through a server-side cursor STREAM_FETCH_SIZE at a time,
+    so only one batch is held in memory and the first line is yielded as soon
+    as Postgres returns the first batch.
+    """
+    async with app.replica_router.pool(written_at).connection() as conn:
+        async with conn.cursor(name="subscription_stream") as cur:
+            cur.itersize = STREAM_FETCH_SIZE
+            with tracer.start_as_current_span("SELECT * FROM EVENTS") as span:
+                await set_span_attributes(
+                    span, "postgresql", sql_query, "postgres", "postgres.query"
+                )
+                await cur.execute(sql_query, params)
+            async for row in cur:
+                yield event_line(row)
+
+
+async def filter_rows(
+    app, subscription_obj: Subscription, filter_: Dict[str, Any]
+) -> AsyncIterator[Tuple]:
+    """
+    Yields the rows of one filter newest first, reading them in pages.
+
+    Every page is a QUERY_PAGE_SIZE index range scan that continues after the
+    (created_at, id) of the previous page's last event, so events sharing a
+    timestamp are neither skipped nor repeated. Searches are ranked and always
+    fit in one page, so that page is re-sorted by time instead.
+    """
+    remaining = effective_limit(filter_)
+    after = None
+    while remaining > 0:
+        page_size = min(QUERY_PAGE_SIZE, remaining)
+        sql_query, params = subscription_obj.compile_filter(
+            filter_, search_trigram=SEARCH_TRIGRAM, after=after, page_size=page_size
+        )
+        rows = await execute_sql_with_tracing(
+            app,
+            sql_query,
+            "SELECT * FROM EVENTS",
+            params,
+            written_at=subscription_obj.written_at,
+        )
+        if filter_.get("search"):
+            rows = sorted(rows, key=lambda row: (-row[1], row[0]))
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            break
+        remaining -= len(rows)
+        after = (rows[-1][1], rows[-1][0])
+
+
+async def paged_sql_with_tracing(
+    app, subscription_obj: Subscription
+) -> AsyncIterator[bytes]:
+    """
+    Yields the events of a REQ as NDJSON lines, reading each filter in pages.
+
+    The filters are paged independently and merged by created_at DESC, id, the
+    same order compile_req gives a REQ answered in one query. Each filter
+    still honours its own limit, and an event matching several filters is
+    sent once.
+    """
+    pages = [filter_rows(app, subscription_obj, f) for f in subscription_obj.filters]
+    heap = []
+    firsts = await asyncio.gather(*(anext(rows, None) for rows in pages))
+    for index, row in enumerate(firsts):
+        if row is not None:
+            heapq.heappush(heap, (-row[1], row[0], index, row))
+    last_id = None
+    while heap:
+        _, event_id, index, row = heapq.heappop(heap)
+        # Copies of one event sort next to each other, only send the first.
+        if event_id != last_id:
+            last_id = event_id
+            yield event_line(row)
+        row = await anext(pages[index], None)
+        if row is not None:
+            heapq.heappush(heap, (-row[1], row[0], index, row))
+
+
+async def publish_event(redis_client: redis.Redis, event_dict: Dict[str, Any]) -> None:
+    """Publishes an event on the full channel and its kind and author partitions."""
+    payload = orjson.dumps(event_dict)
+    pipe = redis_client.pipeline(transaction=False)
+    for channel in event_channels(event_dict):
+        pipe.publish(channel, payload)
+    await pipe.execute()
+
+
 async def get_redis_client() -> redis.Redis:
     """Lazily initialize and return an async Redis client."""
     return await redis.from_url(
@@ -158,9 +521,56 @@ async def get_redis_client() -> redis.Redis:
     )
 
 
+async def event_committed(
+    app: FastAPI, event_obj: Event, event_dict: Dict[str, Any]
+) -> None:
+    """
+    Records a stored event in the seen filter and caches, then publishes it.
+
+    The event is committed by the time this runs, so a failing step is only
+    logged: an error response would make the client retry into a duplicate.
+    """
+    try:
+        await app.seen_filter.add(event_obj.event_id)
+    except Exception as exc:
+        logger.error(f"Could not add event {event_obj.event_id} to seen filter: {exc}")
+    try:
+        app.query_cache.in_background(
+            app.query_cache.event_stored(event_dict, replaced=event_obj.replaced)
+        )
+        # A replaced version may still be cached under its own ID, so
+        # replaceable events are left to the database.
+        if not (event_obj.is_replaceable or event_obj.is_parameterized_replaceable):
+            app.event_cache.event_stored(event_dict)
+    except Exception as exc:
+        logger.error(f"Could not cache event {event_obj.event_id}: {exc}")
+    try:
+        await publish_event(app.redis_client, event_dict)
+    except Exception as exc:
+        logger.error(f"Could not publish event {event_obj.event_id}: {exc}")
+
+
+async def events_deleted(
+    app: FastAPI, event_ids: List[str], deleted: List[Dict[str, Any]]
+) -> None:
+    """Drops events removed by a committed deletion from the seen filter and caches."""
+    try:
+        await app.seen_filter.remove(event_ids)
+    except Exception as exc:
+        logger.error(f"Could not remove deleted events from seen filter: {exc}")
+    try:
+        app.query_cache.in_background(app.query_cache.events_deleted(deleted))
+        await app.event_cache.events_deleted([row["id"] for row in deleted])
+    except Exception as exc:
+        logger.error(f"Could not drop deleted events from the caches: {exc}")
+
+
 @app.post("/new_event")
 async def handle_new_event(request: Request) -> JSONResponse:
-    event_dict = orjson.loads(await request.body())
+    return await process_new_event(request.app, orjson.loads(await request.body()))
+
+
+async def process_new_event(app: FastAPI, event_dict: Dict[str, Any]) -> JSONResponse:
     event_obj = Event(
         event_id=event_dict["id"],
         pubkey=event_dict["pubkey"],
@@ -174,92 +584,153 @@ async def handle_new_event(request: Request) -> JSONResponse:
         f"New event loop iter, event id is {event_obj.event_id} and kind is {event_obj.kind}"
     )
 
+    try:
+        if await app.seen_filter.is_duplicate(event_obj.event_id):
+            increment_counter(
+                {"kind": event_obj.kind}, metric_counters["duplicate_skipped"]
+            )
+            return event_obj.evt_response(
+                results_status="false",
+                http_status_code=409,
+                message="duplicate: already have this event",
+            )
+    except Exception as exc:
+        logger.warning(f"Seen-ID filter lookup failed, using the database: {exc}")
+
+    policy_rejection = app.policy_cache.check(event_obj.pubkey, event_obj.kind)
+    if policy_rejection:
+        increment_counter(
+            {"kind": event_obj.kind}, metric_counters["policy_event_reject"]
+        )
+        return event_obj.evt_response(
+            results_status="false",
+            http_status_code=403,
+            message=policy_rejection,
+        )
+
     try:
         with tracer.start_as_current_span("add_event") as span:
             current_span = trace.get_current_span()
             current_span.set_attribute(SpanAttributes.DB_SYSTEM, "postgresql")
 
             # Verify signature for all events before proceeding
-            if not event_obj.verify_signature(logger):
+            if not await app.sig_verifier.verify(event_obj):
                 return event_obj.evt_response(
                     results_status="false",
                     http_status_code=400,
                     message="invalid: signature verification failed",
                 )
 
-            async with request.app.write_pool.connection() as conn:
-                async with conn.cursor() as cur:
-                    otel_tags = {
-                        "kind": event_obj.kind,
-                        "pubkey": event_obj.pubkey,
-                        "event_id": event_obj.event_id,
-                    }
-                    if WOT_ENABLED in ["True", "true"]:
-                        wot_check = await event_obj.check_wot(cur)
-                        if not wot_check:
-                            logger.debug(f"allow check failed: {wot_check}")
-                            increment_counter(
-                                otel_tags, metric_counters["wot_event_reject"]
-                            )
-                            return event_obj.evt_response(
-                                results_status="false",
-                                http_status_code=403,
-                                message="rejected: user is not in relay's web of trust",
-                            )
-
-                    redis_client = await get_redis_client()
-
-                    if event_obj.kind in [0, 3]:
-                        await event_obj.delete_check(conn, cur)
-                        await event_obj.add_event(conn, cur)
-                        await redis_client.publish(
-                            REDIS_CHANNEL, orjson.dumps(event_dict)
-                        )
-                        return event_obj.evt_response(
-                            results_status="true", http_status_code=200
+            # Ban/allow events of the admin update the allowlist, every
+            # replica's PolicyCache reloads on the announcement.
+            if event_obj.is_mgmt_event(ADMIN_PUBKEY):
+                async with app.write_pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        await event_obj.add_mgmt_event(conn, cur)
+                        message = await event_obj.parse_mgmt_event(
+                            conn, cur, app.redis_client
                         )
+                logger.info(f"Applied management event {event_obj.event_id}")
+                return event_obj.evt_response(
+                    results_status="true", http_status_code=200, message=message
+                )
+
+            otel_tags = {
+                "kind": event_obj.kind,
+                "pubkey": event_obj.pubkey,
+                "event_id": event_obj.event_id,
+            }
+            if WOT_ENABLED in ["True", "true"] and not app.trust_set.ready:
+                logger.warning(
+                    f"Trust network not loaded, rejecting event {event_obj.event_id}"
+                )
+                increment_counter(otel_tags, metric_counters["wot_event_reject"])
+                return event_obj.evt_response(
+                    results_status="false",
+                    http_status_code=503,
+                    message="error: web of trust is not loaded yet, try again later",
+                )
+            if (
+                WOT_ENABLED in ["True", "true"]
+                and event_obj.pubkey not in app.trust_set
+            ):
+                logger.debug(f"WoT check failed for {event_obj.pubkey}")
+                increment_counter(otel_tags, metric_counters["wot_event_reject"])
+                return event_obj.evt_response(
+                    results_status="false",
+                    http_status_code=403,
+                    message="rejected: user is not in relay's web of trust",
+                )
+
+            redis_client = app.redis_client
+
+            # Ephemeral events are only relayed to live subscribers, they never
+            # touch the write pool.
+            if event_obj.is_ephemeral:
+                await publish_event(redis_client, event_dict)
+                increment_counter(
+                    {"kind": event_obj.kind}, metric_counters["ephemeral_published"]
+                )
+                return event_obj.evt_response(
+                    results_status="true", http_status_code=200
+                )
+
+            if event_obj.is_replaceable or event_obj.is_parameterized_replaceable:
+                async with app.write_pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        written = await event_obj.upsert_replaceable(conn, cur)
+                if not written:
+                    logger.info(f"Newer version of event {event_obj.event_id} stored")
+                    return event_obj.evt_response(
+                        results_status="false",
+                        http_status_code=409,
+                        message="duplicate: already have a newer version of this event",
+                    )
+                increment_counter(otel_tags, metric_counters["event_added"])
+                await event_committed(app, event_obj, event_dict)
+                return event_obj.evt_response(
+                    results_status="true", http_status_code=200
+                )
 
-                    if event_obj.kind == 5:
-                        events_to_delete = event_obj.parse_kind5()
-                        await event_obj.delete_event(conn, cur, events_to_delete)
-                        return event_obj.evt_response(
-                            results_status="true", http_status_code=200
+            if event_obj.kind == 5:
+                events_to_delete = event_obj.parse_kind5()
+                async with app.write_pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        deleted = await event_obj.delete_event(
+                            conn, cur, events_to_delete
                         )
+                await events_deleted(app, events_to_delete, deleted)
+                return event_obj.evt_response(
+                    results_status="true", http_status_code=200
+                )
+
+            # Everything else goes through the group-commit queue, the
+            # connection is only held by the batch writer while it flushes.
+            try:
+                result = await app.event_batcher.submit(event_obj)
+            except Exception as exc:
+                logger.error(f"Exception adding event {exc}")
+                return event_obj.evt_response(
+                    results_status="false",
+                    http_status_code=400,
+                    message="error: failed to add event",
+                )
+
+            if result == BATCH_DUPLICATE:
+                logger.info(f"Event with ID {event_obj.event_id} already exists")
+                return event_obj.evt_response(
+                    results_status="false",
+                    http_status_code=409,
+                    message="duplicate: already have this event",
+                )
 
-                    else:
-                        try:
-                            await event_obj.add_event(conn, cur)
-                            increment_counter(otel_tags, metric_counters["event_added"])
-                            await redis_client.publish(
-                                REDIS_CHANNEL, orjson.dumps(event_dict)
-                            )
-                            logger.info(
-                                f"Published event {event_obj.event_id} to Redis"
-                            )
-                            return event_obj.evt_response(
-                                results_status="true", http_status_code=200
-                            )
-                        except psycopg.IntegrityError:
-                            await conn.rollback()
-                            logger.info(
-                                f"Event with ID {event_obj.event_id} already exists"
-                            )
-                            return event_obj.evt_response(
-                                results_status="false",
-                                http_status_code=409,
-                                message="duplicate: already have this event",
-                            )
-                        except Exception as exc:
-                            logger.error(f"Exception adding event {exc}")
-                            return event_obj.evt_response(
-                                results_status="false",
-                                http_status_code=400,
-                                message="error: failed to add event",
-                            )
+            increment_counter(otel_tags, metric_counters["event_added"])
+            await event_committed(app, event_obj, event_dict)
+            logger.info(f"Stored event {event_obj.event_id}")
+            return event_obj.evt_response(results_status="true", http_status_code=200)
 
     except Exception as exc:
         logger.debug(f"Exception while adding event to database: {exc}")
-        await conn.rollback()
         return event_obj.evt_response(
             results_status="false",
             http_status_code=500,
@@ -268,9 +739,79 @@ async def handle_new_event(request: Request) -> JSONResponse:
 
 
 @app.post("/subscription")
-async def handle_subscription(request: Request) -> JSONResponse:
+async def handle_subscription(request: Request) -> Response:
+    request_payload = orjson.loads(await request.body())
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        status, lines = await process_subscription_stream(request.app, request_payload)
+        return StreamingResponse(
+            lines, status_code=status, media_type=NDJSON_MEDIA_TYPE
+        )
+    return await process_subscription(request.app, request_payload)
+
+
+async def load_subscription(
+    app: FastAPI,
+    subscription_obj: Subscription,
+    sql_query: str,
+    params: List,
+    cache_key: str,
+) -> bytes:
+    """Runs a compiled REQ and caches its result as NDJSON, one event per line."""
+    if subscription_obj.needs_paging(subscription_obj.filters):
+        results = b"".join(
+            [line async for line in paged_sql_with_tracing(app, subscription_obj)]
+        )
+    else:
+        query_results = await execute_sql_with_tracing(
+            app,
+            sql_query,
+            "SELECT * FROM EVENTS",
+            params,
+            written_at=subscription_obj.written_at,
+        )
+        results = b"".join(event_line(row) for row in query_results)
+    await app.query_cache.set(cache_key, subscription_obj.filters, results)
+    return results
+
+
+async def lookup_events(
+    app: FastAPI, subscription_obj: Subscription, event_ids: List[str]
+) -> bytes:
+    """
+    Answers a REQ that only looks events up by ID from the event cache,
+    querying the events it misses and caching them. Events are returned as
+    NDJSON, newest first like any other REQ.
+    """
+    found = {}
+    missing = []
+    for event_id in event_ids:
+        entry = app.event_cache.get(event_id)
+        if entry is None:
+            missing.append(event_id)
+        else:
+            found[event_id] = entry
+    if missing:
+        sql_query, params = subscription_obj.compile_filter({"ids": missing})
+        rows = await execute_sql_with_tracing(
+            app,
+            sql_query,
+            "SELECT * FROM EVENTS",
+            params,
+            written_at=subscription_obj.written_at,
+        )
+        for row in rows:
+            event_id, created_at, kind, _ = row
+            line = event_line(row)
+            app.event_cache.add(event_id, kind, created_at, line)
+            found[event_id] = (created_at, line)
+    ordered = sorted(found.items(), key=lambda item: (-item[1][0], item[0]))
+    return b"".join(line for _, (_, line) in ordered)
+
+
+async def process_subscription(
+    app: FastAPI, request_payload: Dict[str, Any]
+) -> Response:
     try:
-        request_payload = orjson.loads(await request.body())
         logger.debug(f"Request payload is {request_payload}")
 
         subscription_obj = Subscription(request_payload)
@@ -281,64 +822,205 @@ async def handle_subscription(request: Request) -> JSONResponse:
                 "EOSE", subscription_obj.subscription_id, "", 204
             )
 
-        # Parse filters into query components in parallel
-        multi_filter = await asyncio.gather(
-            *(
-                subscription_obj.parse_filters(f, logger)
-                for f in subscription_obj.filters
+        event_ids = subscription_obj.id_lookup(subscription_obj.filters)
+        if event_ids is not None:
+            results = await lookup_events(app, subscription_obj, event_ids)
+            return subscription_obj.sub_ndjson_response_builder(
+                "EVENT", subscription_obj.subscription_id, results, 200
             )
+
+        sql_query, params = subscription_obj.compile_req(
+            subscription_obj.filters, search_trigram=SEARCH_TRIGRAM
         )
 
-        redis_client = await get_redis_client()
+        cache_key = app.query_cache.key_for(subscription_obj.filters, SEARCH_TRIGRAM)
+        if subscription_obj.written_at is not None:
+            # A client reading after its own write skips cached and in-flight
+            # results, which may predate the write.
+            results = await load_subscription(
+                app, subscription_obj, sql_query, params, cache_key
+            )
+        else:
+            results = await app.query_cache.get(cache_key)
+        if results is None:
+            # Identical REQs arriving together share one query and its result.
+            results = await app.single_flight.do(
+                cache_key,
+                lambda: load_subscription(
+                    app, subscription_obj, sql_query, params, cache_key
+                ),
+            )
+        if isinstance(results, str):
+            results = results.encode()
 
-        # Check cache in parallel
-        async def check_cache(filter_set):
-            cache_key = str(filter_set)
-            return cache_key, await redis_client.get(cache_key)
+        return subscription_obj.sub_ndjson_response_builder(
+            "EVENT", subscription_obj.subscription_id, results, 200
+        )
+    except (psycopg.Error, Exception) as exc:
+        logger.error(f"An error occurred: {exc}", exc_info=True)
+        return subscription_obj.sub_response_builder(
+            "EOSE", subscription_obj.subscription_id, "", 500
+        )
 
-        cache_results = await asyncio.gather(*(check_cache(f) for f in multi_filter))
 
-        # Separate cache hits and misses
-        cache_hits = [orjson.loads(res) for _, res in cache_results if res]
-        cache_misses = [
-            (key, f)
-            for key, res, f in zip(*zip(*cache_results), multi_filter)
-            if not res
-        ]
+async def lookup_lines(
+    app: FastAPI, subscription_obj: Subscription, event_ids: List[str]
+) -> AsyncIterator[bytes]:
+    results = await lookup_events(app, subscription_obj, event_ids)
+    if results:
+        yield results
 
-        # Query cache misses in the database
-        async def query_database(cache_key, filter_set):
-            sql_query = subscription_obj.base_query_builder(*filter_set, logger)
-            query_results = await execute_sql_with_tracing(
-                app, sql_query, "SELECT * FROM EVENTS"
-            )
-            parsed_results = await subscription_obj.query_result_parser(query_results)
-            await redis_client.setex(cache_key, 240, orjson.dumps(parsed_results))
-            return parsed_results
-
-        db_results = (
-            await asyncio.gather(*(query_database(key, f) for key, f in cache_misses))
-            if cache_misses
-            else []
+
+async def process_subscription_stream(
+    app: FastAPI, request_payload: Dict[str, Any]
+) -> Tuple[int, AsyncIterator[bytes]]:
+    """
+    Streaming variant of process_subscription.
+
+    Returns the status and an iterator of NDJSON lines, one event per line.
+    Cached results are sent as one chunk; otherwise rows are forwarded as the
+    server-side cursor reads them and cached once the query completes. A REQ
+    identical to one already streaming waits for that stream's result instead
+    of querying again, unless it reads after the client's own write. REQs
+    that only look events up by ID are answered from the event cache. EOSE
+    is left to the caller.
+    """
+    subscription_obj = Subscription(request_payload)
+    increment_counter({"stage": "pre-cache"}, metric_counters["event_added"])
+
+    async def no_lines() -> AsyncIterator[bytes]:
+        return
+        yield
+
+    try:
+        if not subscription_obj.filters:
+            return 204, no_lines()
+        event_ids = subscription_obj.id_lookup(subscription_obj.filters)
+        if event_ids is not None:
+            return 200, lookup_lines(app, subscription_obj, event_ids)
+        sql_query, params = subscription_obj.compile_req(
+            subscription_obj.filters, search_trigram=SEARCH_TRIGRAM
         )
+        cache_key = app.query_cache.key_for(subscription_obj.filters, SEARCH_TRIGRAM)
+        fresh = subscription_obj.written_at is not None
+        cached = None if fresh else await app.query_cache.get(cache_key)
+    except Exception as exc:
+        logger.error(f"An error occurred: {exc}", exc_info=True)
+        return 500, no_lines()
 
-        # Combine results
-        combined_results = [
-            result for res_list in cache_hits + db_results for result in res_list
-        ]
+    async def cached_lines() -> AsyncIterator[bytes]:
+        yield cached.encode()
+
+    async def shared_lines() -> AsyncIterator[bytes]:
+        results = await app.single_flight.do(
+            cache_key,
+            lambda: load_subscription(
+                app, subscription_obj, sql_query, params, cache_key
+            ),
+        )
+        yield results.encode() if isinstance(results, str) else results
 
-        await redis_client.close()
+    async def query_lines() -> AsyncIterator[bytes]:
+        sent = []
+        if subscription_obj.needs_paging(subscription_obj.filters):
+            lines = paged_sql_with_tracing(app, subscription_obj)
+        else:
+            lines = stream_sql_with_tracing(
+                app, sql_query, params, written_at=subscription_obj.written_at
+            )
+        leading = not app.single_flight.in_flight(cache_key)
+        if leading:
+            app.single_flight.lead(cache_key)
+        try:
+            async for line in lines:
+                sent.append(line)
+                yield line
+            results = b"".join(sent)
+            await app.query_cache.set(cache_key, subscription_obj.filters, results)
+        except BaseException as exc:
+            if isinstance(exc, psycopg.Error):
+                logger.error(f"Subscription stream failed: {exc}", exc_info=True)
+            if leading:
+                app.single_flight.land(cache_key, exc=exc)
+            raise
+        if leading:
+            app.single_flight.land(cache_key, results)
+
+    if cached is not None:
+        return 200, cached_lines()
+    if app.single_flight.in_flight(cache_key) and not fresh:
+        return 200, shared_lines()
+    return 200, query_lines()
+
+
+@app.post("/count")
+async def handle_count(request: Request) -> JSONResponse:
+    return await process_count(request.app, orjson.loads(await request.body()))
+
+
+async def process_count(app: FastAPI, request_payload: Dict[str, Any]) -> JSONResponse:
+    """
+    Answers a NIP-45 COUNT.
 
+    The result is sent as {"count": n}, with "approximate": true when a
+    bounded count stopped at COUNT_LIMIT.
+    """
+    subscription_obj = Subscription(request_payload)
+    try:
+        if not subscription_obj.filters:
+            return subscription_obj.sub_response_builder(
+                "COUNT", subscription_obj.subscription_id, {"count": 0}, 200
+            )
+        sql_query, params, bounded = subscription_obj.compile_count(
+            subscription_obj.filters,
+            search_trigram=SEARCH_TRIGRAM,
+            count_limit=COUNT_LIMIT,
+        )
+        rows = await execute_sql_with_tracing(
+            app,
+            sql_query,
+            "SELECT COUNT FROM EVENTS",
+            params,
+            written_at=subscription_obj.written_at,
+        )
+        result = {"count": rows[0][0]}
+        if bounded and result["count"] > COUNT_LIMIT:
+            result = {"count": COUNT_LIMIT, "approximate": True}
+        increment_counter(
+            {"verb": "COUNT", "source": "bounded" if bounded else "tag_counts"},
+            metric_counters["event_query"],
+        )
         return subscription_obj.sub_response_builder(
-            "EVENT", subscription_obj.subscription_id, combined_results, 200
+            "COUNT", subscription_obj.subscription_id, result, 200
         )
     except (psycopg.Error, Exception) as exc:
         logger.error(f"An error occurred: {exc}", exc_info=True)
         return subscription_obj.sub_response_builder(
-            "EOSE", subscription_obj.subscription_id, "", 500
+            "CLOSED", subscription_obj.subscription_id, "", 500
         )
 
 
+async def rpc_new_event(payload: bytes) -> Tuple[int, bytes]:
+    response = await process_new_event(app, orjson.loads(payload))
+    return response.status_code, response.body
+
+
+async def rpc_subscription(payload: bytes) -> Tuple[int, bytes]:
+    response = await process_subscription(app, orjson.loads(payload))
+    return response.status_code, response.body
+
+
+async def rpc_count(payload: bytes) -> Tuple[int, bytes]:
+    response = await process_count(app, orjson.loads(payload))
+    return response.status_code, response.body
+
+
+async def rpc_subscription_stream(
+    payload: bytes,
+) -> Tuple[int, AsyncIterator[bytes]]:
+    return await process_subscription_stream(app, orjson.loads(payload))
+
+
 if __name__ == "__main__":
     logger.info(f"Write conn string is: {get_conn_str('WRITE')}")
     logger.info(f"Read conn string is: {get_conn_str('READ')}")
@@ -1,10 +1,46 @@
+import time
+
 import psycopg
 
+# Partial index predicates for replaceable kinds. ON CONFLICT only infers a
+# partial unique index when given the same predicate, so the upsert in
+# event_classes reuses these strings verbatim.
+REPLACEABLE_PREDICATE = "kind IN (0, 3) OR (kind >= 10000 AND kind < 20000)"
+PARAM_REPLACEABLE_PREDICATE = "kind >= 30000 AND kind < 40000"
+
+# Access paths for the REQ filter shapes. Every index ends in created_at DESC
+# so ORDER BY created_at DESC LIMIT n walks the index instead of sorting.
+EVENT_INDEXES = {
+    "idx_events_created_at": "(created_at DESC)",
+    "idx_events_kind_created_at": "(kind, created_at DESC)",
+    "idx_events_pubkey_kind_created_at": "(pubkey, kind, created_at DESC)",
+    # NIP-50 search on the generated content_tsv column.
+    "idx_events_content_tsv": "USING GIN (content_tsv)",
+}
+# Substring fallback of NIP-50 search, built when SEARCH_TRIGRAM is enabled.
+TRIGRAM_INDEXES = {
+    "idx_events_content_trgm": "USING GIN (content gin_trgm_ops)",
+}
+# Single-column indexes created by older versions, covered by EVENT_INDEXES.
+SUPERSEDED_INDEXES = ("idx_pubkey", "idx_kind")
+INDEX_MIGRATION_LOCK = 0x6E6F7374
+
+# (kind, tag name) pairs whose per-value counts are kept in tag_counts for
+# NIP-45 COUNT: followers (#p of kind 3) and reactions (#e of kind 7).
+COUNTED_TAGS = ((3, "p"), (7, "e"))
+COUNTED_TAGS_PREDICATE = " OR ".join(
+    f"(kind = {kind} AND name = '{name}')" for kind, name in COUNTED_TAGS
+)
+
 
 def initialize_db(logger, write_str) -> None:
     """
     Initialize the database by creating the necessary tables if they don't exist,
-    and creating indexes on the pubkey and kind columns.
+    the unique indexes that back replaceable and parameterized replaceable
+    events, the event_tags table used by tag filters, the tag_counts table
+    used by NIP-45 COUNT and the content_tsv column searched by NIP-50.
+
+    Query and search indexes on the events table are built by migrate_indexes.
 
     """
     try:
@@ -26,15 +62,201 @@ def initialize_db(logger, write_str) -> None:
                 """
             )
 
-            index_columns = ["pubkey", "kind"]
-            for column in index_columns:
+            cur.execute("ALTER TABLE events ADD COLUMN IF NOT EXISTS d_tag TEXT;")
+            cur.execute(
+                "SELECT to_regclass('idx_replaceable'), to_regclass('idx_param_replaceable');"
+            )
+            has_replaceable_idx, has_param_replaceable_idx = cur.fetchone()
+
+            # Older versions stored every revision of most replaceable kinds,
+            # keep only the newest one so the unique indexes can be built.
+            if not has_replaceable_idx:
+                cur.execute(
+                    """
+                    DELETE FROM events AS older USING events AS newer
+                    WHERE older.pubkey = newer.pubkey
+                      AND older.kind = newer.kind
+                      AND (older.kind IN (0, 3)
+                           OR (older.kind >= 10000 AND older.kind < 20000))
+                      AND (older.created_at < newer.created_at
+                           OR (older.created_at = newer.created_at
+                               AND older.id > newer.id));
+                    """
+                )
+                cur.execute(
+                    f"""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_replaceable
+                    ON events (pubkey, kind) WHERE {REPLACEABLE_PREDICATE};
+                    """
+                )
+
+            if not has_param_replaceable_idx:
+                cur.execute(
+                    f"""
+                    UPDATE events SET d_tag = COALESCE(
+                        (SELECT elem->>1 FROM jsonb_array_elements(tags) AS elem
+                         WHERE elem->>0 = 'd' LIMIT 1),
+                        ''
+                    )
+                    WHERE ({PARAM_REPLACEABLE_PREDICATE}) AND d_tag IS NULL;
+                    """
+                )
+                cur.execute(
+                    """
+                    DELETE FROM events AS older USING events AS newer
+                    WHERE older.pubkey = newer.pubkey
+                      AND older.kind = newer.kind
+                      AND older.d_tag = newer.d_tag
+                      AND older.kind >= 30000 AND older.kind < 40000
+                      AND (older.created_at < newer.created_at
+                           OR (older.created_at = newer.created_at
+                               AND older.id > newer.id));
+                    """
+                )
+                cur.execute(
+                    f"""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_param_replaceable
+                    ON events (pubkey, kind, d_tag) WHERE {PARAM_REPLACEABLE_PREDICATE};
+                    """
+                )
+
+            # Single-letter tags are normalized into event_tags so #e/#p/#t
+            # filters can use a btree instead of scanning every row's JSON.
+            cur.execute("SELECT to_regclass('event_tags');")
+            has_event_tags = cur.fetchone()[0] is not None
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS event_tags (
+                    event_id VARCHAR(255) NOT NULL REFERENCES events (id)
+                        ON DELETE CASCADE ON UPDATE CASCADE,
+                    name TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at INTEGER,
+                    kind INTEGER,
+                    PRIMARY KEY (event_id, name, value)
+                );
+                """
+            )
+            cur.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_event_tags_lookup
+                ON event_tags (name, value, created_at DESC);
+                """
+            )
+            if not has_event_tags:
+                cur.execute(
+                    """
+                    INSERT INTO event_tags (event_id, name, value, created_at, kind)
+                    SELECT events.id, elem->>0, elem->>1, events.created_at, events.kind
+                    FROM events
+                    CROSS JOIN LATERAL jsonb_array_elements(
+                        CASE WHEN jsonb_typeof(events.tags) = 'array'
+                             THEN events.tags ELSE '[]'::jsonb END
+                    ) AS elem
+                    WHERE jsonb_typeof(elem) = 'array'
+                      AND length(elem->>0) = 1
+                      AND elem->>1 IS NOT NULL
+                    ON CONFLICT DO NOTHING;
+                    """
+                )
+                logger.info(f"Backfilled {cur.rowcount} rows into event_tags")
+
+            # Statement-level triggers keep tag_counts in step with event_tags,
+            # including rows removed by the cascade when an event is deleted.
+            cur.execute("SELECT to_regclass('tag_counts');")
+            has_tag_counts = cur.fetchone()[0] is not None
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tag_counts (
+                    kind INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    count BIGINT NOT NULL,
+                    PRIMARY KEY (kind, name, value)
+                );
+                """
+            )
+            cur.execute(
+                f"""
+                CREATE OR REPLACE FUNCTION tag_counts_insert() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO tag_counts (kind, name, value, count)
+                    SELECT kind, name, value, count(*) FROM changed_tags
+                    WHERE {COUNTED_TAGS_PREDICATE}
+                    GROUP BY kind, name, value
+                    ORDER BY kind, name, value
+                    ON CONFLICT (kind, name, value)
+                    DO UPDATE SET count = tag_counts.count + EXCLUDED.count;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                """
+            )
+            cur.execute(
+                f"""
+                CREATE OR REPLACE FUNCTION tag_counts_delete() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE tag_counts SET count = tag_counts.count - removed.count
+                    FROM (
+                        SELECT kind, name, value, count(*) AS count FROM changed_tags
+                        WHERE {COUNTED_TAGS_PREDICATE}
+                        GROUP BY kind, name, value
+                    ) AS removed
+                    WHERE tag_counts.kind = removed.kind
+                      AND tag_counts.name = removed.name
+                      AND tag_counts.value = removed.value;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                """
+            )
+            cur.execute(
+                """
+                CREATE OR REPLACE TRIGGER event_tags_count_insert
+                AFTER INSERT ON event_tags
+                REFERENCING NEW TABLE AS changed_tags
+                FOR EACH STATEMENT EXECUTE FUNCTION tag_counts_insert();
+                """
+            )
+            cur.execute(
+                """
+                CREATE OR REPLACE TRIGGER event_tags_count_delete
+                AFTER DELETE ON event_tags
+                REFERENCING OLD TABLE AS changed_tags
+                FOR EACH STATEMENT EXECUTE FUNCTION tag_counts_delete();
+                """
+            )
+            if not has_tag_counts:
                 cur.execute(
                     f"""
-                    CREATE INDEX IF NOT EXISTS idx_{str(column)}
-                    ON events ({str(column)});
+                    INSERT INTO tag_counts (kind, name, value, count)
+                    SELECT kind, name, value, count(*) FROM event_tags
+                    WHERE {COUNTED_TAGS_PREDICATE}
+                    GROUP BY kind, name, value
+                    ON CONFLICT DO NOTHING;
                     """
                 )
+                logger.info(f"Backfilled {cur.rowcount} rows into tag_counts")
 
+            # NIP-50 search matches a generated tsvector of the content and the
+            # hashtag (t) values. Adding the column rewrites the table once,
+            # holding writes on an existing relay until it is done; its GIN
+            # index is built concurrently by migrate_indexes.
+            cur.execute(
+                """
+                ALTER TABLE events ADD COLUMN IF NOT EXISTS content_tsv tsvector
+                GENERATED ALWAYS AS (
+                    to_tsvector('simple', coalesce(content, ''))
+                    || jsonb_to_tsvector(
+                        'simple',
+                        jsonb_path_query_array(
+                            coalesce(tags, '[]'::jsonb), '$[*] ? (@[0] == "t")[1]'
+                        ),
+                        '["string"]'
+                    )
+                ) STORED;
+                """
+            )
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS event_mgmt (
@@ -66,3 +288,64 @@ def initialize_db(logger, write_str) -> None:
         logger.info("Database initialization complete.")
     except psycopg.Error as caught_error:
         logger.info(f"Error occurred during database initialization: {caught_error}")
+
+
+def _build_index(conn, logger, name: str, definition: str, invalid) -> None:
+    if name in invalid:
+        logger.warning(f"Rebuilding invalid index {name}")
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+    start = time.monotonic()
+    conn.execute(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON events {definition};"
+    )
+    logger.debug(f"Index {name} ready in {time.monotonic() - start:.1f}s")
+
+
+def migrate_indexes(logger, write_str, search_trigram: bool = False) -> None:
+    """
+    Builds EVENT_INDEXES with CREATE INDEX CONCURRENTLY, so reads and writes
+    continue while a large events table is indexed, then drops the superseded
+    single-column indexes. With search_trigram the pg_trgm extension and
+    TRIGRAM_INDEXES are built the same way for substring searches.
+
+    An advisory lock keeps replicas starting at the same time from running the
+    migration twice. Indexes left invalid by an interrupted build are dropped
+    and rebuilt.
+    """
+    try:
+        with psycopg.connect(write_str, autocommit=True) as conn:
+            locked = conn.execute(
+                "SELECT pg_try_advisory_lock(%s);", (INDEX_MIGRATION_LOCK,)
+            ).fetchone()[0]
+            if not locked:
+                logger.info("Index migration is running on another replica")
+                return
+
+            invalid = {
+                row[0]
+                for row in conn.execute(
+                    """
+                    SELECT index_class.relname
+                    FROM pg_index
+                    JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid
+                    WHERE pg_index.indrelid = 'events'::regclass
+                      AND NOT pg_index.indisvalid;
+                    """
+                )
+            }
+            for name, definition in EVENT_INDEXES.items():
+                _build_index(conn, logger, name, definition, invalid)
+
+            if search_trigram:
+                try:
+                    conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                    for name, definition in TRIGRAM_INDEXES.items():
+                        _build_index(conn, logger, name, definition, invalid)
+                except psycopg.Error as exc:
+                    logger.warning(f"Trigram search index not created: {exc}")
+
+            for name in SUPERSEDED_INDEXES:
+                conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        logger.info("Index migration complete.")
+    except psycopg.Error as caught_error:
+        logger.error(f"Error occurred during index migration: {caught_error}")
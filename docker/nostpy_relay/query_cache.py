@@ -0,0 +1,459 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+import orjson
+import redis.asyncio as redis
+
+from event_classes import effective_limit
+from utils import filter_matches_event
+
+EVENT_KEYS = ("id", "pubkey", "kind", "created_at", "tags", "content", "sig")
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+Results = Union[str, bytes]
+
+
+def _normalize_filter(filter_: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for key, value in filter_.items():
+        if isinstance(value, list):
+            try:
+                value = sorted(set(value))
+            except TypeError:
+                pass
+        normalized[key] = value
+    normalized["limit"] = effective_limit(filter_)
+    return normalized
+
+
+def canonical_filters(filters: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Returns REQ filters in a canonical form.
+
+    Key order, the order and repetition of list values, limits above the cap
+    and the order of the filters themselves do not change the query result, so
+    they are normalized away.
+    """
+    unique = {
+        orjson.dumps(_normalize_filter(f), option=orjson.OPT_SORT_KEYS): f
+        for f in filters
+    }
+    return [_normalize_filter(unique[key]) for key in sorted(unique)]
+
+
+def filter_dependencies(filter_: Dict[str, Any]) -> Set[str]:
+    """
+    Returns the dependency tokens a cached filter is indexed under.
+
+    Every event the filter can match carries one of the tokens, so one
+    dimension is enough: ids, then authors, then kinds, then the single-letter
+    tag with the fewest values. Anything else depends on every event.
+    """
+    if filter_.get("ids"):
+        return {f"id:{value}" for value in filter_["ids"]}
+    if filter_.get("authors"):
+        return {f"author:{value}" for value in filter_["authors"]}
+    if filter_.get("kinds"):
+        return {f"kind:{value}" for value in filter_["kinds"]}
+    tag_keys = [
+        key for key in filter_ if len(key) == 2 and key[0] == "#" and filter_[key]
+    ]
+    if tag_keys:
+        key = min(tag_keys, key=lambda k: len(filter_[k]))
+        return {f"tag:{key[1]}:{value}" for value in filter_[key]}
+    return {"all"}
+
+
+def event_dependencies(event: Dict[str, Any]) -> Set[str]:
+    """Returns every dependency token a stored or deleted event touches."""
+    tokens = {
+        "all",
+        f"id:{event['id']}",
+        f"author:{event['pubkey']}",
+        f"kind:{event['kind']}",
+    }
+    for tag in event.get("tags") or []:
+        if (
+            isinstance(tag, list)
+            and len(tag) >= 2
+            and isinstance(tag[0], str)
+            and len(tag[0]) == 1
+        ):
+            tokens.add(f"tag:{tag[0]}:{tag[1]}")
+    return tokens
+
+
+class QueryCache:
+    """
+    Redis cache of REQ results with event-driven invalidation.
+
+    Entries are keyed by a hash of the canonical filters and hold the NDJSON
+    result next to the filters that produced it. A dependency index maps
+    ids, authors, kinds and tag values to the entries that depend on them.
+    When an event is stored or deleted, only the entries reachable from its
+    tokens are checked, and only those whose filters match the event change:
+    single-filter results without a search have a new event merged in place,
+    every other match is dropped. The TTL bounds how long a result written by
+    a query that raced an invalidation can stay stale.
+
+    Dependency sets are rotated every TTL: an entry is indexed in the set of
+    the bucket it was written in, which expires at a fixed time two buckets
+    later, when every entry it lists has expired. Invalidation only reads the
+    current and previous buckets, removes keys whose entry is gone from them,
+    and runs in the background through in_background so writes do not wait
+    for it.
+
+    Attributes:
+        redis_client: Async Redis client holding the entries and index sets.
+        ttl (int): Seconds an entry lives, 0 disables the cache.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to query the database.
+        appends (int): Entries updated in place with a new event.
+        invalidations (int): Entries dropped because a matching event changed.
+        pruned (int): Expired entries removed from the dependency sets.
+
+    Methods:
+        key_for: Returns the cache key of a REQ.
+        get: Returns the cached NDJSON result of a key, if any.
+        set: Stores a result and indexes it by its dependencies.
+        event_stored: Updates the entries affected by a newly stored event.
+        events_deleted: Drops the entries affected by deleted or replaced events.
+        in_background: Runs an update without making the caller wait for it.
+        close: Waits for the updates still running.
+    """
+
+    def __init__(
+        self, redis_client, logger, ttl: int = 240, key_prefix: str = "qcache"
+    ) -> None:
+        self.redis_client = redis_client
+        self.logger = logger
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self.appends = 0
+        self.invalidations = 0
+        self.pruned = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def key_for(self, filters: List[Dict[str, Any]], search_trigram: bool) -> str:
+        digest = hashlib.sha256(
+            orjson.dumps(
+                [search_trigram, canonical_filters(filters)],
+                option=orjson.OPT_SORT_KEYS,
+            )
+        ).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    def _bucket(self) -> int:
+        return int(time.time() // self.ttl)
+
+    def _dependency_key(self, bucket: int, token: str) -> str:
+        return f"{self.key_prefix}_dep:{bucket}:{token}"
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            cached = await self.redis_client.hget(key, "results")
+        except redis.RedisError as exc:
+            self.logger.warning(f"Query cache lookup failed: {exc}")
+            cached = None
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached
+
+    async def set(
+        self, key: str, filters: List[Dict[str, Any]], results: bytes
+    ) -> None:
+        if not self.enabled:
+            return
+        canonical = canonical_filters(filters)
+        tokens = set().union(*(filter_dependencies(f) for f in canonical))
+        bucket = self._bucket()
+        # Entries written during this bucket expire before the end of the
+        # next one. The deadline is fixed, so later writes do not extend it.
+        expires_at = (bucket + 2) * self.ttl
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(
+                key, mapping={"results": results, "filters": orjson.dumps(canonical)}
+            )
+            pipe.expire(key, self.ttl)
+            for token in tokens:
+                dependency_key = self._dependency_key(bucket, token)
+                pipe.sadd(dependency_key, key)
+                pipe.expireat(dependency_key, expires_at)
+            await pipe.execute()
+        except redis.RedisError as exc:
+            self.logger.warning(f"Query cache write failed: {exc}")
+
+    async def event_stored(
+        self, event: Dict[str, Any], replaced: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Updates the entries a newly stored event belongs to.
+
+        A replaceable event that superseded a stored version may have to
+        disappear from results, so entries matching either version are dropped.
+        """
+        if replaced:
+            await self.events_deleted([event, replaced])
+        else:
+            await self._apply([event], append=True)
+
+    async def events_deleted(self, events: List[Dict[str, Any]]) -> None:
+        await self._apply(events, append=False)
+
+    def in_background(self, update: Awaitable[None]) -> None:
+        task = asyncio.create_task(update)
+        self._tasks.add(task)
+        task.add_done_callback(self._update_done)
+
+    def _update_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Query cache update failed: {task.exception()}")
+
+    async def close(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _apply(self, events: List[Dict[str, Any]], append: bool) -> None:
+        if not self.enabled or not events:
+            return
+        tokens = set().union(*(event_dependencies(e) for e in events))
+        bucket = self._bucket()
+        # Entries indexed in older buckets have expired.
+        dependency_keys = [
+            self._dependency_key(b, token)
+            for token in tokens
+            for b in (bucket - 1, bucket)
+        ]
+        try:
+            keys = list(await self.redis_client.sunion(dependency_keys))
+            if not keys:
+                return
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hget(key, "filters")
+            entries = await pipe.execute()
+
+            expired, dropped, appendable = [], [], []
+            for key, raw_filters in zip(keys, entries):
+                if raw_filters is None:
+                    expired.append(key)
+                    continue
+                filters = orjson.loads(raw_filters)
+                if not any(filter_matches_event(f, e) for f in filters for e in events):
+                    continue
+                if append and len(filters) == 1 and not filters[0].get("search"):
+                    appendable.append((key, filters[0]))
+                else:
+                    dropped.append(key)
+
+            merged = await asyncio.gather(
+                *(self._merge(key, filter_, events[0]) for key, filter_ in appendable)
+            )
+            self.appends += sum(merged)
+            dropped += [key for (key, _), ok in zip(appendable, merged) if not ok]
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            if dropped:
+                pipe.delete(*dropped)
+            if expired or dropped:
+                for dependency_key in dependency_keys:
+                    pipe.srem(dependency_key, *expired, *dropped)
+            await pipe.execute()
+            self.invalidations += len(dropped)
+            self.pruned += len(expired)
+        except redis.RedisError as exc:
+            self.logger.warning(f"Query cache invalidation failed: {exc}")
+
+    async def _merge(
+        self, key: str, filter_: Dict[str, Any], event: Dict[str, Any]
+    ) -> bool:
+        return await self.redis_client.transaction(
+            lambda pipe: self._merge_event(pipe, key, filter_, event),
+            key,
+            value_from_callable=True,
+        )
+
+    async def _merge_event(
+        self, pipe, key: str, filter_: Dict[str, Any], event: Dict[str, Any]
+    ) -> bool:
+        results = await pipe.hget(key, "results")
+        if results is None:
+            return False
+        lines = results.splitlines()
+        stored = [orjson.loads(line) for line in lines]
+        if any(stored_event["id"] == event["id"] for stored_event in stored):
+            return True
+        # Results are ordered like the query, created_at DESC and then id.
+        order = (-event["created_at"], event["id"])
+        position = next(
+            (
+                i
+                for i, stored_event in enumerate(stored)
+                if (-stored_event["created_at"], stored_event["id"]) > order
+            ),
+            len(lines),
+        )
+        if position >= filter_["limit"]:
+            return True
+        lines.insert(position, orjson.dumps({k: event[k] for k in EVENT_KEYS}).decode())
+        pipe.multi()
+        pipe.hset(
+            key,
+            "results",
+            "".join(f"{line}\n" for line in lines[: filter_["limit"]]),
+        )
+        return True
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent loads of the same REQ result.
+
+    Within a process, the first caller for a cache key leads the query and
+    every caller arriving while it runs awaits the same future. With lock_ms
+    set, the leader also takes a short Redis lock (SET NX PX) so leaders on
+    other instances wait for the result to appear in the query cache instead
+    of running the query again. A waiter whose lock expires before the result
+    shows up runs the query itself.
+
+    Attributes:
+        redis_client: Async Redis client holding the locks.
+        query_cache (QueryCache): Cache the leaders write their result to.
+        lock_ms (int): Lifetime of the cluster-wide lock, 0 keeps coalescing local.
+        poll_interval (float): Seconds between cache checks while another instance leads.
+        coalesced (int): Callers served by a query another caller ran.
+
+    Methods:
+        do: Returns the result of a key, running load only if no one else is.
+        in_flight: Returns True if a local query for the key is running.
+        lead: Registers the caller as the local leader of a key.
+        land: Resolves a key led with lead, waking up the callers waiting on it.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        logger,
+        query_cache: QueryCache,
+        lock_ms: int = 0,
+        poll_interval: float = 0.02,
+    ) -> None:
+        self.redis_client = redis_client
+        self.logger = logger
+        self.query_cache = query_cache
+        self.lock_ms = lock_ms
+        self.poll_interval = poll_interval
+        self.coalesced = 0
+        self.flights: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self.flights
+
+    def lead(self, key: str) -> None:
+        flight = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting when the leader fails.
+        flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.flights[key] = flight
+
+    def land(
+        self,
+        key: str,
+        result: Optional[Results] = None,
+        exc: Optional[BaseException] = None,
+    ) -> None:
+        flight = self.flights.pop(key, None)
+        if flight is None or flight.done():
+            return
+        if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            # Waiters retry and one of them leads a new query.
+            flight.cancel()
+        elif exc is not None:
+            flight.set_exception(exc)
+        else:
+            flight.set_result(result)
+
+    async def do(self, key: str, load: Callable[[], Awaitable[Results]]) -> Results:
+        while key in self.flights:
+            flight = self.flights[key]
+            try:
+                result = await asyncio.shield(flight)
+                self.coalesced += 1
+                return result
+            except asyncio.CancelledError:
+                # A cancelled leader only means the next caller has to lead.
+                if not flight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        self.lead(key)
+        try:
+            result = await self._load(key, load)
+        except BaseException as exc:
+            self.land(key, exc=exc)
+            raise
+        self.land(key, result)
+        return result
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[Results]]) -> Results:
+        if self.lock_ms <= 0 or not self.query_cache.enabled:
+            return await load()
+
+        lock_key = f"{key}:lock"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.redis_client.set(
+                lock_key, token, nx=True, px=self.lock_ms
+            )
+        except redis.RedisError as exc:
+            self.logger.warning(f"Single-flight lock failed: {exc}")
+            return await load()
+
+        if not acquired:
+            cached = await self._wait_for_peer(key, lock_key)
+            if cached is not None:
+                self.coalesced += 1
+                return cached
+            return await load()
+
+        try:
+            return await load()
+        finally:
+            try:
+                await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except redis.RedisError as exc:
+                self.logger.warning(f"Single-flight unlock failed: {exc}")
+
+    async def _wait_for_peer(self, key: str, lock_key: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ms / 1000
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hget(key, "results")
+                pipe.exists(lock_key)
+                cached, locked = await pipe.execute()
+            except redis.RedisError:
+                return None
+            if cached is not None or not locked:
+                return cached
+        return None
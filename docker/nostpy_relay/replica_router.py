@@ -0,0 +1,179 @@
+import asyncio
+import random
+import time
+from typing import List, Optional, Tuple
+
+
+def parse_replicas(spec: str, default_port: str) -> List[Tuple[str, str, float]]:
+    """
+    Parses a comma separated list of host[:port[:weight]] read replicas.
+
+    Returns:
+        List[Tuple[str, str, float]]: The host, port and weight of each replica.
+
+    Raises:
+        ValueError: If a weight is not a positive number.
+    """
+    replicas = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, rest = entry.partition(":")
+        port, _, weight = rest.partition(":")
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError(f"Replica {entry} must have a positive weight")
+        replicas.append((host, port or default_port, weight))
+    return replicas
+
+
+class Replica:
+    """
+    A read replica and the state of its last probe.
+
+    Attributes:
+        name (str): host:port of the replica, used in logs.
+        pool: Connection pool of the replica.
+        weight (float): Share of the reads the replica receives while in rotation.
+        healthy (bool): Whether the last probe succeeded.
+        lag_bytes (int): WAL the replica had not replayed at the last probe.
+        caught_up_at (float): Wall time before which every write had been replayed.
+    """
+
+    def __init__(self, name: str, pool, weight: float = 1.0) -> None:
+        self.name = name
+        self.pool = pool
+        self.weight = weight
+        self.healthy = True
+        self.lag_bytes = 0
+        self.caught_up_at = 0.0
+
+
+class ReplicaRouter:
+    """
+    Spreads read queries over weighted read replicas, away from lagging ones.
+
+    A probe loop compares the WAL position of the primary with the position
+    each replica has replayed. Replicas that fail the probe or lag by more
+    than max_lag_bytes leave the rotation until a later probe finds them
+    healthy again; reads go to the primary while no replica is in rotation.
+    A server that is not in recovery is the primary or a standalone
+    database and never lags.
+
+    A read may carry the time of the client's last write. It is then sent to
+    a replica whose last probe showed it had replayed everything written
+    before that time, or to the primary, so a client reads its own events.
+    That time comes from the websocket handler's clock while the probes use
+    this process's clock, so a replica must have caught up clock_skew seconds
+    past it before it is trusted with the read.
+
+    Attributes:
+        primary: Connection pool of the primary.
+        replicas (List[Replica]): The read replicas.
+        max_lag_bytes (int): Replay lag above which a replica leaves the rotation.
+        check_interval (float): Seconds between probes.
+        probe_timeout (float): Seconds a probe waits for a replica connection.
+        clock_skew (float): Seconds the clocks of the relay's hosts may differ by.
+
+    Methods:
+        pool: Returns the pool a read should use.
+        check: Probes the health and replay lag of every replica.
+        check_loop: Probes the replicas every check_interval seconds.
+        close: Closes the replica pools.
+    """
+
+    def __init__(
+        self,
+        primary,
+        replicas: List[Replica],
+        logger,
+        max_lag_bytes: int = 16777216,
+        check_interval: float = 5,
+        probe_timeout: float = 2,
+        clock_skew: float = 1,
+    ) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.logger = logger
+        self.max_lag_bytes = max_lag_bytes
+        self.check_interval = check_interval
+        self.probe_timeout = probe_timeout
+        self.clock_skew = clock_skew
+        self.primary_reads = 0
+
+    def in_rotation(self) -> List[Replica]:
+        return [
+            replica
+            for replica in self.replicas
+            if replica.healthy and replica.lag_bytes <= self.max_lag_bytes
+        ]
+
+    def pool(self, written_at: Optional[float] = None):
+        candidates = self.in_rotation()
+        if written_at is not None:
+            caught_up = written_at + self.clock_skew
+            candidates = [r for r in candidates if r.caught_up_at >= caught_up]
+        if not candidates:
+            self.primary_reads += 1
+            return self.primary
+        if len(candidates) == 1:
+            return candidates[0].pool
+        weights = [replica.weight for replica in candidates]
+        return random.choices(candidates, weights=weights)[0].pool
+
+    async def check(self) -> None:
+        # A replica whose replay position reaches the primary's position read
+        # here has replayed every write committed before probe_started.
+        probe_started = time.time()
+        try:
+            async with self.primary.connection(timeout=self.probe_timeout) as conn:
+                cur = await conn.execute("SELECT pg_current_wal_lsn()::text")
+                primary_lsn = (await cur.fetchone())[0]
+        except Exception as exc:
+            self.logger.error(f"Could not read the primary WAL position: {exc}")
+            return
+        await asyncio.gather(
+            *(self._probe(r, primary_lsn, probe_started) for r in self.replicas)
+        )
+
+    async def _probe(
+        self, replica: Replica, primary_lsn: str, probe_started: float
+    ) -> None:
+        was_in_rotation = replica in self.in_rotation()
+        try:
+            async with replica.pool.connection(timeout=self.probe_timeout) as conn:
+                cur = await conn.execute(
+                    "SELECT pg_is_in_recovery(), "
+                    "pg_wal_lsn_diff(%s::pg_lsn, pg_last_wal_replay_lsn())",
+                    [primary_lsn],
+                )
+                in_recovery, lag_bytes = await cur.fetchone()
+            replica.healthy = True
+            replica.lag_bytes = max(int(lag_bytes or 0), 0) if in_recovery else 0
+            if replica.lag_bytes == 0:
+                replica.caught_up_at = probe_started
+        except Exception as exc:
+            if replica.healthy:
+                self.logger.error(f"Replica {replica.name} failed its probe: {exc}")
+            replica.healthy = False
+
+        if was_in_rotation and replica not in self.in_rotation():
+            self.logger.warning(
+                f"Replica {replica.name} left the rotation "
+                f"(healthy={replica.healthy}, lag={replica.lag_bytes} bytes)"
+            )
+        elif not was_in_rotation and replica in self.in_rotation():
+            self.logger.info(f"Replica {replica.name} rejoined the rotation")
+
+    async def check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception as exc:
+                self.logger.error(f"Replica check failed: {exc}")
+
+    async def close(self) -> None:
+        for replica in self.replicas:
+            await replica.pool.close()
@@ -0,0 +1,427 @@
+"""
+Length-prefixed, multiplexed RPC between the websocket handler and the event handler.
+
+Every frame is:
+
+    uint32 length | uint32 request_id | uint8 op | uint16 status | payload
+
+`length` counts everything after itself. Requests carry status 0, responses
+carry an HTTP style status code, and the payload is the same JSON body the
+HTTP endpoints exchange. Request IDs let the client pipeline any number of
+requests on one connection and match responses that come back out of order.
+
+Streaming ops answer with any number of STREAM_CHUNK frames, each holding
+part of the body, followed by one RESPONSE frame with the final status and an
+empty payload. The server sends at most STREAM_WINDOW chunks ahead of the
+client, which grants more with STREAM_CREDIT frames (payload: uint32 count)
+as it consumes them, and sends STREAM_CANCEL if it stops reading early.
+
+A connection starts with a HELLO exchange in which both sides announce the
+protocol version and the ops they support; the client falls back to HTTP if
+the versions differ or the server is unreachable. A request whose frame was
+already sent when the connection failed may have been applied by the server,
+so it fails with RPCRequestFailed instead and is not replayed over HTTP.
+"""
+
+import asyncio
+import itertools
+import struct
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+PROTOCOL_VERSION = 2
+
+OP_HELLO = 0
+OP_EVENT = 1
+OP_REQ = 2
+OP_REQ_STREAM = 3
+OP_COUNT = 4
+OP_RESPONSE = 0x80
+OP_STREAM_CHUNK = 0x81
+OP_STREAM_CREDIT = 0x82
+OP_STREAM_CANCEL = 0x83
+
+HEADER = struct.Struct("!IIBH")
+LENGTH = struct.Struct("!I")
+CREDIT = struct.Struct("!I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+STREAM_WINDOW = 16
+
+Handler = Callable[[bytes], Awaitable[Tuple[int, bytes]]]
+StreamHandler = Callable[[bytes], Awaitable[Tuple[int, AsyncIterator[bytes]]]]
+
+
+class RPCUnavailable(Exception):
+    """Raised when a request cannot be served over RPC and HTTP should be used instead."""
+
+
+class RPCRequestFailed(Exception):
+    """Raised when the connection failed after a request was sent, so it may have been applied."""
+
+
+def encode_frame(request_id: int, op: int, status: int, payload: bytes) -> bytes:
+    return (
+        HEADER.pack(HEADER.size - LENGTH.size + len(payload), request_id, op, status)
+        + payload
+    )
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, int, bytes]:
+    header = await reader.readexactly(HEADER.size)
+    length, request_id, op, status = HEADER.unpack(header)
+    payload_size = length - (HEADER.size - LENGTH.size)
+    if payload_size < 0 or payload_size > MAX_FRAME_SIZE:
+        raise ValueError(f"Invalid RPC frame size {length}")
+    payload = await reader.readexactly(payload_size)
+    return request_id, op, status, payload
+
+
+class RPCServer:
+    """
+    Serves RPC requests by dispatching each op to an async handler.
+
+    Requests are handled concurrently per connection, so a slow REQ never
+    blocks an EVENT pipelined behind it.
+
+    Attributes:
+        handlers (Dict[int, Handler]): Op code to coroutine returning (status, body).
+        stream_handlers (Dict[int, StreamHandler]): Op code to coroutine returning
+            (status, iterator of body chunks).
+
+    Methods:
+        start: Listens on a TCP port or a Unix socket path.
+        close: Stops listening and closes open connections.
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[int, Handler],
+        logger,
+        stream_handlers: Optional[Dict[int, StreamHandler]] = None,
+    ) -> None:
+        self.handlers = handlers
+        self.stream_handlers = stream_handlers or {}
+        self.logger = logger
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+
+    async def start(
+        self, host: str = "0.0.0.0", port: Optional[int] = None, path: str = None
+    ) -> None:
+        if path:
+            self.server = await asyncio.start_unix_server(self._serve, path=path)
+            self.logger.info(f"RPC server listening on {path}")
+        else:
+            self.server = await asyncio.start_server(self._serve, host, port)
+            self.logger.info(f"RPC server listening on {host}:{port}")
+
+    async def close(self) -> None:
+        if self.server is None:
+            return
+        self.server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections.add(writer)
+        tasks = set()
+        streams: Dict[int, Tuple[asyncio.Task, asyncio.Semaphore]] = {}
+        try:
+            while True:
+                request_id, op, _, payload = await read_frame(reader)
+                if op in (OP_STREAM_CREDIT, OP_STREAM_CANCEL):
+                    stream = streams.get(request_id)
+                    if stream is None:
+                        continue
+                    task, credit = stream
+                    if op == OP_STREAM_CANCEL:
+                        task.cancel()
+                        continue
+                    for _ in range(min(CREDIT.unpack(payload)[0], STREAM_WINDOW)):
+                        credit.release()
+                    continue
+                if op == OP_HELLO:
+                    hello = {
+                        "version": PROTOCOL_VERSION,
+                        "ops": sorted([*self.handlers, *self.stream_handlers]),
+                    }
+                    writer.write(
+                        encode_frame(request_id, OP_HELLO, 200, orjson.dumps(hello))
+                    )
+                    continue
+                credit = None
+                if op in self.stream_handlers:
+                    credit = asyncio.Semaphore(STREAM_WINDOW)
+                task = asyncio.create_task(
+                    self._dispatch(writer, request_id, op, payload, credit)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if credit is not None:
+                    streams[request_id] = (task, credit)
+                    task.add_done_callback(
+                        lambda _, request_id=request_id: streams.pop(request_id, None)
+                    )
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as exc:
+            self.logger.error(f"RPC connection error: {exc}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(
+        self,
+        writer: asyncio.StreamWriter,
+        request_id: int,
+        op: int,
+        payload: bytes,
+        credit: Optional[asyncio.Semaphore] = None,
+    ) -> None:
+        if op in self.stream_handlers:
+            await self._dispatch_stream(writer, request_id, op, payload, credit)
+            return
+        handler = self.handlers.get(op)
+        if handler is None:
+            status, body = 400, orjson.dumps({"error": f"unknown op {op}"})
+        else:
+            try:
+                status, body = await handler(payload)
+            except Exception as exc:
+                self.logger.error(f"RPC handler for op {op} failed: {exc}")
+                status, body = 500, orjson.dumps({"error": "internal error"})
+        if not writer.is_closing():
+            writer.write(encode_frame(request_id, OP_RESPONSE, status, body))
+            await writer.drain()
+
+    async def _dispatch_stream(
+        self,
+        writer: asyncio.StreamWriter,
+        request_id: int,
+        op: int,
+        payload: bytes,
+        credit: asyncio.Semaphore,
+    ) -> None:
+        chunks = None
+        try:
+            status, chunks = await self.stream_handlers[op](payload)
+            async for chunk in chunks:
+                # The client grants credit as it consumes chunks, so a slow
+                # reader holds the producer here instead of either side
+                # buffering the whole result.
+                await credit.acquire()
+                if writer.is_closing():
+                    return
+                writer.write(encode_frame(request_id, OP_STREAM_CHUNK, status, chunk))
+                await writer.drain()
+        except Exception as exc:
+            self.logger.error(f"RPC stream handler for op {op} failed: {exc}")
+            status = 500
+        finally:
+            if chunks is not None and hasattr(chunks, "aclose"):
+                await chunks.aclose()
+        if not writer.is_closing():
+            writer.write(encode_frame(request_id, OP_RESPONSE, status, b""))
+            await writer.drain()
+
+
+class RPCClient:
+    """
+    Long-lived, pipelined RPC connection to the event handler.
+
+    The connection is opened lazily and re-opened after failures, at most once
+    per reconnect_interval. While it is down, requests raise RPCUnavailable so
+    callers can fall back to HTTP. Requests in flight when it fails raise
+    RPCRequestFailed.
+
+    Methods:
+        connect: Opens the connection and negotiates the protocol version.
+        request: Sends one request and waits for its (status, body) response.
+        request_stream: Sends one request and yields the chunks of its streamed body.
+        close: Closes the connection and fails pending requests.
+    """
+
+    def __init__(
+        self,
+        logger,
+        host: str = None,
+        port: Optional[int] = None,
+        path: str = None,
+        reconnect_interval: float = 5,
+    ) -> None:
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.path = path
+        self.reconnect_interval = reconnect_interval
+        self.server_ops = set()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._streams: Dict[int, asyncio.Queue] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+        self._last_attempt = float("-inf")
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> None:
+        async with self._connect_lock:
+            if self.connected:
+                return
+            loop = asyncio.get_running_loop()
+            if loop.time() - self._last_attempt < self.reconnect_interval:
+                raise RPCUnavailable("RPC connection is backing off")
+            self._last_attempt = loop.time()
+            try:
+                if self.path:
+                    reader, writer = await asyncio.open_unix_connection(self.path)
+                else:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                hello = orjson.dumps({"version": PROTOCOL_VERSION})
+                writer.write(encode_frame(0, OP_HELLO, 0, hello))
+                await writer.drain()
+                _, op, status, payload = await asyncio.wait_for(
+                    read_frame(reader), timeout=self.reconnect_interval
+                )
+                server_hello = orjson.loads(payload)
+                if op != OP_HELLO or server_hello.get("version") != PROTOCOL_VERSION:
+                    writer.close()
+                    raise RPCUnavailable(
+                        f"Unsupported RPC protocol version {server_hello.get('version')}"
+                    )
+            except RPCUnavailable:
+                raise
+            except Exception as exc:
+                raise RPCUnavailable(f"Could not connect to RPC server: {exc}") from exc
+
+            self.server_ops = set(server_hello.get("ops", []))
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.create_task(self._read_responses())
+            self.logger.info(
+                f"Connected to event handler RPC, ops {sorted(self.server_ops)}"
+            )
+
+    async def request(self, op: int, payload: bytes) -> Tuple[int, bytes]:
+        if not self.connected:
+            await self.connect()
+        if op not in self.server_ops:
+            raise RPCUnavailable(f"RPC server does not support op {op}")
+
+        if not self.connected:
+            raise RPCUnavailable("RPC connection is closed")
+
+        request_id = next(self._ids) % 0xFFFFFFFF + 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(encode_frame(request_id, op, 0, payload))
+            await self._writer.drain()
+            return await future
+        except (ConnectionError, RuntimeError) as exc:
+            raise RPCRequestFailed(f"RPC request failed: {exc}") from exc
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def request_stream(self, op: int, payload: bytes) -> AsyncIterator[bytes]:
+        if not self.connected:
+            await self.connect()
+        if op not in self.server_ops:
+            raise RPCUnavailable(f"RPC server does not support op {op}")
+
+        if not self.connected:
+            raise RPCUnavailable("RPC connection is closed")
+
+        request_id = next(self._ids) % 0xFFFFFFFF + 1
+        # Room for a full credit window, the final response and an error.
+        queue = asyncio.Queue(maxsize=STREAM_WINDOW + 2)
+        self._streams[request_id] = queue
+        finished = False
+        consumed = 0
+        try:
+            self._writer.write(encode_frame(request_id, op, 0, payload))
+            await self._writer.drain()
+            while True:
+                frame = await queue.get()
+                if isinstance(frame, Exception):
+                    finished = True
+                    raise frame
+                frame_op, status, chunk = frame
+                if frame_op != OP_STREAM_CHUNK:
+                    finished = True
+                    if status >= 400:
+                        self.logger.warning(
+                            f"RPC stream for op {op} ended with {status}"
+                        )
+                    return
+                yield chunk
+                consumed += 1
+                if consumed >= STREAM_WINDOW // 2 and self.connected:
+                    self._writer.write(
+                        encode_frame(
+                            request_id, OP_STREAM_CREDIT, 0, CREDIT.pack(consumed)
+                        )
+                    )
+                    consumed = 0
+        except (ConnectionError, RuntimeError) as exc:
+            raise RPCRequestFailed(f"RPC request failed: {exc}") from exc
+        finally:
+            self._streams.pop(request_id, None)
+            if not finished and self.connected:
+                self._writer.write(encode_frame(request_id, OP_STREAM_CANCEL, 0, b""))
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._fail_pending(RPCRequestFailed("RPC client closed"))
+
+    async def _read_responses(self) -> None:
+        try:
+            while True:
+                request_id, op, status, payload = await read_frame(self._reader)
+                stream = self._streams.get(request_id)
+                if stream is not None:
+                    if op == OP_STREAM_CHUNK and stream.qsize() >= STREAM_WINDOW:
+                        # Leaves the reserved slots free for the error.
+                        del self._streams[request_id]
+                        stream.put_nowait(
+                            RPCRequestFailed("RPC stream exceeded its credit window")
+                        )
+                    else:
+                        stream.put_nowait((op, status, payload))
+                    continue
+                future = self._pending.get(request_id)
+                if future is not None and not future.done():
+                    future.set_result((status, payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.logger.warning(f"Event handler RPC connection lost: {exc}")
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            self._fail_pending(RPCRequestFailed("RPC connection lost"))
+
+    def _fail_pending(self, exc: Exception) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+        for stream in self._streams.values():
+            try:
+                stream.put_nowait(exc)
+            except asyncio.QueueFull:
+                pass
+        self._streams.clear()
@@ -0,0 +1,117 @@
+import time
+from typing import Iterable, List, Optional
+
+from utils import BloomFilter
+
+
+class SeenEventFilter:
+    """
+    Answers "is this event already stored" without touching Postgres.
+
+    An in-process Bloom filter sits in front of a Redis set per hour of
+    recently stored event IDs. A Bloom miss means the event is definitely new,
+    a Bloom hit is confirmed against the Redis sets so only definite
+    duplicates are short-circuited. Anything older than the Redis window falls
+    through to the database, where the primary key still catches it.
+
+    Attributes:
+        redis_client: Async Redis client holding the per-hour ID sets.
+        bloom (BloomFilter): In-process filter of every ID seen by this process.
+        window_hours (int): Number of hourly Redis sets checked on a Bloom hit.
+        key_prefix (str): Prefix of the hourly Redis set keys.
+
+    Methods:
+        warm: Loads the events primary key into the Bloom filter and the recent window into Redis.
+        is_duplicate: Returns True only if the event ID is known to be stored.
+        add: Records a newly stored event ID.
+        remove: Forgets deleted event IDs.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        logger,
+        capacity: int = 5000000,
+        error_rate: float = 0.001,
+        window_hours: int = 24,
+        key_prefix: str = "seen_event_ids",
+    ) -> None:
+        self.redis_client = redis_client
+        self.logger = logger
+        self.bloom = BloomFilter(capacity=capacity, error_rate=error_rate)
+        self.window_hours = max(1, window_hours)
+        self.key_prefix = key_prefix
+
+    def _bucket(self, timestamp: Optional[float] = None) -> int:
+        return int((time.time() if timestamp is None else timestamp) // 3600)
+
+    def _bucket_key(self, bucket: int) -> str:
+        return f"{self.key_prefix}:{bucket}"
+
+    def _window_keys(self) -> List[str]:
+        current = self._bucket()
+        return [self._bucket_key(current - i) for i in range(self.window_hours)]
+
+    def _expire_at(self, bucket: int) -> int:
+        return (bucket + 1 + self.window_hours) * 3600
+
+    async def warm(self, pool, chunk_size: int = 10000) -> None:
+        start = time.perf_counter()
+        window_start = (self._bucket() - self.window_hours + 1) * 3600
+        buckets = set()
+        async with pool.connection() as conn:
+            async with conn.cursor(name="seen_filter_warm") as cur:
+                await cur.execute("SELECT id, created_at FROM events")
+                while True:
+                    rows = await cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    for event_id, created_at in rows:
+                        self.bloom.add(event_id)
+                        if created_at and created_at >= window_start:
+                            bucket = self._bucket(created_at)
+                            buckets.add(bucket)
+                            pipe.sadd(self._bucket_key(bucket), event_id)
+                    await pipe.execute()
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.expireat(self._bucket_key(bucket), self._expire_at(bucket))
+        await pipe.execute()
+
+        if self.bloom.count > self.bloom.capacity:
+            self.logger.warning(
+                f"Seen filter holds {self.bloom.count} IDs, above its capacity of "
+                f"{self.bloom.capacity}; false positive rate will rise"
+            )
+        self.logger.info(
+            f"Seen filter warmed with {self.bloom.count} IDs in "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+
+    async def is_duplicate(self, event_id: str) -> bool:
+        if event_id not in self.bloom:
+            return False
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in self._window_keys():
+            pipe.sismember(key, event_id)
+        return any(await pipe.execute())
+
+    async def add(self, event_id: str) -> None:
+        self.bloom.add(event_id)
+        bucket = self._bucket()
+        key = self._bucket_key(bucket)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.sadd(key, event_id)
+        pipe.expireat(key, self._expire_at(bucket))
+        await pipe.execute()
+
+    async def remove(self, event_ids: Iterable[str]) -> None:
+        event_ids = list(event_ids)
+        if not event_ids:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in self._window_keys():
+            pipe.srem(key, *event_ids)
+        await pipe.execute()
@@ -0,0 +1,160 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from event_classes import Event, verify_schnorr_batch
+from utils import LRUCache
+
+VERIFY_MODES = ("inline", "thread", "process")
+
+
+class SignatureVerifier:
+    """
+    Verifies event signatures off the event loop.
+
+    Pending verifications are gathered for a short window and submitted to a
+    thread or process pool in chunks, so the IPC cost is paid per chunk rather
+    than per event. Successfully verified (id, pubkey, sig) triples are kept in
+    an LRU so re-broadcast copies of the same event skip the crypto entirely.
+
+    Attributes:
+        mode (str): "inline", "thread" or "process".
+        workers (int): Number of pool workers.
+        batch_size (int): Maximum number of signatures sent to a worker at once.
+        window (float): Seconds to keep gathering after the first pending verification.
+        cache (LRUCache): Recently verified signatures.
+        cache_hits (int): Number of verifications answered from the cache.
+        cache_misses (int): Number of verifications that needed the crypto.
+
+    Methods:
+        start: Creates the pool and starts the submission task.
+        stop: Stops the submission task and shuts the pool down.
+        verify: Verifies the signature of an Event.
+    """
+
+    def __init__(
+        self,
+        logger,
+        mode: str = "process",
+        workers: Optional[int] = None,
+        batch_size: int = 64,
+        window_ms: float = 2,
+        cache_size: int = 100000,
+    ) -> None:
+        if mode not in VERIFY_MODES:
+            raise ValueError(
+                f"Invalid verify mode {mode}. Must be one of {VERIFY_MODES}."
+            )
+        self.logger = logger
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self.window = window_ms / 1000
+        self.cache = LRUCache(max_size=cache_size)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.executor: Optional[Executor] = None
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+    def start(self) -> None:
+        if self.mode == "inline":
+            return
+        if self.mode == "process":
+            # Workers are spawned rather than forked: the event handler already
+            # runs exporter threads and holds pool connections by now, and a
+            # forked child could inherit a lock one of those threads held.
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            await self.queue.put(None)
+            await self._task
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def verify(self, event_obj: Event) -> bool:
+        key = (event_obj.event_id, event_obj.pubkey, event_obj.sig)
+        if self.cache.get(key):
+            self.cache_hits += 1
+            self.logger.debug(f"Signature cache hit for event: {event_obj.event_id}")
+            return True
+        self.cache_misses += 1
+
+        item = (event_obj.pubkey, event_obj.event_id, event_obj.sig)
+        if self._task is None:
+            result = verify_schnorr_batch([item])[0]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((item, future))
+            result = await future
+
+        if result:
+            self.cache[key] = True
+            self.logger.debug(
+                f"Verification successful for event: {event_obj.event_id}"
+            )
+        else:
+            self.logger.error(f"Verification failed for event: {event_obj.event_id}")
+        return result
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            pending = [item]
+            deadline = loop.time() + self.window
+            while len(pending) < self.batch_size * self.workers:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                pending.append(item)
+
+            # Spread the gathered signatures across the workers and keep
+            # collecting the next window while they run.
+            chunk_size = max(1, min(self.batch_size, -(-len(pending) // self.workers)))
+            for i in range(0, len(pending), chunk_size):
+                task = asyncio.create_task(self._submit(pending[i : i + chunk_size]))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _submit(
+        self, chunk: List[Tuple[Tuple[str, str, str], asyncio.Future]]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, verify_schnorr_batch, [item for item, _ in chunk]
+            )
+        except Exception as exc:
+            self.logger.error(f"Signature verification pool error: {exc}")
+            results = [False] * len(chunk)
+        for (_, future), result in zip(chunk, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import sys
+
+sys.path.insert(0, "../")
+from admission_cache import POLICY_CHANNEL, TrustSet
+from event_classes import Event
+
+logger = logging.getLogger(__name__)
+
+PUBKEY = "ab" * 32
+
+
+def fake_pool(rows):
+    pool = MagicMock()
+    conn = AsyncMock()
+    pool.connection.return_value.__aenter__.return_value = conn
+    conn.cursor = MagicMock()
+    cur = AsyncMock()
+    conn.cursor.return_value.__aenter__.return_value = cur
+    cur.fetchall.side_effect = rows
+    return pool
+
+
+class TestTrustSet(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_first_load_is_retried_quickly(self):
+        trust_set = TrustSet(
+            AsyncMock(), logger, refresh_interval=3600, retry_interval=0.01
+        )
+        pool = fake_pool([OSError("database down"), [(PUBKEY,)]])
+        with self.assertRaises(OSError):
+            await trust_set.load(pool)
+        self.assertFalse(trust_set.ready)
+
+        task = asyncio.create_task(trust_set.refresh_loop(pool))
+        for _ in range(100):
+            if trust_set.ready:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        self.assertTrue(trust_set.ready)
+        self.assertIn(PUBKEY, trust_set)
+
+
+class TestManagementEvents(unittest.IsolatedAsyncioTestCase):
+    def event(self, pubkey, tags):
+        return Event(
+            event_id="mgmt",
+            pubkey=pubkey,
+            kind=1,
+            created_at=100,
+            tags=tags,
+            content="",
+            sig="sig",
+        )
+
+    def test_only_admin_ban_and_allow_events_are_management(self):
+        ban = [["ban", "client_pub", PUBKEY]]
+        self.assertTrue(self.event(PUBKEY, ban).is_mgmt_event(PUBKEY))
+        self.assertFalse(self.event("cd" * 32, ban).is_mgmt_event(PUBKEY))
+        self.assertFalse(self.event(PUBKEY, ban).is_mgmt_event(None))
+        self.assertFalse(
+            self.event(PUBKEY, [["ban", "events", "x"]]).is_mgmt_event(PUBKEY)
+        )
+
+    async def test_policy_change_is_announced(self):
+        redis_client = AsyncMock()
+        event = self.event(PUBKEY, [["ban", "kind", "4"]])
+        conn, cur = AsyncMock(), AsyncMock()
+        message = await event.parse_mgmt_event(conn, cur, redis_client)
+        self.assertEqual(message, "banned: 4 has been banned")
+        self.assertEqual(cur.execute.await_args.args[1], ("mgmt", 4, "false"))
+        redis_client.publish.assert_awaited_once_with(POLICY_CHANNEL, "mgmt")
+
+
+if __name__ == "__main__":
+    unittest.main()
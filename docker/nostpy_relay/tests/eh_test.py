@@ -187,5 +187,65 @@ class TestEvent(unittest.TestCase):
         )
 
 
+class TestPagedQuery(unittest.IsolatedAsyncioTestCase):
+    async def test_filters_are_merged_newest_first(self):
+        def row(event_id, created_at, kind):
+            return (event_id, created_at, kind, event_id)
+
+        pages = {
+            1: [[row("a", 50, 1), row("b", 40, 1)], [row("c", 10, 1)]],
+            7: [[row("d", 45, 7), row("b", 40, 1)], [row("e", 40, 7)]],
+        }
+
+        async def execute(app_, sql_query, span_name, params, written_at=None):
+            return pages[params[0][0]].pop(0)
+
+        subscription = app.Subscription(
+            {
+                "subscription_id": "sub",
+                "event_dict": [{"kinds": [1], "limit": 3}, {"kinds": [7], "limit": 3}],
+            }
+        )
+        with patch.object(app, "QUERY_PAGE_SIZE", 2), patch.object(
+            app, "execute_sql_with_tracing", execute
+        ):
+            lines = [
+                line async for line in app.paged_sql_with_tracing(None, subscription)
+            ]
+        self.assertEqual(lines, [b"a\n", b"d\n", b"b\n", b"e\n", b"c\n"])
+        self.assertEqual(pages, {1: [], 7: []})
+
+
+class TestEventCommitted(unittest.IsolatedAsyncioTestCase):
+    async def test_cache_failures_do_not_fail_a_stored_event(self):
+        event_dict = {
+            "id": "test_id",
+            "pubkey": "test_pubkey",
+            "kind": 1,
+            "created_at": 123456,
+            "tags": [],
+            "content": "test_content",
+            "sig": "test_sig",
+        }
+        event_obj = app.Event(
+            event_id="test_id",
+            pubkey="test_pubkey",
+            kind=1,
+            created_at=123456,
+            tags=[],
+            content="test_content",
+            sig="test_sig",
+        )
+        fake_app = MagicMock()
+        fake_app.seen_filter.add = AsyncMock(side_effect=ConnectionError("redis down"))
+        fake_app.event_cache.event_stored.side_effect = KeyError("id")
+        pipe = fake_app.redis_client.pipeline.return_value
+        pipe.execute = AsyncMock()
+
+        await app.event_committed(fake_app, event_obj, event_dict)
+        fake_app.query_cache.in_background.assert_called_once()
+        pipe.execute.assert_awaited_once()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,47 @@
+import logging
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+
+sys.path.insert(0, "../")
+from event_batcher import BATCH_ADDED, EventBatcher
+from event_classes import Event
+
+logger = logging.getLogger(__name__)
+
+
+def event(event_id):
+    return Event(
+        event_id=event_id,
+        pubkey="pk",
+        kind=1,
+        created_at=100,
+        tags=[],
+        content="",
+        sig="sig",
+    )
+
+
+def fake_pool():
+    pool = MagicMock()
+    conn = AsyncMock()
+    pool.connection.return_value.__aenter__.return_value = conn
+    conn.cursor = MagicMock()
+    conn.cursor.return_value.__aenter__.return_value = AsyncMock()
+    return pool
+
+
+class TestEventBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_failing_flush_callback_does_not_stop_the_batcher(self):
+        on_flush = MagicMock(side_effect=RuntimeError("metrics down"))
+        batcher = EventBatcher(fake_pool(), logger, window_ms=0, on_flush=on_flush)
+        batcher.start()
+        with patch.object(Event, "add_events", AsyncMock(side_effect=[{"a"}, {"b"}])):
+            self.assertEqual(await batcher.submit(event("a")), BATCH_ADDED)
+            self.assertEqual(await batcher.submit(event("b")), BATCH_ADDED)
+        await batcher.stop()
+        self.assertEqual(on_flush.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
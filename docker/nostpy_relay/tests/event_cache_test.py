@@ -0,0 +1,86 @@
+import logging
+import unittest
+from unittest.mock import AsyncMock
+import sys
+
+import orjson
+
+sys.path.insert(0, "../")
+from event_cache import EVENT_DELETIONS_CHANNEL, EventCache
+from event_classes import QUERY_PAGE_SIZE, Subscription
+
+logger = logging.getLogger(__name__)
+
+
+def event(event_id, kind=1, created_at=100):
+    return {
+        "id": event_id,
+        "pubkey": "pk",
+        "kind": kind,
+        "created_at": created_at,
+        "tags": [],
+        "content": "x" * 50,
+        "sig": "sig",
+    }
+
+
+class TestEventCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis_client = AsyncMock()
+        self.cache = EventCache(self.redis_client, logger, max_bytes=1000)
+
+    def test_stored_events_are_cached_as_lines(self):
+        self.cache.event_stored(dict(event("a"), extra="dropped"))
+        created_at, line = self.cache.get("a")
+        self.assertEqual(created_at, 100)
+        self.assertEqual(orjson.loads(line), event("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_replaceable_events_are_not_cached(self):
+        for kind in (0, 3, 10002, 20001, 30023):
+            self.cache.event_stored(event(str(kind), kind=kind))
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_least_recently_used_evicted_over_memory_cap(self):
+        for event_id in "abcdefghij":
+            self.cache.event_stored(event(event_id))
+        self.assertLessEqual(self.cache.size, 1000)
+        self.assertGreater(self.cache.evictions, 0)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("j"))
+
+    async def test_deleted_events_are_dropped_and_announced(self):
+        self.cache.event_stored(event("a"))
+        await self.cache.events_deleted(["a"])
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.size, 0)
+        self.redis_client.publish.assert_awaited_once_with(
+            EVENT_DELETIONS_CHANNEL, orjson.dumps(["a"])
+        )
+        # A read from a replica that has not replayed the deletion yet.
+        self.cache.add("a", 1, 100, b"{}\n")
+        self.assertIsNone(self.cache.get("a"))
+
+
+class TestIdLookup(unittest.TestCase):
+    def setUp(self):
+        self.subscription = Subscription({"event_dict": [], "subscription_id": "sub"})
+
+    def test_only_pure_id_reqs_are_lookups(self):
+        self.assertEqual(
+            self.subscription.id_lookup([{"ids": ["a", "b"]}, {"ids": ["b", "c"]}]),
+            ["a", "b", "c"],
+        )
+        self.assertIsNone(self.subscription.id_lookup([{"ids": ["a"], "kinds": [1]}]))
+        self.assertIsNone(self.subscription.id_lookup([{"ids": ["a"], "limit": 1}]))
+        self.assertIsNone(self.subscription.id_lookup([{"ids": []}]))
+        self.assertIsNone(
+            self.subscription.id_lookup(
+                [{"ids": [str(i) for i in range(QUERY_PAGE_SIZE + 1)]}]
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import sys
+
+import orjson
+
+sys.path.insert(0, "../")
+from event_classes import QUERY_PAGE_SIZE
+from query_cache import (
+    QueryCache,
+    SingleFlight,
+    event_dependencies,
+    filter_dependencies,
+)
+from utils import filter_matches_event
+
+logger = logging.getLogger(__name__)
+
+
+class TestQueryCacheKeys(unittest.TestCase):
+    def setUp(self):
+        self.cache = QueryCache(None, logger)
+
+    def test_equivalent_reqs_share_a_key(self):
+        first = self.cache.key_for(
+            [{"kinds": [1, 7], "authors": ["a", "b"]}, {"ids": ["x"]}], False
+        )
+        second = self.cache.key_for(
+            [
+                {"ids": ["x"], "limit": QUERY_PAGE_SIZE},
+                {"authors": ["b", "a", "a"], "kinds": [7, 1]},
+            ],
+            False,
+        )
+        self.assertEqual(first, second)
+
+    def test_different_reqs_have_different_keys(self):
+        self.assertNotEqual(
+            self.cache.key_for([{"kinds": [1], "limit": 10}], False),
+            self.cache.key_for([{"kinds": [1], "limit": 20}], False),
+        )
+        self.assertNotEqual(
+            self.cache.key_for([{"search": "nostr"}], False),
+            self.cache.key_for([{"search": "nostr"}], True),
+        )
+
+
+class TestDependencies(unittest.TestCase):
+    event = {
+        "id": "e1",
+        "pubkey": "pk",
+        "kind": 1,
+        "created_at": 100,
+        "tags": [["p", "friend"], ["emoji", "x", "url"]],
+    }
+
+    def test_filter_indexed_by_most_selective_dimension(self):
+        self.assertEqual(
+            filter_dependencies({"authors": ["pk"], "kinds": [1]}), {"author:pk"}
+        )
+        self.assertEqual(
+            filter_dependencies({"#p": ["a", "b"], "#t": ["c"]}), {"tag:t:c"}
+        )
+        self.assertEqual(filter_dependencies({"#emoji": ["x"]}), {"all"})
+
+    def test_matching_event_reaches_filter_dependencies(self):
+        for filter_ in ({"kinds": [1]}, {"#p": ["friend"]}, {"ids": ["e1"]}, {}):
+            self.assertTrue(filter_matches_event(filter_, self.event))
+            self.assertTrue(
+                filter_dependencies(filter_) & event_dependencies(self.event)
+            )
+
+    def test_filter_bounds_are_checked(self):
+        self.assertFalse(filter_matches_event({"since": 100}, self.event))
+        self.assertFalse(filter_matches_event({"until": 100}, self.event))
+        self.assertFalse(filter_matches_event({"#p": ["stranger"]}, self.event))
+        self.assertTrue(filter_matches_event({"#emoji": ["x"]}, self.event))
+
+
+class TestDependencyIndex(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock(return_value=[])
+        self.redis_client = MagicMock()
+        self.redis_client.pipeline.return_value = self.pipe
+        self.cache = QueryCache(self.redis_client, logger, ttl=240)
+
+    async def test_dependency_sets_expire_at_a_fixed_time(self):
+        await self.cache.set("qcache:a", [{"kinds": [1]}], b"")
+        bucket = self.cache._bucket()
+        dependency_key = f"qcache_dep:{bucket}:kind:1"
+        self.pipe.sadd.assert_called_once_with(dependency_key, "qcache:a")
+        self.pipe.expireat.assert_called_once_with(dependency_key, (bucket + 2) * 240)
+        self.pipe.expire.assert_called_once_with("qcache:a", 240)
+
+    async def test_expired_entries_are_pruned_in_one_round_trip(self):
+        self.redis_client.sunion = AsyncMock(return_value=["qcache:gone"])
+        self.pipe.execute = AsyncMock(side_effect=[[None], []])
+        event = {"id": "e", "pubkey": "pk", "kind": 1, "created_at": 1, "tags": []}
+        await self.cache.events_deleted([event])
+
+        bucket = self.cache._bucket()
+        scanned = self.redis_client.sunion.await_args.args[0]
+        self.assertIn(f"qcache_dep:{bucket - 1}:kind:1", scanned)
+        self.assertIn(f"qcache_dep:{bucket}:kind:1", scanned)
+        self.pipe.hget.assert_called_once_with("qcache:gone", "filters")
+        self.pipe.srem.assert_any_call(f"qcache_dep:{bucket}:kind:1", "qcache:gone")
+        self.pipe.delete.assert_not_called()
+        self.assertEqual(self.cache.pruned, 1)
+
+    async def test_background_updates_are_awaited_on_close(self):
+        done = asyncio.Event()
+
+        async def update():
+            await asyncio.sleep(0.01)
+            done.set()
+
+        self.cache.in_background(update())
+        await self.cache.close()
+        self.assertTrue(done.is_set())
+
+    async def test_new_events_are_merged_in_query_order(self):
+        def event(event_id, created_at):
+            return {
+                "id": event_id,
+                "pubkey": "pk",
+                "kind": 1,
+                "created_at": created_at,
+                "tags": [],
+                "content": "",
+                "sig": "sig",
+            }
+
+        stored = [event("a", 20), event("c", 10), event("e", 10)]
+        pipe = MagicMock()
+        pipe.hget = AsyncMock(
+            return_value="".join(orjson.dumps(e).decode() + "\n" for e in stored)
+        )
+        merged = await self.cache._merge_event(
+            pipe, "qcache:a", {"limit": 3}, event("d", 10)
+        )
+        self.assertTrue(merged)
+        results = pipe.hset.call_args.args[2].splitlines()
+        self.assertEqual(
+            [orjson.loads(line)["id"] for line in results], ["a", "c", "d"]
+        )
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.flight = SingleFlight(None, logger, QueryCache(None, logger))
+        self.loads = 0
+
+    async def load(self):
+        self.loads += 1
+        await asyncio.sleep(0.02)
+        return b"result\n"
+
+    async def test_concurrent_identical_loads_share_one_query(self):
+        results = await asyncio.gather(
+            *(self.flight.do("key", self.load) for _ in range(10))
+        )
+        self.assertEqual(set(results), {b"result\n"})
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.flight.coalesced, 9)
+        self.assertFalse(self.flight.in_flight("key"))
+
+    async def test_waiter_takes_over_from_cancelled_leader(self):
+        leader = asyncio.create_task(self.flight.do("key", self.load))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(self.flight.do("key", self.load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await waiter, b"result\n")
+        self.assertEqual(self.loads, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
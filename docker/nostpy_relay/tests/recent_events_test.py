@@ -0,0 +1,126 @@
+import logging
+import time
+import unittest
+import sys
+
+import orjson
+
+sys.path.insert(0, "../")
+from utils import REDIS_CHANNEL, kind_channel
+from websocket_classes import RecentEvents, SubscriptionMatcher
+
+logger = logging.getLogger(__name__)
+
+ALICE = "a" * 64
+BOB = "b" * 64
+
+
+def event(event_id, kind=1, pubkey=ALICE, created_at=None, tags=None):
+    return {
+        "id": event_id,
+        "pubkey": pubkey,
+        "kind": kind,
+        "created_at": int(time.time()) if created_at is None else created_at,
+        "tags": tags or [],
+        "content": "hello",
+        "sig": "sig",
+    }
+
+
+class TestRecentEvents(unittest.TestCase):
+    def setUp(self):
+        self.buffer = RecentEvents(logger, window=300, skew=5, page_size=2)
+        self.buffer.subscribed([REDIS_CHANNEL])
+        self.buffer.channels[REDIS_CHANNEL] -= 100
+        self.since = int(time.time()) - 60
+
+    def ids(self, lines):
+        return [orjson.loads(line)["id"] for line in lines]
+
+    def test_fresh_reqs_are_answered_newest_first(self):
+        now = int(time.time())
+        self.buffer.add(dict(event("old", created_at=now - 2), extra="dropped"))
+        self.buffer.add(event("new", created_at=now))
+        self.buffer.add(event("bob", pubkey=BOB, created_at=now - 1))
+        lines = self.buffer.answer([{"authors": [ALICE], "since": self.since}])
+        self.assertEqual(self.ids(lines), ["new", "old"])
+        self.assertEqual(orjson.loads(lines[1]), event("old", created_at=now - 2))
+        lines = self.buffer.answer([{"since": self.since}])
+        self.assertEqual(self.ids(lines), ["new", "bob"])
+        self.assertEqual(self.buffer.hits, 2)
+
+    def test_filters_are_merged_with_their_own_limits(self):
+        now = int(time.time())
+        for i in range(3):
+            self.buffer.add(event(f"k1-{i}", created_at=now - i))
+            self.buffer.add(event(f"k7-{i}", kind=7, created_at=now - 10 - i))
+        lines = self.buffer.answer(
+            [
+                {"kinds": [1], "since": self.since, "limit": 1},
+                {"kinds": [7, 1], "since": self.since, "limit": 100},
+            ]
+        )
+        self.assertEqual(
+            self.ids(lines), ["k1-0", "k1-1", "k1-2", "k7-0", "k7-1", "k7-2"]
+        )
+
+    def test_reqs_older_than_the_buffer_are_passed_on(self):
+        self.assertIsNone(self.buffer.answer([{"since": int(time.time()) - 3600}]))
+        self.assertIsNone(self.buffer.answer([{"kinds": [1]}]))
+        self.assertIsNone(
+            self.buffer.answer([{"since": self.since, "search": "hello"}])
+        )
+        self.assertIsNone(self.buffer.answer([{"since": self.since, "kinds": ["1"]}]))
+        self.assertEqual(self.buffer.misses, 4)
+
+    def test_coverage_follows_the_subscribed_channels(self):
+        self.buffer.unsubscribed([REDIS_CHANNEL])
+        self.buffer.subscribed([kind_channel(1)])
+        self.buffer.channels[kind_channel(1)] -= 100
+        self.assertEqual(self.buffer.answer([{"kinds": [1], "since": self.since}]), [])
+        self.assertIsNone(self.buffer.answer([{"kinds": [7], "since": self.since}]))
+
+        self.buffer.subscribed([REDIS_CHANNEL])
+        self.assertIsNone(self.buffer.answer([{"since": self.since}]))
+        self.buffer.reset()
+        self.assertIsNone(self.buffer.answer([{"kinds": [1], "since": self.since}]))
+
+    def test_evictions_move_the_covered_window(self):
+        buffer = RecentEvents(logger, max_events=2, skew=0)
+        buffer.subscribed([REDIS_CHANNEL])
+        buffer.channels[REDIS_CHANNEL] -= 100
+        for event_id in "abc":
+            buffer.add(event(event_id, created_at=self.since + 10))
+        self.assertNotIn("a", buffer.events)
+        self.assertIsNone(buffer.answer([{"since": self.since}]))
+        self.assertEqual(
+            self.ids(buffer.answer([{"since": int(buffer.evicted_at) + 1}])), []
+        )
+
+    def test_ephemeral_replaced_and_deleted_events_are_dropped(self):
+        self.buffer.add(event("ephemeral", kind=20001))
+        self.buffer.add(event("profile-1", kind=0))
+        self.buffer.add(event("profile-2", kind=0))
+        self.buffer.add(event("article-1", kind=30023, tags=[["d", "x"]]))
+        self.buffer.add(event("article-2", kind=30023, tags=[["d", "y"]]))
+        self.buffer.add(event("note"))
+        self.buffer.discard(["note"])
+        self.assertEqual(
+            sorted(self.ids(self.buffer.answer([{"since": self.since, "limit": 10}]))),
+            ["article-1", "article-2", "profile-2"],
+        )
+        self.assertNotIn("profile-1", self.buffer.by_kind[0])
+        self.assertNotIn(1, self.buffer.by_kind)
+
+
+class TestSubscriptionMatcher(unittest.TestCase):
+    def test_event_matching_any_filter_matches(self):
+        matcher = SubscriptionMatcher(
+            "sub", [{"kinds": [7], "authors": [ALICE]}, {"kinds": [1]}], logger
+        )
+        self.assertTrue(matcher.match_event(event("a", pubkey=BOB)))
+        self.assertFalse(matcher.match_event(event("b", kind=3, pubkey=ALICE)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import logging
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import sys
+
+sys.path.insert(0, "../")
+from replica_router import Replica, ReplicaRouter, parse_replicas
+
+logger = logging.getLogger(__name__)
+
+
+def fake_pool(row=None, error=None):
+    pool = MagicMock()
+    conn = AsyncMock()
+    pool.connection.return_value.__aenter__.return_value = conn
+    if error is not None:
+        conn.execute.side_effect = error
+    else:
+        conn.execute.return_value.fetchone.return_value = row
+    return pool
+
+
+class TestParseReplicas(unittest.TestCase):
+    def test_port_and_weight_are_optional(self):
+        self.assertEqual(
+            parse_replicas("replica1:5433:3, replica2,", "5432"),
+            [("replica1", "5433", 3.0), ("replica2", "5432", 1.0)],
+        )
+        self.assertEqual(parse_replicas("", "5432"), [])
+
+    def test_weight_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            parse_replicas("replica1:5432:0", "5432")
+
+
+class TestReplicaRouter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.primary = fake_pool(row=("0/5000000",))
+        self.current = Replica("current", fake_pool(row=(True, 0)))
+        self.lagging = Replica("lagging", fake_pool(row=(True, 1024)))
+        self.down = Replica("down", fake_pool(error=OSError("refused")))
+        self.router = ReplicaRouter(
+            self.primary,
+            [self.current, self.lagging, self.down],
+            logger,
+            max_lag_bytes=512,
+            clock_skew=0,
+        )
+
+    async def test_lagging_and_failed_replicas_leave_rotation(self):
+        await self.router.check()
+        self.assertEqual(self.router.in_rotation(), [self.current])
+        self.assertIs(self.router.pool(), self.current.pool)
+
+        self.current.healthy = False
+        self.assertIs(self.router.pool(), self.primary)
+        self.assertEqual(self.router.primary_reads, 1)
+
+    async def test_reads_after_a_write_need_a_caught_up_replica(self):
+        await self.router.check()
+        caught_up_at = self.current.caught_up_at
+        self.assertIs(self.router.pool(written_at=caught_up_at), self.current.pool)
+        self.assertIs(self.router.pool(written_at=caught_up_at + 1), self.primary)
+
+    async def test_reads_after_a_write_allow_for_clock_skew(self):
+        await self.router.check()
+        self.router.clock_skew = 0.5
+        caught_up_at = self.current.caught_up_at
+        self.assertIs(
+            self.router.pool(written_at=caught_up_at - 0.5), self.current.pool
+        )
+        self.assertIs(self.router.pool(written_at=caught_up_at - 0.4), self.primary)
+
+    async def test_reads_are_weighted(self):
+        other = Replica("other", fake_pool(row=(False, None)), weight=3)
+        router = ReplicaRouter(self.primary, [self.current, other], logger)
+        await router.check()
+        picks = [router.pool() for _ in range(2000)]
+        self.assertGreater(picks.count(other.pool), picks.count(self.current.pool))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import unittest
+import sys
+
+sys.path.insert(0, "../")
+from rpc_protocol import (
+    OP_EVENT,
+    OP_REQ,
+    OP_REQ_STREAM,
+    RPCClient,
+    RPCRequestFailed,
+    RPCServer,
+    RPCUnavailable,
+    STREAM_WINDOW,
+    encode_frame,
+    read_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TestFrames(unittest.IsolatedAsyncioTestCase):
+    async def test_frame_round_trip(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame(7, OP_EVENT, 200, b'{"ok": true}'))
+        reader.feed_eof()
+        self.assertEqual(await read_frame(reader), (7, OP_EVENT, 200, b'{"ok": true}'))
+
+
+class TestRPC(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def slow_req(payload):
+            await asyncio.sleep(0.05)
+            return 200, b"req:" + payload
+
+        async def fast_event(payload):
+            return 201, b"event:" + payload
+
+        async def short_chunks(payload):
+            for line in payload.split(b","):
+                yield line + b"\n"
+
+        self.produced = 0
+        self.stream_closed = asyncio.Event()
+
+        async def stream_req(payload):
+            if payload != b"long":
+                return 200, short_chunks(payload)
+
+            async def chunks():
+                try:
+                    for _ in range(STREAM_WINDOW * 4):
+                        self.produced += 1
+                        yield b"x\n"
+                finally:
+                    self.stream_closed.set()
+
+            return 200, chunks()
+
+        self.server = RPCServer(
+            {OP_EVENT: fast_event, OP_REQ: slow_req},
+            logger,
+            stream_handlers={OP_REQ_STREAM: stream_req},
+        )
+        await self.server.start(host="127.0.0.1", port=0)
+        port = self.server.server.sockets[0].getsockname()[1]
+        self.client = RPCClient(logger, host="127.0.0.1", port=port)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_pipelined_requests_resolve_out_of_order(self):
+        results = await asyncio.gather(
+            self.client.request(OP_REQ, b"a"), self.client.request(OP_EVENT, b"b")
+        )
+        self.assertEqual(results, [(200, b"req:a"), (201, b"event:b")])
+        self.assertEqual(self.client.server_ops, {OP_EVENT, OP_REQ, OP_REQ_STREAM})
+
+    async def test_stream_yields_chunks_alongside_requests(self):
+        async def collect():
+            return [
+                chunk
+                async for chunk in self.client.request_stream(OP_REQ_STREAM, b"a,b,c")
+            ]
+
+        chunks, response = await asyncio.gather(
+            collect(), self.client.request(OP_EVENT, b"d")
+        )
+        self.assertEqual(chunks, [b"a\n", b"b\n", b"c\n"])
+        self.assertEqual(response, (201, b"event:d"))
+
+    async def test_stream_is_held_back_by_a_slow_reader(self):
+        stream = self.client.request_stream(OP_REQ_STREAM, b"long")
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        # Only the credit window is buffered ahead of the reader.
+        self.assertLessEqual(self.produced, STREAM_WINDOW + 2)
+        self.assertEqual(len([chunk async for chunk in stream]), STREAM_WINDOW * 4 - 1)
+
+    async def test_abandoned_stream_is_cancelled(self):
+        stream = self.client.request_stream(OP_REQ_STREAM, b"long")
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.wait_for(self.stream_closed.wait(), timeout=1)
+        self.assertLess(self.produced, STREAM_WINDOW * 4)
+
+    async def test_unsupported_op_raises_unavailable(self):
+        with self.assertRaises(RPCUnavailable):
+            await self.client.request(99, b"")
+
+    async def test_request_lost_in_flight_is_not_unavailable(self):
+        request = asyncio.create_task(self.client.request(OP_REQ, b"a"))
+        await asyncio.sleep(0.01)
+        await self.server.close()
+        # Only requests that never reached the server may be replayed over HTTP.
+        with self.assertRaises(RPCRequestFailed):
+            await request
+
+
+class TestRPCUnavailable(unittest.IsolatedAsyncioTestCase):
+    async def test_unreachable_server_raises_unavailable(self):
+        client = RPCClient(logger, host="127.0.0.1", port=1)
+        with self.assertRaises(RPCUnavailable):
+            await client.request(OP_EVENT, b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+import sys
+
+import orjson
+
+sys.path.insert(0, "../")
+from event_classes import (
+    MAX_QUERY_LIMIT,
+    QUERY_PAGE_SIZE,
+    RESULT_COLUMNS,
+    Event,
+    Subscription,
+    effective_limit,
+)
+
+
+class TestCompileFilter(unittest.TestCase):
+    def setUp(self):
+        self.subscription = Subscription({"event_dict": [], "subscription_id": "sub"})
+
+    def test_same_structure_same_query_text(self):
+        first, first_params = self.subscription.compile_filter(
+            {"kinds": [1], "#e": ["a"], "limit": 10}
+        )
+        second, second_params = self.subscription.compile_filter(
+            {"kinds": [1, 7], "#e": ["b", "c"], "limit": 20}
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(first_params, [[1], "e", ["a"], [1], 10])
+        self.assertEqual(second_params, [[1, 7], "e", ["b", "c"], [1, 7], 20])
+
+    def test_single_letter_tags_use_event_tags(self):
+        sql_query, params = self.subscription.compile_filter(
+            {"#p": ["a"], "#emoji": ["b"], "since": 5}
+        )
+        self.assertIn("id IN (SELECT event_id FROM event_tags", sql_query)
+        self.assertIn("jsonb_array_elements(tags)", sql_query)
+        self.assertEqual(params, [5, "emoji", ["b"], "p", ["a"], 5, 100])
+
+    def test_values_are_never_inlined(self):
+        sql_query, params = self.subscription.compile_filter(
+            {"authors": ["'; DROP TABLE events; --"], "search": "x'"}
+        )
+        self.assertNotIn("DROP", sql_query)
+        self.assertNotIn("x'", sql_query)
+        self.assertIn(["'; DROP TABLE events; --"], params)
+
+    def test_search_uses_full_text_index_and_rank(self):
+        sql_query, params = self.subscription.compile_filter(
+            {"search": "nostr relay", "limit": 5}
+        )
+        self.assertIn("content_tsv @@ websearch_to_tsquery", sql_query)
+        self.assertIn("ORDER BY ts_rank(", sql_query)
+        self.assertEqual(params, ["nostr relay", "nostr relay", 5])
+
+    def test_trigram_search_fallback(self):
+        sql_query, params = self.subscription.compile_filter(
+            {"search": "50%"}, search_trigram=True
+        )
+        self.assertIn("content ILIKE %s", sql_query)
+        self.assertEqual(params, ["50%", "%50\\%%", "50%", 100])
+
+    def test_limit_is_capped(self):
+        _, params = self.subscription.compile_filter({"limit": 10**6})
+        self.assertEqual(params, [MAX_QUERY_LIMIT])
+
+    def test_keyset_page_continues_after_cursor(self):
+        sql_query, params = self.subscription.compile_filter(
+            {"kinds": [1], "#e": ["a"], "limit": 1000},
+            after=(50, "ff"),
+            page_size=QUERY_PAGE_SIZE,
+        )
+        self.assertIn("created_at <= %s AND (created_at < %s OR id > %s)", sql_query)
+        self.assertTrue(
+            sql_query.endswith("ORDER BY created_at DESC, id LIMIT %s) AS page")
+        )
+        self.assertEqual(
+            params, [[1], 50, 50, "ff", "e", ["a"], [1], 50, QUERY_PAGE_SIZE]
+        )
+
+    def test_effective_limit(self):
+        self.assertEqual(effective_limit({}), QUERY_PAGE_SIZE)
+        self.assertEqual(effective_limit({"limit": 10**6}), MAX_QUERY_LIMIT)
+        self.assertEqual(
+            effective_limit({"limit": 10**6, "search": "x"}), QUERY_PAGE_SIZE
+        )
+        self.assertTrue(self.subscription.needs_paging([{}, {"limit": 10**6}]))
+        self.assertFalse(self.subscription.needs_paging([{}, {"limit": 10}]))
+
+    def test_req_with_one_filter_is_not_wrapped(self):
+        self.assertEqual(
+            self.subscription.compile_req([{"kinds": [1]}]),
+            self.subscription.compile_filter({"kinds": [1]}),
+        )
+
+    def test_events_are_serialized_by_postgres(self):
+        for sql_query, _ in (
+            self.subscription.compile_filter({"kinds": [1]}),
+            self.subscription.compile_req([{"kinds": [1]}, {"authors": ["a"]}]),
+        ):
+            self.assertTrue(sql_query.startswith(f"SELECT {RESULT_COLUMNS} FROM ("))
+            self.assertEqual(sql_query.count("json_build_object"), 1)
+
+    def test_ndjson_results_are_sent_without_decoding(self):
+        response = self.subscription.sub_ndjson_response_builder(
+            "EVENT", "sub", b'{"id" : "a"}\n{"id" : "b"}\n', 200
+        )
+        self.assertEqual(
+            orjson.loads(response.body),
+            {
+                "event": "EVENT",
+                "subscription_id": "sub",
+                "results_json": [{"id": "a"}, {"id": "b"}],
+            },
+        )
+        empty = self.subscription.sub_ndjson_response_builder("EVENT", "sub", b"", 200)
+        self.assertEqual(orjson.loads(empty.body)["results_json"], [])
+
+    def test_req_filters_merged_into_one_query(self):
+        sql_query, params = self.subscription.compile_req(
+            [{"kinds": [1], "limit": 10}, {"authors": ["a"], "limit": 5}]
+        )
+        self.assertEqual(sql_query.count("UNION ALL"), 1)
+        self.assertIn("SELECT DISTINCT ON (id)", sql_query)
+        self.assertEqual(sql_query.count("LIMIT %s"), 2)
+        self.assertTrue(sql_query.endswith("ORDER BY created_at DESC, id"))
+        self.assertEqual(params, [[1], 10, ["a"], 5])
+
+    def test_invalid_values_rejected(self):
+        with self.assertRaises(ValueError):
+            self.subscription.compile_filter({"kinds": ["1; SELECT 1"]})
+        with self.assertRaises(ValueError):
+            self.subscription.compile_filter({"since": "0 OR 1=1"})
+
+    def test_count_reads_tag_counter_for_hot_shapes(self):
+        sql_query, params, bounded = self.subscription.compile_count(
+            [{"kinds": [3], "#p": ["pk"]}]
+        )
+        self.assertIn("FROM tag_counts", sql_query)
+        self.assertEqual(params, [3, "p", "pk"])
+        self.assertFalse(bounded)
+
+    def test_other_counts_are_bounded(self):
+        sql_query, params, bounded = self.subscription.compile_count(
+            [{"kinds": [1], "#p": ["pk"]}, {"authors": ["a"]}], count_limit=50
+        )
+        self.assertNotIn("tag_counts", sql_query)
+        self.assertIn(") UNION (", sql_query)
+        self.assertEqual(sql_query.count("LIMIT %s) UNION"), 1)
+        self.assertTrue(sql_query.endswith("LIMIT %s) LIMIT %s) AS matched"))
+        self.assertEqual(params, [[1], "p", ["pk"], [1], 51, ["a"], 51, 51])
+        self.assertTrue(bounded)
+
+
+class TestIndexedTags(unittest.TestCase):
+    def test_only_single_letter_string_tags_indexed(self):
+        event = Event(
+            event_id="id",
+            pubkey="pub",
+            kind=1,
+            created_at=1,
+            tags=[
+                ["e", "x", "relay"],
+                ["e", "x"],
+                ["emoji", "y"],
+                ["p"],
+                "t",
+                ["t", 1],
+            ],
+            content="",
+            sig="sig",
+        )
+        self.assertEqual(event.indexed_tags, [("e", "x")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+import sys
+
+sys.path.insert(0, "../")
+from utils import (
+    REDIS_CHANNEL,
+    BloomFilter,
+    LimitedDict,
+    LRUCache,
+    author_channel,
+    event_channels,
+    filter_channels,
+    kind_channel,
+    ndjson_lines,
+)
+
+
+class TestLimitedDict(unittest.TestCase):
+    def test_oldest_item_evicted(self):
+        limited = LimitedDict(max_size=2)
+        limited["a"] = 1
+        limited["b"] = 2
+        limited["c"] = 3
+        self.assertEqual(list(limited), ["b", "c"])
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_evicted(self):
+        cache = LRUCache(max_size=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache.get("a"), 1)
+        cache["c"] = 3
+        self.assertNotIn("b", cache)
+        self.assertEqual(list(cache), ["a", "c"])
+
+    def test_get_missing_returns_default(self):
+        cache = LRUCache(max_size=2)
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.get("missing", 0), 0)
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_added_keys_are_members(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = [f"{i:064x}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate_close_to_target(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"stored-{i}")
+        false_positives = sum(f"missing-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestFanoutChannels(unittest.TestCase):
+    pubkey = "ab" * 32
+
+    def test_event_published_on_full_kind_and_author_channels(self):
+        channels = event_channels({"kind": 1, "pubkey": self.pubkey})
+        self.assertEqual(
+            channels, [REDIS_CHANNEL, kind_channel(1), author_channel(self.pubkey)]
+        )
+
+    def test_filter_uses_smallest_partition_set(self):
+        channels = filter_channels([{"kinds": [1, 6, 7], "authors": [self.pubkey]}])
+        self.assertEqual(channels, {author_channel(self.pubkey)})
+
+    def test_unpartitioned_filter_needs_full_channel(self):
+        channels = filter_channels([{"kinds": [1]}, {"#e": ["00" * 32]}])
+        self.assertEqual(channels, {REDIS_CHANNEL})
+
+    def test_matching_event_is_on_a_filter_channel(self):
+        event = {"kind": 7, "pubkey": self.pubkey}
+        channels = filter_channels([{"kinds": [7]}])
+        self.assertTrue(channels & set(event_channels(event)))
+
+
+class TestNdjsonLines(unittest.TestCase):
+    def test_lines_split_across_chunks(self):
+        async def chunks():
+            for chunk in (b'{"a":1}\n{"b"', b":2}\n", b"\n", b'{"c":3}'):
+                yield chunk
+
+        async def collect():
+            return [line async for line in ndjson_lines(chunks())]
+
+        self.assertEqual(asyncio.run(collect()), [b'{"a":1}', b'{"b":2}', b'{"c":3}'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,13 @@
+import hashlib
+import math
 from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Set
+
+REDIS_CHANNEL = "new_events_channel"
+EVENT_DELETIONS_CHANNEL = "event_deletions"
+AUTHOR_BUCKETS = 64
+MAX_FILTER_CHANNELS = 32
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
 
 class LimitedDict(OrderedDict):
@@ -22,3 +31,172 @@ class LimitedDict(OrderedDict):
         if len(self) >= self.max_size:
             self.popitem(last=False)  # Remove the oldest item
         super().__setitem__(key, value)
+
+
+class LRUCache(OrderedDict):
+    """
+    A dictionary with a maximum size limit that evicts the least recently used
+    item once the limit is reached.
+
+    Reading through `get` and writing an existing key both mark the key as
+    recently used, so frequently requested entries stay cached.
+
+    Attributes:
+        max_size (int): The maximum number of items allowed in the dictionary.
+    """
+
+    def __init__(self, *args, max_size=1000, **kwargs):
+        self.max_size = max_size
+        super().__init__(*args, **kwargs)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.move_to_end(key)
+        super().__setitem__(key, value)
+        if len(self) > self.max_size:
+            self.popitem(last=False)  # Remove the least recently used item
+
+
+class BloomFilter:
+    """
+    A fixed size Bloom filter for string keys such as event IDs.
+
+    Membership tests can return false positives but never false negatives, so
+    a miss means the key was definitely never added.
+
+    Attributes:
+        size (int): Number of bits in the filter.
+        hash_count (int): Number of bit positions set per key.
+        count (int): Number of keys added so far.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+def kind_channel(kind: int) -> str:
+    return f"{REDIS_CHANNEL}:kind:{kind}"
+
+
+def author_channel(pubkey: str) -> str:
+    return f"{REDIS_CHANNEL}:author:{int(pubkey[:8], 16) % AUTHOR_BUCKETS}"
+
+
+def _is_pubkey(value: Any) -> bool:
+    if not isinstance(value, str) or len(value) != 64:
+        return False
+    try:
+        int(value, 16)
+    except ValueError:
+        return False
+    return True
+
+
+def event_channels(event: Dict[str, Any]) -> List[str]:
+    """
+    Returns every Redis channel a stored event is published on.
+
+    Each event goes to the full REDIS_CHANNEL, its kind channel and its author
+    bucket channel, so listeners can subscribe to only the partitions their
+    clients can match.
+    """
+    channels = [REDIS_CHANNEL, kind_channel(event["kind"])]
+    if _is_pubkey(event.get("pubkey")):
+        channels.append(author_channel(event["pubkey"]))
+    return channels
+
+
+def filter_channels(filters: Iterable[Dict[str, Any]]) -> Set[str]:
+    """
+    Returns the Redis channels that carry every event the REQ filters can match.
+
+    A filter is covered by its author buckets or its kind channels, whichever
+    needs fewer channels. Filters constrained by neither, or needing more than
+    MAX_FILTER_CHANNELS channels, fall back to the full REDIS_CHANNEL.
+    """
+    channels = set()
+    for filter_ in filters:
+        candidates = []
+        authors = filter_.get("authors")
+        if authors and all(_is_pubkey(author) for author in authors):
+            candidates.append({author_channel(author) for author in authors})
+        kinds = filter_.get("kinds")
+        if kinds and all(isinstance(kind, int) for kind in kinds):
+            candidates.append({kind_channel(kind) for kind in kinds})
+        candidates = [c for c in candidates if len(c) <= MAX_FILTER_CHANNELS]
+        if not candidates:
+            return {REDIS_CHANNEL}
+        channels |= min(candidates, key=len)
+    return channels or {REDIS_CHANNEL}
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Re-splits a stream of arbitrary byte chunks into non-empty NDJSON lines."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line:
+                yield line
+    if buffer:
+        yield buffer
+
+
+def filter_matches_event(filter_: Dict[str, Any], event: Dict[str, Any]) -> bool:
+    """
+    Returns True if a stored event matches one REQ filter, with the same
+    bounds the compiled SQL uses. A search is assumed to match since it can
+    only be evaluated against the full-text index.
+    """
+    if "ids" in filter_ and event["id"] not in filter_["ids"]:
+        return False
+    if "authors" in filter_ and event["pubkey"] not in filter_["authors"]:
+        return False
+    if "kinds" in filter_ and event["kind"] not in filter_["kinds"]:
+        return False
+    if "since" in filter_ and not event["created_at"] > filter_["since"]:
+        return False
+    if "until" in filter_ and not event["created_at"] < filter_["until"]:
+        return False
+    for key, values in filter_.items():
+        if not key.startswith("#"):
+            continue
+        wanted = set(values)
+        if not any(
+            isinstance(tag, list)
+            and len(tag) >= 2
+            and tag[0] == key[1:]
+            and tag[1] in wanted
+            for tag in event.get("tags") or []
+        ):
+            return False
+    return True
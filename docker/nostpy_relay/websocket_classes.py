@@ -1,7 +1,14 @@
 import asyncio
 import hashlib
+import math
+import time
+from collections import OrderedDict
 import orjson
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from utils import REDIS_CHANNEL, filter_channels, filter_matches_event
+
+EVENT_FIELDS = ("id", "pubkey", "kind", "created_at", "tags", "content", "sig")
 
 
 class ExtractedResponse:
@@ -118,7 +125,7 @@ class WebsocketMessages:
 
         """
         self.event_type = message[0]
-        if self.event_type in ("REQ", "CLOSE"):
+        if self.event_type in ("REQ", "CLOSE", "COUNT"):
             self.subscription_id: str = message[1]
             raw_payload = message[2:]
             logger.debug(f"Raw payload is {raw_payload} and len {len(raw_payload)}")
@@ -167,16 +174,11 @@ class SubscriptionMatcher:
             bool: True if the event matches any of the filters, False otherwise.
         """
         for list_item in self.filters:
-            for filter_, value in list_item.items():
-                self.logger.debug(f"Checking filter: {filter_}, value : {value}")
-                combined = {filter_: value}
-                if self._match_single_filter(combined, event):
-                    self.logger.debug(f"Event matches filter: {filter_}")
-                else:
-                    self.logger.debug("filter did not match the event.")
-                    return False
-            self.logger.debug("Returning true")
-            return True
+            if self._match_single_filter(list_item, event):
+                self.logger.debug("Returning true")
+                return True
+        self.logger.debug("No filter matched the event.")
+        return False
 
     def _match_single_filter(
         self, filter_: Dict[str, Any], event: Dict[str, Any]
@@ -254,3 +256,228 @@ class SubscriptionMatcher:
 
         self.logger.debug("Filter matched successfully.")
         return True
+
+
+class RecentEvents:
+    """
+    Time-bounded buffer of the events this process received from Redis, used
+    to answer REQs for fresh events without a round trip to the event handler.
+
+    Events are indexed by kind and author and kept for window seconds after
+    they arrive, up to max_events. A newer version of a replaceable event
+    drops the one it replaced and deleted events are dropped when their IDs
+    are announced.
+
+    The buffer only holds the events of the Redis channels this process is
+    subscribed to, so it answers a filter only if one of the channels
+    carrying it has been subscribed, and no event it carries evicted, since
+    before the filter's since. The margin of skew seconds covers events
+    whose created_at is slightly ahead of the time they were stored.
+
+    Attributes:
+        window (int): Seconds an event is kept after it arrives.
+        max_events (int): Events kept at most, the oldest are evicted first.
+        skew (int): Seconds a filter's since must be past the covered time.
+        page_size (int): Events returned for a filter without a valid limit.
+        max_limit (int): Cap on the limit of a filter.
+        events (OrderedDict): Event ID to (arrival time, event, NDJSON line), oldest first.
+        by_kind (Dict[int, Set[str]]): Event IDs by kind.
+        by_author (Dict[str, Set[str]]): Event IDs by pubkey.
+        replaceable (Dict[Tuple, str]): Event ID of the buffered version of each replaceable event.
+        channels (Dict[str, float]): Time each subscribed Redis channel was subscribed at.
+        evicted_at (float): Arrival time of the newest evicted event.
+
+    Methods:
+        subscribed: Records channels the listener subscribed to.
+        unsubscribed: Forgets channels the listener unsubscribed from.
+        reset: Empties the buffer after the Redis connection was lost.
+        add: Buffers an event received from Redis.
+        discard: Drops deleted events.
+        answer: Returns the NDJSON lines of a REQ if the buffer covers it.
+    """
+
+    def __init__(
+        self,
+        logger,
+        window: int = 300,
+        max_events: int = 50000,
+        skew: int = 60,
+        page_size: int = 100,
+        max_limit: int = 5000,
+    ) -> None:
+        self.logger = logger
+        self.window = window
+        self.max_events = max_events
+        self.skew = skew
+        self.page_size = page_size
+        self.max_limit = max_limit
+        self.events: "OrderedDict[str, Tuple[float, Dict[str, Any], bytes]]" = (
+            OrderedDict()
+        )
+        self.by_kind: Dict[int, Set[str]] = {}
+        self.by_author: Dict[str, Set[str]] = {}
+        self.replaceable: Dict[Tuple, str] = {}
+        self.channels: Dict[str, float] = {}
+        self.evicted_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def subscribed(self, channels) -> None:
+        now = time.time()
+        for channel in channels:
+            self.channels[channel] = now
+
+    def unsubscribed(self, channels) -> None:
+        for channel in channels:
+            self.channels.pop(channel, None)
+
+    def reset(self) -> None:
+        self.events.clear()
+        self.by_kind.clear()
+        self.by_author.clear()
+        self.replaceable.clear()
+        self.channels.clear()
+
+    @staticmethod
+    def _replaceable_key(event: Dict[str, Any]) -> Optional[Tuple]:
+        kind = event["kind"]
+        if kind in (0, 3) or 10000 <= kind < 20000:
+            return (kind, event["pubkey"])
+        if 30000 <= kind < 40000:
+            for tag in event["tags"]:
+                if tag and tag[0] == "d":
+                    return (kind, event["pubkey"], tag[1] if len(tag) > 1 else "")
+            return (kind, event["pubkey"], "")
+        return None
+
+    def add(self, event_data: Dict[str, Any]) -> None:
+        try:
+            event = {key: event_data[key] for key in EVENT_FIELDS}
+            if 20000 <= event["kind"] < 30000 or event["id"] in self.events:
+                # Ephemeral events are never stored, so REQs must not see them.
+                return
+            key = self._replaceable_key(event)
+            line = orjson.dumps(event)
+        except (KeyError, TypeError, orjson.JSONEncodeError) as exc:
+            self.logger.debug(f"Event not buffered: {exc}")
+            return
+        if key is not None:
+            replaced = self.replaceable.get(key)
+            if replaced is not None:
+                self._remove(replaced)
+            self.replaceable[key] = event["id"]
+        now = time.time()
+        self.events[event["id"]] = (now, event, line)
+        self.by_kind.setdefault(event["kind"], set()).add(event["id"])
+        self.by_author.setdefault(event["pubkey"], set()).add(event["id"])
+        self._evict(now)
+
+    def _remove(self, event_id: str) -> None:
+        entry = self.events.pop(event_id, None)
+        if entry is None:
+            return
+        _, event, _ = entry
+        for index, value in (
+            (self.by_kind, event["kind"]),
+            (self.by_author, event["pubkey"]),
+        ):
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del index[value]
+        key = self._replaceable_key(event)
+        if key is not None and self.replaceable.get(key) == event_id:
+            del self.replaceable[key]
+
+    def _evict(self, now: float) -> None:
+        while self.events:
+            event_id, (arrived_at, _, _) = next(iter(self.events.items()))
+            if arrived_at > now - self.window and len(self.events) <= self.max_events:
+                break
+            self._remove(event_id)
+            self.evicted_at = max(self.evicted_at, arrived_at)
+
+    def discard(self, event_ids) -> None:
+        for event_id in event_ids:
+            self._remove(event_id)
+
+    def covered_since(self, filter_: Dict[str, Any]) -> float:
+        """Returns the oldest since the buffer can answer a filter for."""
+        full = self.channels.get(REDIS_CHANNEL, math.inf)
+        subscribed_at = max(
+            min(self.channels.get(channel, math.inf), full)
+            for channel in filter_channels([filter_])
+        )
+        now = time.time()
+        return max(subscribed_at, self.evicted_at, now - self.window) + self.skew
+
+    def _candidates(self, filter_: Dict[str, Any]) -> List[str]:
+        if "ids" in filter_:
+            return [event_id for event_id in filter_["ids"] if event_id in self.events]
+        indexed = []
+        for key, index in (("kinds", self.by_kind), ("authors", self.by_author)):
+            values = filter_.get(key)
+            if values is not None:
+                ids = set()
+                for value in values:
+                    ids |= index.get(value, set())
+                indexed.append(ids)
+        if indexed:
+            return list(min(indexed, key=len))
+        return list(self.events)
+
+    def _limit(self, filter_: Dict[str, Any]) -> int:
+        limit = filter_.get("limit")
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0:
+            limit = self.page_size
+        return min(limit, self.max_limit)
+
+    @staticmethod
+    def _answerable(filter_: Dict[str, Any]) -> bool:
+        # Anything the event handler would reject, or can only answer with
+        # its full-text index, is sent to it.
+        if not isinstance(filter_, dict) or "search" in filter_:
+            return False
+        for key, value in filter_.items():
+            if key in ("since", "until", "limit"):
+                if not isinstance(value, int) or isinstance(value, bool):
+                    return False
+            elif key in ("ids", "authors", "kinds") or key.startswith("#"):
+                value_type = int if key == "kinds" else str
+                if not isinstance(value, list) or not all(
+                    isinstance(v, value_type) and not isinstance(v, bool) for v in value
+                ):
+                    return False
+        return "since" in filter_
+
+    def answer(self, filters: List[Dict[str, Any]]) -> Optional[List[bytes]]:
+        """
+        Returns the NDJSON lines answering a REQ, newest first, or None if a
+        filter needs events older than the buffer covers.
+        """
+        if not filters or not all(self._answerable(f) for f in filters):
+            self.misses += 1
+            return None
+        self._evict(time.time())
+        if any(f["since"] < self.covered_since(f) for f in filters):
+            self.misses += 1
+            return None
+
+        matched = {}
+        for filter_ in filters:
+            events = [
+                self.events[event_id][1]
+                for event_id in self._candidates(filter_)
+                if filter_matches_event(filter_, self.events[event_id][1])
+            ]
+            events.sort(key=lambda event: (-event["created_at"], event["id"]))
+            for event in events[: self._limit(filter_)]:
+                matched[event["id"]] = event
+        self.hits += 1
+        return [
+            self.events[event["id"]][2]
+            for event in sorted(
+                matched.values(), key=lambda event: (-event["created_at"], event["id"])
+            )
+        ]
@@ -1,8 +1,13 @@
 import asyncio
+import contextlib
 import logging
+import multiprocessing
+import multiprocessing.connection
 import orjson
 import os
-from typing import Any, Dict, Tuple
+import signal
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
 
 import aiohttp
 import redis.asyncio as redis
@@ -10,7 +15,29 @@ import websockets
 from aiohttp.client_exceptions import ClientConnectionError
 import websockets.exceptions
 
-from websocket_classes import ExtractedResponse, WebsocketMessages, SubscriptionMatcher
+from rpc_protocol import (
+    OP_COUNT,
+    OP_EVENT,
+    OP_REQ,
+    OP_REQ_STREAM,
+    RPCClient,
+    RPCRequestFailed,
+    RPCUnavailable,
+)
+from utils import (
+    EVENT_DELETIONS_CHANNEL,
+    NDJSON_MEDIA_TYPE,
+    REDIS_CHANNEL,
+    LimitedDict,
+    filter_channels,
+    ndjson_lines,
+)
+from websocket_classes import (
+    ExtractedResponse,
+    RecentEvents,
+    WebsocketMessages,
+    SubscriptionMatcher,
+)
 
 from opentelemetry import metrics, trace
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
@@ -33,8 +60,24 @@ AioHttpClientInstrumentor().instrument()
 OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
 EVENT_HANDLER_SVC = os.getenv("EVENT_HANDLER_SVC")
 EVENT_HANDLER_PORT = os.getenv("EVENT_HANDLER_PORT")
+NOSTPY_MODE = os.getenv("NOSTPY_MODE", "split")
+EVENT_HANDLER_TRANSPORT = os.getenv("EVENT_HANDLER_TRANSPORT", "http")
+EVENT_HANDLER_RPC_PORT = os.getenv("EVENT_HANDLER_RPC_PORT")
+EVENT_HANDLER_RPC_SOCKET = os.getenv("EVENT_HANDLER_RPC_SOCKET")
 REDIS_HOST = os.getenv("REDIS_HOST")
-REDIS_CHANNEL = "new_events_channel"
+WS_WORKERS = int(os.getenv("WS_WORKERS", "1")) or os.cpu_count() or 1
+WS_DRAIN_TIMEOUT = float(os.getenv("WS_DRAIN_TIMEOUT", "10"))
+SUBSCRIPTION_STREAMING = os.getenv("SUBSCRIPTION_STREAMING", "False") in [
+    "True",
+    "true",
+]
+READ_YOUR_WRITES_MS = float(os.getenv("READ_YOUR_WRITES_MS", "0"))
+RECENT_EVENTS_WINDOW = int(os.getenv("RECENT_EVENTS_WINDOW", "300"))
+RECENT_EVENTS_MAX = int(os.getenv("RECENT_EVENTS_MAX", "50000"))
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+MAX_QUERY_LIMIT = int(os.getenv("MAX_QUERY_LIMIT", "5000"))
+REDIS_POLL_INTERVAL = 0.1
+REDIS_RETRY_INTERVAL = 1
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -62,8 +105,28 @@ metrics.set_meter_provider(meter_provider)
 meter = metrics.get_meter("example-meter", version="1.0")
 
 redis_client = redis.from_url(f"redis://{REDIS_HOST}")
+rpc_client = None
+RPC_OPS = {"/new_event": OP_EVENT, "/subscription": OP_REQ, "/count": OP_COUNT}
+RPC_STREAM_OPS = {"/subscription": OP_REQ_STREAM}
+# Reads can be retried over HTTP after an RPC request was sent, writes cannot.
+RPC_RETRYABLE_PATHS = {"/subscription", "/count"}
+embedded_app = None
+embedded_handlers = {}
+embedded_stream_handlers = {}
 
 active_subscriptions = {}
+channels_dirty = True
+recent_events = (
+    RecentEvents(
+        logger,
+        window=RECENT_EVENTS_WINDOW,
+        max_events=RECENT_EVENTS_MAX,
+        page_size=QUERY_PAGE_SIZE,
+        max_limit=MAX_QUERY_LIMIT,
+    )
+    if RECENT_EVENTS_WINDOW > 0
+    else None
+)
 
 
 def active_websockets_subscriptions_callback(options: CallbackOptions):
@@ -84,10 +147,41 @@ active_websockets_subs_gauge = meter.create_observable_gauge(
 )
 
 
+def recent_events_callback(options: CallbackOptions):
+    """
+    Callback to return the REQs answered and passed on by the recent-events buffer.
+    """
+    if recent_events is None:
+        return []
+    return [
+        Observation(value=recent_events.hits, attributes={"result": "hit"}),
+        Observation(value=recent_events.misses, attributes={"result": "miss"}),
+    ]
+
+
+recent_events_counter = meter.create_observable_counter(
+    name="recent_events",
+    description="REQs answered from the recent-events buffer",
+    unit="count",
+    callbacks=[recent_events_callback],
+)
+
+
+def read_your_writes(last_write: float) -> Optional[float]:
+    """
+    Returns the time of the connection's last EVENT while it is within
+    READ_YOUR_WRITES_MS, so the event handler reads from a server that has it.
+    """
+    if READ_YOUR_WRITES_MS and time.time() - last_write < READ_YOUR_WRITES_MS / 1000:
+        return last_write
+    return None
+
+
 async def handle_websocket_connection(
     websocket: websockets.WebSocketServerProtocol,
 ) -> None:
     conn = aiohttp.TCPConnector(limit=500)
+    last_write = 0.0
     async with aiohttp.ClientSession(connector=conn) as session:
         try:
             async for message in websocket:
@@ -118,6 +212,7 @@ async def handle_websocket_connection(
                             event_dict=dict(ws_message.event_payload),
                             websocket=websocket,
                         )
+                    last_write = time.time()
                 elif ws_message.event_type == "REQ":
                     logger.debug(
                         f"Payload is {ws_message.event_payload} and of type: {type(ws_message.event_payload)}"
@@ -134,14 +229,25 @@ async def handle_websocket_connection(
                             event_dict=ws_message.event_payload,
                             subscription_id=ws_message.subscription_id,
                             websocket=websocket,
+                            written_at=read_your_writes(last_write),
                         )
                     active_subscriptions[ws_message.subscription_id] = {
                         "event": ws_message.event_payload,
                         "websocket": websocket,
                     }
+                    mark_channels_dirty()
                     logger.info(
                         f"Stored subscription: {ws_message.subscription_id} with event {ws_message.event_payload}"
                     )
+                elif ws_message.event_type == "COUNT":
+                    with tracer.start_as_current_span("send_count_to_handler"):
+                        await send_count_to_handler(
+                            session=session,
+                            event_dict=ws_message.event_payload,
+                            subscription_id=ws_message.subscription_id,
+                            websocket=websocket,
+                            written_at=read_your_writes(last_write),
+                        )
                 elif ws_message.event_type == "CLOSE":
                     response: Tuple[str, str] = (
                         "CLOSED",
@@ -150,6 +256,7 @@ async def handle_websocket_connection(
                     )
                     await websocket.send(orjson.dumps(response).decode("utf-8"))
                     del active_subscriptions[ws_message.subscription_id]
+                    mark_channels_dirty()
 
         except (
             websockets.exceptions.ConnectionClosedError,
@@ -163,24 +270,111 @@ async def handle_websocket_connection(
             )
 
 
+async def post_to_handler(
+    session: aiohttp.ClientSession, path: str, payload: Dict[str, Any]
+) -> Tuple[int, Any]:
+    """
+    Sends a payload to the event handler and returns (status, decoded body).
+
+    In embedded mode the event handler coroutines are awaited in this process.
+    Otherwise the persistent RPC connection is used when it is configured,
+    falling back to an HTTP POST whenever RPC is unavailable. A write whose
+    RPC connection failed after it was sent raises RPCRequestFailed rather
+    than being sent again, since the event handler may have stored it.
+    """
+    if embedded_app is not None:
+        response = await embedded_handlers[path](embedded_app, payload)
+        return response.status_code, orjson.loads(response.body)
+
+    body = orjson.dumps(payload)
+    if rpc_client is not None:
+        try:
+            status, response_body = await rpc_client.request(RPC_OPS[path], body)
+            return status, orjson.loads(response_body)
+        except RPCUnavailable as exc:
+            logger.debug(f"RPC unavailable, falling back to HTTP: {exc}")
+        except RPCRequestFailed as exc:
+            if path not in RPC_RETRYABLE_PATHS:
+                raise
+            logger.debug(f"RPC request failed, retrying over HTTP: {exc}")
+
+    url: str = f"http://{EVENT_HANDLER_SVC}:{EVENT_HANDLER_PORT}{path}"
+    async with session.post(url, data=body) as response:
+        return response.status, await response.json(loads=orjson.loads)
+
+
+async def stream_from_handler(
+    session: aiohttp.ClientSession, path: str, payload: Dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """
+    Streams a response from the event handler as NDJSON lines.
+
+    Uses the same transport as post_to_handler. The RPC connection falls back
+    to HTTP only if it fails before the first line; an event handler without
+    streaming support answers with a JSON body whose results are re-encoded.
+    """
+    if embedded_app is not None:
+        _, chunks = await embedded_stream_handlers[path](embedded_app, payload)
+        async with contextlib.aclosing(chunks):
+            async for line in ndjson_lines(chunks):
+                yield line
+        return
+
+    body = orjson.dumps(payload)
+    if rpc_client is not None:
+        streamed = False
+        try:
+            async for line in ndjson_lines(
+                rpc_client.request_stream(RPC_STREAM_OPS[path], body)
+            ):
+                streamed = True
+                yield line
+            return
+        except (RPCUnavailable, RPCRequestFailed) as exc:
+            if streamed:
+                raise
+            logger.debug(f"RPC unavailable, falling back to HTTP: {exc}")
+
+    url: str = f"http://{EVENT_HANDLER_SVC}:{EVENT_HANDLER_PORT}{path}"
+    async with session.post(
+        url, data=body, headers={"Accept": NDJSON_MEDIA_TYPE}
+    ) as response:
+        if response.status != 200:
+            return
+        if response.content_type != NDJSON_MEDIA_TYPE:
+            response_data = await response.json(loads=orjson.loads)
+            for event in response_data.get("results_json") or []:
+                yield orjson.dumps(event)
+            return
+        async for line in ndjson_lines(response.content.iter_any()):
+            yield line
+
+
 async def send_event_to_handler(
     session: aiohttp.ClientSession,
     event_dict: Dict[str, Any],
     websocket: websockets.WebSocketServerProtocol,
 ) -> None:
-    url: str = f"http://{EVENT_HANDLER_SVC}:{EVENT_HANDLER_PORT}/new_event"
     try:
-        async with session.post(url, data=orjson.dumps(event_dict)) as response:
-            current_span = trace.get_current_span()
-            current_span.set_attribute("operation.name", "post.event.handler")
-            response_data: Dict[str, Any] = await response.json(loads=orjson.loads)
-            logger.debug(
-                f"Received response from Event Handler {response_data}, data types is {type(response_data)}"
-            )
-            response_object = ExtractedResponse(response_data, logger)
-            if response.status:
-                formatted_response = await response_object.format_response()
-                await websocket.send(orjson.dumps(formatted_response).decode())
+        current_span = trace.get_current_span()
+        current_span.set_attribute("operation.name", "post.event.handler")
+        status, response_data = await post_to_handler(session, "/new_event", event_dict)
+        logger.debug(
+            f"Received response from Event Handler {response_data}, data types is {type(response_data)}"
+        )
+        response_object = ExtractedResponse(response_data, logger)
+        if status:
+            formatted_response = await response_object.format_response()
+            await websocket.send(orjson.dumps(formatted_response).decode())
+    except RPCRequestFailed as exc:
+        logger.error(f"Event {event_dict.get('id')} may not have been stored: {exc}")
+        response = (
+            "OK",
+            event_dict.get("id"),
+            False,
+            "error: could not confirm the event was stored, try again",
+        )
+        await websocket.send(orjson.dumps(response).decode())
     except Exception as e:
         logger.error(f"An error occurred while sending the event to the handler: {e}")
 
@@ -190,68 +384,202 @@ async def send_subscription_to_handler(
     event_dict: Dict,
     subscription_id: str,
     websocket: websockets.WebSocketServerProtocol,
+    written_at: Optional[float] = None,
 ) -> None:
-    url: str = f"http://{EVENT_HANDLER_SVC}:{EVENT_HANDLER_PORT}/subscription"
-
     payload: Dict[str, Any] = {
         "event_dict": event_dict,
         "subscription_id": subscription_id,
     }
+    if written_at is not None:
+        payload["written_at"] = written_at
     logger.debug(f"send payload is {payload}")
 
-    async with session.post(url, data=orjson.dumps(payload)) as response:
-        current_span = trace.get_current_span()
-        current_span.set_attribute("operation.name", "post.event.subscription")
-        response_data = await response.json(loads=orjson.loads)
-        logger.debug(
-            f"Data type of response_data: {type(response_data)}, Response Data: {response_data}"
-        )
-        if not response_data:
-            logger.debug("Response data none, returning")
+    # Fresh REQs are answered from the events this process already received,
+    # unless the client must read its own writes from the database.
+    if recent_events is not None and written_at is None:
+        lines = recent_events.answer(event_dict)
+        if lines is not None:
+            prefix = b'["EVENT",' + orjson.dumps(subscription_id) + b","
+            for line in lines:
+                await websocket.send((prefix + line + b"]").decode("utf-8"))
             await websocket.send(
                 orjson.dumps(("EOSE", subscription_id)).decode("utf-8")
             )
             return
-        response_object = ExtractedResponse(response_data, logger)
-        EOSE = ("EOSE", response_object.subscription_id)
 
-        if response.status == 200 and response_object.event_type == "EVENT":
-            with tracer.start_as_current_span("send event loop") as span:
-                current_span = trace.get_current_span()
-                current_span.set_attribute("operation.name", "send.event.loop")
+    current_span = trace.get_current_span()
+    current_span.set_attribute("operation.name", "post.event.subscription")
+    if SUBSCRIPTION_STREAMING:
+        await stream_subscription_to_client(session, payload, websocket)
+        return
+    status, response_data = await post_to_handler(session, "/subscription", payload)
+    logger.debug(
+        f"Data type of response_data: {type(response_data)}, Response Data: {response_data}"
+    )
+    if not response_data:
+        logger.debug("Response data none, returning")
+        await websocket.send(orjson.dumps(("EOSE", subscription_id)).decode("utf-8"))
+        return
+    response_object = ExtractedResponse(response_data, logger)
+    EOSE = ("EOSE", response_object.subscription_id)
+
+    if status == 200 and response_object.event_type == "EVENT":
+        with tracer.start_as_current_span("send event loop") as span:
+            current_span = trace.get_current_span()
+            current_span.set_attribute("operation.name", "send.event.loop")
 
-                await response_object.send_event_loop(
-                    response_object.results, websocket, logger
-                )
-                await websocket.send(orjson.dumps(EOSE).decode("utf-8"))
-        else:
+            await response_object.send_event_loop(
+                response_object.results, websocket, logger
+            )
             await websocket.send(orjson.dumps(EOSE).decode("utf-8"))
-            logger.debug(f"Response data is {response_data} but it failed")
+    else:
+        await websocket.send(orjson.dumps(EOSE).decode("utf-8"))
+        logger.debug(f"Response data is {response_data} but it failed")
 
 
-async def redis_listener():
-    """Listens for Redis pub/sub messages and rebroadcasts to active WebSocket clients."""
+async def send_count_to_handler(
+    session: aiohttp.ClientSession,
+    event_dict: Dict,
+    subscription_id: str,
+    websocket: websockets.WebSocketServerProtocol,
+    written_at: Optional[float] = None,
+) -> None:
+    """Answers a NIP-45 COUNT with the event handler's count, or CLOSED on failure."""
+    payload: Dict[str, Any] = {
+        "event_dict": event_dict,
+        "subscription_id": subscription_id,
+    }
+    if written_at is not None:
+        payload["written_at"] = written_at
     try:
-        async with redis_client.pubsub() as pubsub:
-            await pubsub.subscribe(REDIS_CHANNEL)
-            logger.info(f"Subscribed to Redis channel: {REDIS_CHANNEL}")
+        status, response_data = await post_to_handler(session, "/count", payload)
+    except (aiohttp.ClientError, RPCUnavailable) as exc:
+        logger.error(f"COUNT {subscription_id} failed: {exc}")
+        status, response_data = 500, None
+    if status == 200 and response_data and response_data["event"] == "COUNT":
+        response = ("COUNT", subscription_id, response_data["results_json"])
+    else:
+        response = ("CLOSED", subscription_id, "error: could not count events")
+    await websocket.send(orjson.dumps(response).decode("utf-8"))
+
+
+async def stream_subscription_to_client(
+    session: aiohttp.ClientSession,
+    payload: Dict[str, Any],
+    websocket: websockets.WebSocketServerProtocol,
+) -> None:
+    """
+    Forwards each stored event to the client as the event handler streams it,
+    followed by EOSE.
 
-            while True:
-                message = await pubsub.get_message(
-                    ignore_subscribe_messages=True, timeout=1.0
-                )
-                if message:
-                    logger.debug(f"Received message from Redis: {message}")
-                    if message["type"] == "message":
-                        try:
-                            event_data = orjson.loads(message["data"])
-                            logger.debug(f"Decoded event data: {event_data}")
+    The EVENT message is assembled around the raw event JSON, so events are
+    never decoded in this process.
+    """
+    subscription_id = payload["subscription_id"]
+    prefix = b'["EVENT",' + orjson.dumps(subscription_id) + b","
+    with tracer.start_as_current_span("send event loop") as span:
+        span.set_attribute("operation.name", "send.event.stream")
+        try:
+            async for line in stream_from_handler(session, "/subscription", payload):
+                await websocket.send((prefix + line + b"]").decode("utf-8"))
+        except (aiohttp.ClientError, RPCUnavailable, RPCRequestFailed) as exc:
+            logger.error(f"Subscription stream for {subscription_id} failed: {exc}")
+    await websocket.send(orjson.dumps(("EOSE", subscription_id)).decode("utf-8"))
+
+
+def mark_channels_dirty() -> None:
+    """Flags the Redis listener to recompute its channels after a REQ or CLOSE."""
+    global channels_dirty
+    channels_dirty = True
+
+
+def desired_channels() -> Set[str]:
+    """
+    Returns the Redis channels needed by this process's active subscriptions,
+    and the deletions channel while the recent-events buffer is enabled.
+    """
+    channels = set()
+    for data in list(active_subscriptions.values()):
+        channels |= filter_channels(data["event"])
+        if REDIS_CHANNEL in channels:
+            channels = {REDIS_CHANNEL}
+            break
+    if recent_events is not None:
+        channels.add(EVENT_DELETIONS_CHANNEL)
+    return channels
+
+
+async def redis_listener():
+    """
+    Listens for Redis pub/sub messages and rebroadcasts to active WebSocket clients.
+
+    Only the kind and author partitions the active subscriptions can match are
+    subscribed, falling back to the full channel when a filter is not covered
+    by partitions. An event published on several subscribed partitions is
+    broadcast once. Received events are also kept in the recent-events buffer.
+    When the connection fails, the listener reconnects after
+    REDIS_RETRY_INTERVAL seconds and subscribes to its channels again.
+    """
+    global channels_dirty
+    recent_event_ids = LimitedDict(max_size=10000)
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                subscribed = set()
+                channels_dirty = True
+                while True:
+                    if channels_dirty:
+                        channels_dirty = False
+                        desired = desired_channels()
+                        added, removed = desired - subscribed, subscribed - desired
+                        if added:
+                            await pubsub.subscribe(*added)
+                        if removed:
+                            await pubsub.unsubscribe(*removed)
+                        if recent_events is not None:
+                            recent_events.unsubscribed(removed)
+                            recent_events.subscribed(added)
+                        if added or removed:
+                            logger.info(
+                                f"Redis channels updated, subscribed to {len(desired)}"
+                            )
+                        subscribed = desired
+
+                    if not subscribed:
+                        await asyncio.sleep(REDIS_POLL_INTERVAL)
+                        continue
+
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=REDIS_POLL_INTERVAL
+                    )
+                    if message:
+                        logger.debug(f"Received message from Redis: {message}")
+                        if message["type"] == "message":
+                            try:
+                                event_data = orjson.loads(message["data"])
+                                logger.debug(f"Decoded event data: {event_data}")
+                            except orjson.JSONDecodeError as e:
+                                logger.error(f"Invalid JSON in Redis message: {e}")
+                                continue
+                            if message["channel"] == EVENT_DELETIONS_CHANNEL.encode():
+                                if recent_events is not None:
+                                    recent_events.discard(event_data)
+                                continue
+                            event_id = event_data.get("id")
+                            if event_id in recent_event_ids:
+                                continue
+                            recent_event_ids[event_id] = True
+                            if recent_events is not None:
+                                recent_events.add(event_data)
                             asyncio.create_task(broadcast_event_to_clients(event_data))
-                        except orjson.JSONDecodeError as e:
-                            logger.error(f"Invalid JSON in Redis message: {e}")
-                await asyncio.sleep(0.1)
-    except Exception as e:
-        logger.error(f"Error in Redis listener: {e}", exc_info=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in Redis listener: {e}", exc_info=True)
+            if recent_events is not None:
+                # Events may have been missed while disconnected.
+                recent_events.reset()
+            await asyncio.sleep(REDIS_RETRY_INTERVAL)
 
 
 async def broadcast_event_to_clients(event_data: Dict[str, Any]) -> None:
@@ -269,6 +597,7 @@ async def broadcast_event_to_clients(event_data: Dict[str, Any]) -> None:
         except Exception as e:
             logger.error(f"Error broadcasting to subscription {subscription_id}: {e}")
             del active_subscriptions[subscription_id]
+            mark_channels_dirty()
 
     # Process all subscriptions concurrently
     await asyncio.gather(
@@ -288,31 +617,162 @@ async def remove_inactive_websockets():
                 if websocket.closed:
                     logger.info(f"Removing inactive WebSocket: {subscription_id}")
                     del active_subscriptions[subscription_id]
+                    mark_channels_dirty()
             except Exception as e:
                 logger.error(f"Error checking WebSocket {subscription_id}: {e}")
                 del active_subscriptions[subscription_id]
+                mark_channels_dirty()
         await asyncio.sleep(10)
 
 
 async def main():
     """Starts the WebSocket server and Redis listener."""
+    global rpc_client, embedded_app
+    stack = contextlib.AsyncExitStack()
+    if NOSTPY_MODE == "embedded":
+        # Run the event handler inside this process: its lifespan opens the
+        # pools, Redis client and background tasks, and REQ/EVENT messages are
+        # served by awaiting its coroutines directly.
+        import event_handler
+
+        event_handler.initialize_db(
+            logger=event_handler.logger,
+            write_str=event_handler.init_conn_str,
+        )
+        await stack.enter_async_context(event_handler.lifespan(event_handler.app))
+        embedded_handlers["/new_event"] = event_handler.process_new_event
+        embedded_handlers["/subscription"] = event_handler.process_subscription
+        embedded_handlers["/count"] = event_handler.process_count
+        embedded_stream_handlers["/subscription"] = (
+            event_handler.process_subscription_stream
+        )
+        embedded_app = event_handler.app
+        logger.info("Running in embedded mode with an in-process event handler")
+    elif EVENT_HANDLER_TRANSPORT == "rpc":
+        rpc_client = RPCClient(
+            logger,
+            host=EVENT_HANDLER_SVC,
+            port=int(EVENT_HANDLER_RPC_PORT or 0),
+            path=EVENT_HANDLER_RPC_SOCKET,
+        )
+        try:
+            await rpc_client.connect()
+        except RPCUnavailable as exc:
+            logger.warning(f"Event handler RPC not reachable yet, using HTTP: {exc}")
+
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
+
     websocket_port = int(os.getenv("WS_PORT", 8000))
-    websocket_server = websockets.serve(
-        handle_websocket_connection, "0.0.0.0", websocket_port
-    )
     logger.info(f"WebSocket server starting on port {websocket_port}")
 
     # Create tasks for both the WebSocket server and Redis listener
-    asyncio.create_task(redis_listener())
-    asyncio.create_task(remove_inactive_websockets())
-    await websocket_server
-
-    # Prevent the program from exiting
-    await asyncio.Future()
-
-
-if __name__ == "__main__":
+    background_tasks = [
+        asyncio.create_task(redis_listener()),
+        asyncio.create_task(remove_inactive_websockets()),
+    ]
+    async with stack:
+        # With several workers every process binds the same port and the
+        # kernel spreads new connections across them.
+        async with websockets.serve(
+            handle_websocket_connection,
+            "0.0.0.0",
+            websocket_port,
+            reuse_port=WS_WORKERS > 1,
+            close_timeout=WS_DRAIN_TIMEOUT,
+        ):
+            await stop
+            # Leaving the block stops accepting connections and closes the open
+            # ones with 1001 (going away) so clients reconnect to another worker.
+            logger.info("Shutting down, draining websocket connections")
+
+        for task in background_tasks:
+            task.cancel()
+        if rpc_client is not None:
+            await rpc_client.close()
+
+
+def run_worker(worker_id: int) -> None:
+    """Entry point of a websocket worker process."""
+    logger.info(f"Websocket worker {worker_id} started with pid {os.getpid()}")
     try:
         asyncio.run(main())
     except Exception as e:
         logger.error(f"Error occurred while starting the server main loop: {e}")
+
+
+def supervise(workers: int) -> None:
+    """
+    Runs `workers` websocket worker processes sharing WS_PORT via SO_REUSEPORT.
+
+    Each worker keeps its own subscriptions and Redis listener. Workers that
+    exit unexpectedly are restarted; SIGTERM/SIGINT is forwarded to every
+    worker, which drains its connections before exiting, and workers still
+    running WS_DRAIN_TIMEOUT seconds later are killed.
+    """
+    # Workers are spawned rather than forked so the gRPC exporters and Redis
+    # connections created at import time are never shared with the parent.
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    stopping = False
+
+    def start_worker(worker_id: int) -> None:
+        process = context.Process(
+            target=run_worker, args=(worker_id,), name=f"ws-worker-{worker_id}"
+        )
+        process.start()
+        processes[worker_id] = process
+
+    def shutdown(signum, _frame) -> None:
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info(f"Supervisor received signal {signum}, stopping workers")
+        for process in processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for worker_id in range(workers):
+        start_worker(worker_id)
+    logger.info(f"Supervisor started {workers} websocket workers")
+
+    kill_deadline = None
+    while processes:
+        sentinels = {
+            process.sentinel: worker_id for worker_id, process in processes.items()
+        }
+        for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=1):
+            worker_id = sentinels[sentinel]
+            process = processes.pop(worker_id)
+            process.join()
+            if not stopping:
+                logger.error(
+                    f"Websocket worker {worker_id} exited with code {process.exitcode}, restarting"
+                )
+                time.sleep(1)
+                start_worker(worker_id)
+
+        if stopping:
+            if kill_deadline is None:
+                kill_deadline = time.monotonic() + WS_DRAIN_TIMEOUT + 5
+            elif time.monotonic() > kill_deadline:
+                for worker_id, process in processes.items():
+                    logger.warning(
+                        f"Killing websocket worker {worker_id} after drain timeout"
+                    )
+                    process.kill()
+                kill_deadline = float("inf")
+    logger.info("All websocket workers stopped")
+
+
+if __name__ == "__main__":
+    if WS_WORKERS > 1:
+        supervise(WS_WORKERS)
+    else:
+        run_worker(0)
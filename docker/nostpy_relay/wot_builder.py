@@ -8,9 +8,13 @@ import time
 from collections import defaultdict
 
 from dotenv import load_dotenv
+import redis.asyncio as redis
 import websockets
 from asyncpg import create_pool
 
+# Read by the event handler's in-memory trust set, see admission_cache.py
+TRUST_NETWORK_VERSION_KEY = "trust_network_version"
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,9 +25,18 @@ logger = logging.getLogger(__name__)
 
 
 class NostrFollowFetcher:
-    def __init__(self, pubkey, db_conn_str, seed_relays, min_followers=1, sleep_time=5):
+    def __init__(
+        self,
+        pubkey,
+        db_conn_str,
+        seed_relays,
+        min_followers=1,
+        sleep_time=5,
+        redis_url=None,
+    ):
         self.pubkey = pubkey
         self.db_conn_str = db_conn_str
+        self.redis_url = redis_url
         self.min_followers = min_followers
         self.seed_relays = seed_relays
         self.pubkey_follower_count = defaultdict(int)
@@ -185,6 +198,18 @@ class NostrFollowFetcher:
                     pubkey,
                 )
 
+    async def notify_trust_network_update(self):
+        """Bumps the version counter so event handlers reload the trust network."""
+        if not self.redis_url:
+            return
+        try:
+            redis_client = redis.from_url(self.redis_url)
+            version = await redis_client.incr(TRUST_NETWORK_VERSION_KEY)
+            await redis_client.close()
+            logger.info(f"Trust network version bumped to {version}")
+        except Exception as e:
+            logger.error(f"Failed to notify event handlers of trust network update: {e}")
+
     async def run(self):
         await self.init_db()
 
@@ -198,6 +223,7 @@ class NostrFollowFetcher:
 
         common_follows = await self.get_common_followers()
         await self.add_to_trust_network(common_follows)
+        await self.notify_trust_network_update()
 
 
 if __name__ == "__main__":
@@ -211,8 +237,14 @@ if __name__ == "__main__":
     load_dotenv(dotenv_path)
     db_conn_str = os.getenv("DB_CONN_STRING")
     pubkey = os.getenv("ADMIN_PUBKEY")
+    redis_url = os.getenv(
+        "WOT_REDIS_URL", f"redis://127.0.0.1:{os.getenv('REDIS_PORT', '6379')}"
+    )
 
     fetcher = NostrFollowFetcher(
-        pubkey=pubkey, db_conn_str=db_conn_str, seed_relays=seed_relays
+        pubkey=pubkey,
+        db_conn_str=db_conn_str,
+        seed_relays=seed_relays,
+        redis_url=redis_url,
     )
     asyncio.run(fetcher.run())